@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+import numpy as np
+import scipy.io as sio
+import scipy.sparse as sparse
+from beautifultable import BeautifulTable
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+from reader import MatrixMarketReader, RbReader
+from writer import RbWriter
+
+
+def measure(read, mtx_path, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        mtx = read(mtx_path)
+        best = min(best, time.perf_counter() - start)
+        del mtx
+    tracemalloc.start()
+    mtx = read(mtx_path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, sparse.coo_matrix(mtx)
+
+
+def final_bytes(mtx):
+    return mtx.row.nbytes + mtx.col.nbytes + mtx.data.nbytes
+
+
+def generate(mtx_path, rows, nnz, seed):
+    rng = np.random.default_rng(seed)
+    mtx = sparse.coo_matrix(
+        (rng.random(nnz), (rng.integers(0, rows, nnz), rng.integers(0, rows, nnz))),
+        shape=(rows, rows),
+    )
+    sio.mmwrite(mtx_path, mtx)
+
+
+class BenchReaderProgram:
+    def run(self, parser):
+        parser.add_argument("--file", help="matrix market file", type=str)
+        parser.add_argument(
+            "--rows", help="rows of generated matrix", type=int, default=200000
+        )
+        parser.add_argument(
+            "--nnz", help="nnz of generated matrix", type=int, default=2000000
+        )
+        parser.add_argument("--repeat", help="timed repetitions", type=int, default=3)
+        parser.add_argument(
+            "--chunk-size", help="reader chunk bytes", type=int, default=None
+        )
+        parser.add_argument(
+            "--workers", help="also time the parallel reader", type=int, default=1
+        )
+        parser.add_argument(
+            "--rb",
+            help="also time RbReader on the same matrix written as rutherford-boeing",
+            action="store_true",
+        )
+        parser.add_argument(
+            "--rb-file", help="rutherford-boeing copy of --file", type=str
+        )
+        args = parser.parse_args()
+        with tempfile.TemporaryDirectory() as tmp:
+            mtx_path = args.file
+            if mtx_path is None:
+                mtx_path = os.path.join(tmp, "bench.mtx")
+                generate(mtx_path, args.rows, args.nnz, 0)
+            reader = MatrixMarketReader()
+            if args.chunk_size is not None:
+                reader.chunk_size = args.chunk_size
+            readers = {
+                "mmread": (sio.mmread, mtx_path),
+                "MatrixMarketReader": (reader.read, mtx_path),
+            }
+            if args.workers > 1:
+                parallel = MatrixMarketReader(reader.chunk_size, args.workers)
+                readers["workers={}".format(args.workers)] = (parallel.read, mtx_path)
+            rb_path = args.rb_file
+            if rb_path is None and args.rb:
+                rb_path = os.path.join(tmp, "bench.rb")
+                RbWriter().write(rb_path, sio.mmread(mtx_path))
+            if rb_path is not None:
+                readers["RbReader"] = (RbReader().read, rb_path)
+            self.__report(mtx_path, readers, args.repeat)
+
+    def __report(self, mtx_path, readers, repeat):
+        size = os.path.getsize(mtx_path)
+        results = {}
+        for name, (read, path) in readers.items():
+            results[name] = measure(read, path, repeat) + (os.path.getsize(path),)
+        expect = results["mmread"][2].tocsr()
+        warnings.filterwarnings("ignore")
+        table = BeautifulTable()
+        table.column_headers = [
+            "reader",
+            "seconds",
+            "MB/s",
+            "Mnnz/s",
+            "peak MB",
+            "peak/final",
+            "same",
+        ]
+        # file sizes differ between formats, entries per second compare them
+        for name, (seconds, peak, mtx, file_size) in results.items():
+            same = (mtx.tocsr() != expect).nnz == 0
+            table.append_row(
+                [
+                    name,
+                    "{:.3f}".format(seconds),
+                    "{:.1f}".format(file_size / seconds / 1e6),
+                    "{:.2f}".format(mtx.nnz / seconds / 1e6),
+                    "{:.1f}".format(peak / 1e6),
+                    "{:.2f}".format(peak / final_bytes(mtx)),
+                    same,
+                ]
+            )
+        warnings.resetwarnings()
+        print("{} ({:.1f} MB)".format(mtx_path, size / 1e6))
+        print(table)
+        if any(name.startswith("workers=") for name in results):
+            print("parallel reader arrays live in shared mappings, not in traced peak")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    BenchReaderProgram().run(parser)
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import warnings
+import numpy as np
+import scipy
+import scipy.sparse as sparse
+from beautifultable import BeautifulTable
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+from cache import MatrixCache, CachedReader
+from binary import is_binary_matrix
+from meta_info import batch_files
+from reader import MatrixMarketReader, MatlabReader, RbReader, BinaryReader
+from spmv import LAYOUTS, bench_layout
+
+
+def generate(rows, nnz, seed):
+    rng = np.random.default_rng(seed)
+    return sparse.coo_matrix(
+        (rng.random(nnz), (rng.integers(0, rows, nnz), rng.integers(0, rows, nnz))),
+        shape=(rows, rows),
+    )
+
+
+class BenchSpmvProgram:
+    def __init__(self) -> None:
+        self.__reader_factory = {
+            "mm": MatrixMarketReader,
+            "mat": MatlabReader,
+            "rb": RbReader,
+            "bin": BinaryReader,
+        }
+
+    def run(self, parser):
+        parser.add_argument(
+            "--format",
+            help="sparse matrix format",
+            type=str,
+            default="mm",
+            choices=self.__reader_factory.keys(),
+        )
+        inputs = parser.add_mutually_exclusive_group()
+        inputs.add_argument("--file", help="sparse matrix file", type=str)
+        inputs.add_argument(
+            "--dir", help="benchmark every matrix of --format below it", type=str
+        )
+        parser.add_argument(
+            "--rows", help="rows of generated matrix", type=int, default=200000
+        )
+        parser.add_argument(
+            "--nnz", help="nnz of generated matrix", type=int, default=2000000
+        )
+        parser.add_argument(
+            "--layouts",
+            help="layouts to compare",
+            type=str,
+            nargs="+",
+            default=list(LAYOUTS.keys()),
+            choices=list(LAYOUTS.keys()),
+        )
+        parser.add_argument(
+            "--spmm",
+            help="right-hand sides of the spmm runs",
+            type=int,
+            nargs="*",
+            default=[8],
+        )
+        parser.add_argument("--warmup", help="untimed runs", type=int, default=2)
+        parser.add_argument("--repeat", help="timed runs", type=int, default=10)
+        parser.add_argument(
+            "--no-cache", help="skip the binary parse cache", action="store_true"
+        )
+        parser.add_argument("--output", help="machine readable result file", type=str)
+        parser.add_argument(
+            "--output-format",
+            help="result file format",
+            type=str,
+            default="jsonl",
+            choices=["jsonl", "csv"],
+        )
+        args = parser.parse_args()
+        if args.warmup < 0 or args.repeat < 1 or any(k < 1 for k in args.spmm):
+            raise Exception("warmup, repeat and spmm sizes must be positive")
+        kernels = ["spmv"] + ["spmm:{}".format(k) for k in args.spmm]
+        if args.dir is not None:
+            files = batch_files(args.format, [args.dir])
+        elif args.file is not None:
+            files = [args.file]
+        else:
+            files = [None]
+        records = []
+        for mtx_file in files:
+            try:
+                coo = self.__load(args, mtx_file)
+            except Exception as error:
+                warnings.warn(
+                    "skip illegal matrix, matrix file: {}, {}".format(mtx_file, error),
+                    RuntimeWarning,
+                )
+                continue
+            matrix = []
+            for layout in args.layouts:
+                try:
+                    matrix += bench_layout(
+                        coo, layout, kernels, args.warmup, args.repeat
+                    )
+                except Exception as error:
+                    # e.g. dia refuses matrices with too many scattered diagonals
+                    warnings.warn(
+                        "skip layout {}, {}".format(layout, error), RuntimeWarning
+                    )
+            for record in matrix:
+                record["matrix"] = mtx_file or "generated"
+            records += matrix
+            self.__print(mtx_file or "generated", matrix)
+        if args.output is not None:
+            self.__save(args.output, args.output_format, records)
+
+    def __load(self, args, mtx_file):
+        if mtx_file is None:
+            return generate(args.rows, args.nnz, 0)
+        reader = self.__reader_factory[args.format]()
+        if not args.no_cache and not is_binary_matrix(mtx_file):
+            reader = CachedReader(reader, MatrixCache())
+        coo = sparse.coo_matrix(reader.read(mtx_file))
+        # duplicates would count as extra work in every layout but csr/csc
+        coo.sum_duplicates()
+        return coo
+
+    def __print(self, name, records):
+        warnings.filterwarnings("ignore")
+        table = BeautifulTable(maxwidth=160)
+        table.column_headers = [
+            "layout",
+            "kernel",
+            "backend",
+            "convert s",
+            "median ms",
+            "GFLOP/s",
+            "GB/s",
+            "MB",
+        ]
+        for record in records:
+            table.append_row(
+                [
+                    record["layout"],
+                    record["kernel"],
+                    record["backend"],
+                    "{:.4f}".format(record["convert_seconds"]),
+                    "{:.3f}".format(record["median_seconds"] * 1e3),
+                    "{:.3f}".format(record["gflops"]),
+                    "{:.2f}".format(record["bandwidth_gbs"]),
+                    "{:.1f}".format(record["layout_bytes"] / 1e6),
+                ]
+            )
+        warnings.resetwarnings()
+        print(name)
+        print(table)
+
+    def __save(self, output, output_format, records):
+        # the versions go with every record so runs on other setups stay comparable
+        stamp = {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "numpy": np.__version__,
+            "scipy": scipy.__version__,
+        }
+        records = [dict(record, **stamp) for record in records]
+        with open(output, "w", newline="") as stream:
+            if output_format == "csv":
+                if len(records) > 0:
+                    writer = csv.DictWriter(stream, list(records[0].keys()))
+                    writer.writeheader()
+                    writer.writerows(records)
+            else:
+                for record in records:
+                    stream.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    BenchSpmvProgram().run(parser)
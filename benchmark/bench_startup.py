@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import warnings
+from beautifultable import BeautifulTable
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC_DIR)
+from smt import COMMANDS
+
+# modules a subcommand must never load, each one costs a noticeable part of a second
+# or belongs to another subcommand
+HEAVY = ["matplotlib", "prompt_toolkit", "ssgetpy", "h5py", "scipy.io", "numpy"]
+ALLOWED = {
+    "plot": ["numpy", "matplotlib"],
+    "read": ["numpy", "prompt_toolkit"],
+    "download": ["prompt_toolkit"],
+    "catalog": [],
+}
+# the download side of the tree, matrix commands do not import it
+DOWNLOAD_MODULES = ["catalog", "downloader", "pipeline", "download"]
+
+
+def loaded_modules(command):
+    # a fresh interpreter imports the subcommand the way smt does and lists what came in
+    module = COMMANDS[command][0]
+    script = (
+        "import importlib, json, sys; sys.path.insert(0, {!r}); "
+        "importlib.import_module({!r}); print(json.dumps(sorted(sys.modules)))"
+    ).format(SRC_DIR, module)
+    output = subprocess.run(
+        [sys.executable, "-c", script], capture_output=True, text=True, check=True
+    ).stdout
+    return set(json.loads(output.splitlines()[-1]))
+
+
+def startup_seconds(command, repeat):
+    # smt <command> --help imports the subcommand, builds its parser and exits
+    argv = ["--help"] if command is None else [command, "--help"]
+    best = float("inf")
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        subprocess.run(
+            [sys.executable, os.path.join(SRC_DIR, "smt.py")] + argv,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        best = min(best, time.perf_counter() - begin)
+    return best
+
+
+def violations(command, modules, seconds, budget):
+    found = []
+    for name in HEAVY:
+        # matrix commands need numpy and nothing else from the list
+        if name in modules and name not in ALLOWED.get(command, ["numpy"]):
+            found.append("loads {}".format(name))
+    if COMMANDS[command][0] not in DOWNLOAD_MODULES:
+        found += [
+            "loads {}".format(name) for name in DOWNLOAD_MODULES if name in modules
+        ]
+    if budget is not None and seconds > budget:
+        found.append("over {:.3f}s".format(budget))
+    return found
+
+
+class BenchStartupProgram:
+    def run(self, parser):
+        parser.add_argument(
+            "--commands",
+            help="subcommands to time, all by default",
+            type=str,
+            nargs="+",
+            default=list(COMMANDS.keys()),
+            choices=COMMANDS.keys(),
+        )
+        parser.add_argument("--repeat", help="timed launches", type=int, default=5)
+        parser.add_argument(
+            "--budget", help="fail when a startup takes longer (seconds)", type=float
+        )
+        args = parser.parse_args()
+        baseline = startup_seconds(None, args.repeat)
+        failed = False
+        warnings.filterwarnings("ignore")
+        table = BeautifulTable(maxwidth=160)
+        table.column_headers = ["command", "seconds", "heavy imports", "status"]
+        for command in args.commands:
+            modules = loaded_modules(command)
+            seconds = startup_seconds(command, args.repeat)
+            found = violations(command, modules, seconds, args.budget)
+            failed |= len(found) > 0
+            table.append_row(
+                [
+                    command,
+                    "{:.3f}".format(seconds),
+                    " ".join(name for name in HEAVY if name in modules) or "-",
+                    ", ".join(found) or "ok",
+                ]
+            )
+        warnings.resetwarnings()
+        print("smt without a subcommand: {:.3f}s".format(baseline))
+        print(table)
+        if failed:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    BenchStartupProgram().run(parser)
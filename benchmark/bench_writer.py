@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import sys
+import tempfile
+import time
+import warnings
+import numpy as np
+import scipy.io as sio
+import scipy.sparse as sparse
+from beautifultable import BeautifulTable
+
+sys.path.insert(
+    0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+)
+from reader import MatrixMarketReader
+from writer import MatrixMarketWriter
+
+
+def generate(rows, nnz, field, symmetric, seed):
+    rng = np.random.default_rng(seed)
+    row = rng.integers(0, rows, nnz)
+    col = rng.integers(0, rows, nnz)
+    if field == "integer":
+        data = rng.integers(-1000, 1000, nnz)
+    elif field == "complex":
+        data = rng.random(nnz) + 1j * rng.random(nnz)
+    else:
+        data = rng.random(nnz)
+    mtx = sparse.coo_matrix((data, (row, col)), shape=(rows, rows)).tocsr()
+    if symmetric:
+        mtx = sparse.tril(mtx) + sparse.tril(mtx, -1).T
+    if field == "pattern":
+        mtx.data[:] = 1
+    return sparse.coo_matrix(mtx)
+
+
+def measure(write, out_path, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        if os.path.exists(out_path):
+            os.remove(out_path)
+        start = time.perf_counter()
+        write(out_path)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+class BenchWriterProgram:
+    def run(self, parser):
+        parser.add_argument("--file", help="matrix market file to write back", type=str)
+        parser.add_argument(
+            "--rows", help="rows of generated matrix", type=int, default=200000
+        )
+        parser.add_argument(
+            "--nnz", help="nnz of generated matrix", type=int, default=2000000
+        )
+        parser.add_argument(
+            "--field",
+            help="field of generated matrix",
+            type=str,
+            default="real",
+            choices=["real", "integer", "complex", "pattern"],
+        )
+        parser.add_argument(
+            "--symmetric", help="generate a symmetric matrix", action="store_true"
+        )
+        parser.add_argument("--repeat", help="timed repetitions", type=int, default=3)
+        parser.add_argument(
+            "--workers", help="also time the parallel writer", type=int, default=1
+        )
+        args = parser.parse_args()
+        if args.file is not None:
+            mtx = MatrixMarketReader().read(args.file)
+            field = MatrixMarketReader().read_header(args.file).field
+        else:
+            mtx = generate(args.rows, args.nnz, args.field, args.symmetric, 0)
+            field = args.field
+        with tempfile.TemporaryDirectory() as tmp:
+            # with --symmetric MatrixMarketWriter looks for the symmetry and stores
+            # one triangle, the symmetry column tells which writers did
+            symmetry = "detect" if args.symmetric else "general"
+            writers = {
+                "mmwrite": lambda path: sio.mmwrite(
+                    path, mtx, field=None if field == "pattern" else field
+                ),
+                "MatrixMarketWriter": lambda path: MatrixMarketWriter().write(
+                    path, mtx, field, symmetry
+                ),
+            }
+            if args.workers > 1:
+                writers["workers={}".format(args.workers)] = lambda path: (
+                    MatrixMarketWriter(args.workers).write(path, mtx, field, symmetry)
+                )
+            self.__report(mtx, field, writers, tmp, args.repeat)
+
+    def __report(self, mtx, field, writers, tmp, repeat):
+        expect = mtx.tocsr()
+        expect.sum_duplicates()
+        warnings.filterwarnings("ignore")
+        table = BeautifulTable()
+        table.column_headers = [
+            "writer",
+            "seconds",
+            "MB/s",
+            "Mnnz/s",
+            "symmetry",
+            "same",
+        ]
+        for name, write in writers.items():
+            out_path = os.path.join(tmp, "{}.mtx".format(len(table)))
+            seconds = measure(write, out_path, repeat)
+            header = MatrixMarketReader().read_header(out_path)
+            back = MatrixMarketReader().read(out_path).tocsr()
+            if field == "pattern":
+                back.data[:] = 1
+            table.append_row(
+                [
+                    name,
+                    "{:.3f}".format(seconds),
+                    "{:.1f}".format(os.path.getsize(out_path) / seconds / 1e6),
+                    "{:.2f}".format(mtx.nnz / seconds / 1e6),
+                    header.symmetry,
+                    back.shape == expect.shape and abs(back - expect).max() <= 1e-12,
+                ]
+            )
+        warnings.resetwarnings()
+        print(
+            "{} x {}, nnz: {}, field: {}".format(
+                mtx.shape[0], mtx.shape[1], mtx.nnz, field
+            )
+        )
+        print(table)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    BenchWriterProgram().run(parser)
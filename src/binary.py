@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+import json
+import os
+import struct
+import numpy as np
+import scipy.sparse as sparse
+
+# a native binary matrix is a directory holding matrix.json and one .npy per array
+LAYOUT_ARRAYS = {
+    "coo": ["row", "col", "data"],
+    "csr": ["indptr", "indices", "data"],
+    "csc": ["indptr", "indices", "data"],
+}
+META_FILE = "matrix.json"
+
+
+def is_binary_matrix(dir_path):
+    return os.path.isfile(os.path.join(dir_path, META_FILE))
+
+
+def save_meta(dir_path, layout, shape, nnz):
+    # matrix.json is written last, a directory without it is incomplete
+    with open(os.path.join(dir_path, META_FILE), "w") as meta:
+        json.dump({"layout": layout, "shape": list(shape), "nnz": int(nnz)}, meta)
+
+
+def save_matrix(dir_path, mtx):
+    layout = mtx.format
+    if layout not in LAYOUT_ARRAYS:
+        raise Exception("unsupported binary layout: {}".format(layout))
+    os.makedirs(dir_path, exist_ok=True)
+    for name in LAYOUT_ARRAYS[layout]:
+        np.save(os.path.join(dir_path, name + ".npy"), getattr(mtx, name))
+    save_meta(dir_path, layout, mtx.shape, mtx.nnz)
+
+
+def open_array(dir_path, name, dtype, size):
+    # a writable memmap of a new .npy file, filled in place by streaming writers
+    path = os.path.join(dir_path, name + ".npy")
+    if size == 0:
+        np.save(path, np.empty(0, dtype=dtype))
+        return np.empty(0, dtype=dtype)
+    return np.lib.format.open_memmap(path, mode="w+", dtype=dtype, shape=(size,))
+
+
+def truncate_array(dir_path, name, size):
+    # an array opened for an upper bound keeps its first size items, the header
+    # is rewritten in place with the same length
+    path = os.path.join(dir_path, name + ".npy")
+    with open(path, "r+b") as stream:
+        np.lib.format.read_magic(stream)
+        _, _, dtype = np.lib.format.read_array_header_1_0(stream)
+        offset = stream.tell()
+        header = "{{'descr': {!r}, 'fortran_order': False, 'shape': ({},), }}".format(
+            np.lib.format.dtype_to_descr(dtype), size
+        )
+        stream.seek(0)
+        stream.write(np.lib.format.magic(1, 0))
+        stream.write(struct.pack("<H", offset - 10))
+        stream.write(header.ljust(offset - 11).encode("latin1") + b"\n")
+    os.truncate(path, offset + size * dtype.itemsize)
+
+
+def load_meta(dir_path):
+    with open(os.path.join(dir_path, META_FILE)) as meta:
+        return json.load(meta)
+
+
+def load_arrays(dir_path, mmap_mode=None):
+    meta = load_meta(dir_path)
+    arrays = {
+        name: np.load(os.path.join(dir_path, name + ".npy"), mmap_mode=mmap_mode)
+        for name in LAYOUT_ARRAYS[meta["layout"]]
+    }
+    return meta, arrays
+
+
+def load_matrix(dir_path, mmap_mode=None):
+    meta, arrays = load_arrays(dir_path, mmap_mode)
+    shape = tuple(meta["shape"])
+    if meta["layout"] == "coo":
+        return sparse.coo_matrix(
+            (arrays["data"], (arrays["row"], arrays["col"])), shape=shape, copy=False
+        )
+    layout = sparse.csr_matrix if meta["layout"] == "csr" else sparse.csc_matrix
+    return layout(
+        (arrays["data"], arrays["indices"], arrays["indptr"]), shape=shape, copy=False
+    )
+
+
+class MappedMatrix:
+    # the arrays stay memory-mapped, slicing one only touches the pages it needs
+    def __init__(self, layout, shape, arrays) -> None:
+        self.format = layout
+        self.shape = shape
+        self.nnz = int(arrays["data"].shape[0])
+        for name, array in arrays.items():
+            setattr(self, name, array)
+
+
+def load_mapped(dir_path):
+    meta, arrays = load_arrays(dir_path, "r")
+    return MappedMatrix(meta["layout"], tuple(meta["shape"]), arrays)
+
+
+def matrix_bytes(dir_path):
+    return sum(
+        entry.stat().st_size for entry in os.scandir(dir_path) if entry.is_file()
+    )
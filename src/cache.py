@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import warnings
+from beautifultable import BeautifulTable
+from binary import (
+    LAYOUT_ARRAYS,
+    is_binary_matrix,
+    save_matrix,
+    load_matrix,
+    load_mapped,
+    matrix_bytes,
+)
+from index import is_matrix_index
+from profiler import profiled
+from reader import SparseMatrixReader
+from util import parse_size, format_size
+
+CACHE_DIR = os.environ.get(
+    "SMT_CACHE_DIR",
+    os.path.join(os.path.expanduser("~"), ".cache", "sparse-matrix-tools"),
+)
+CACHE_LIMIT = os.environ.get("SMT_CACHE_LIMIT", "8G")
+SOURCE_FILE = "source.json"
+
+
+class MatrixCache:
+    def __init__(self, root=CACHE_DIR, limit=CACHE_LIMIT) -> None:
+        self.root = root
+        self.limit = parse_size(limit)
+
+    def key(self, mtx_path):
+        # the entry is invalidated as soon as the source file is rewritten
+        stat = os.stat(mtx_path)
+        source = "{}|{}|{}".format(
+            os.path.abspath(mtx_path), stat.st_size, stat.st_mtime_ns
+        )
+        return hashlib.sha1(source.encode()).hexdigest()
+
+    @profiled("cache load")
+    def load(self, mtx_path, layout, mmap=False):
+        entry = os.path.join(self.root, self.key(mtx_path), layout)
+        if not is_binary_matrix(entry):
+            return None
+        try:
+            mtx = load_mapped(entry) if mmap else load_matrix(entry)
+        except Exception:
+            warnings.warn(
+                "broken cache entry is dropped, cache entry: {}".format(entry),
+                RuntimeWarning,
+            )
+            shutil.rmtree(entry, ignore_errors=True)
+            return None
+        os.utime(entry)
+        return mtx
+
+    def prepare(self, mtx_path):
+        key_dir = os.path.join(self.root, self.key(mtx_path))
+        os.makedirs(key_dir, exist_ok=True)
+        with open(os.path.join(key_dir, SOURCE_FILE), "w") as source:
+            json.dump({"path": os.path.abspath(mtx_path)}, source)
+        return key_dir
+
+    @profiled("cache store")
+    def store(self, mtx_path, mtx):
+        key_dir = os.path.join(self.root, self.key(mtx_path))
+        entry = os.path.join(key_dir, mtx.format)
+        if is_binary_matrix(entry):
+            return
+        size = sum(getattr(mtx, name).nbytes for name in LAYOUT_ARRAYS[mtx.format])
+        if size > self.limit:
+            return
+        key_dir = self.prepare(mtx_path)
+        # concurrent runs race on the rename, the loser keeps the winner's entry
+        tmp = tempfile.mkdtemp(prefix=".tmp-", dir=key_dir)
+        try:
+            save_matrix(tmp, mtx)
+            os.rename(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+        self.evict()
+
+    def entries(self):
+        entries = []
+        if not os.path.isdir(self.root):
+            return entries
+        for key in os.scandir(self.root):
+            if not key.is_dir():
+                continue
+            try:
+                with open(os.path.join(key.path, SOURCE_FILE)) as source:
+                    mtx_path = json.load(source)["path"]
+            except Exception:
+                mtx_path = ""
+            for layout in os.scandir(key.path):
+                # row/col indexes of read.py are evicted like layouts
+                if layout.is_dir() and (
+                    is_binary_matrix(layout.path) or is_matrix_index(layout.path)
+                ):
+                    entries.append(
+                        {
+                            "path": mtx_path,
+                            "layout": layout.name,
+                            "dir": layout.path,
+                            "size": matrix_bytes(layout.path),
+                            "used": layout.stat().st_mtime,
+                        }
+                    )
+        return sorted(entries, key=lambda entry: entry["used"], reverse=True)
+
+    def size(self):
+        return sum(entry["size"] for entry in self.entries())
+
+    def evict(self, limit=None):
+        limit = self.limit if limit is None else limit
+        entries = self.entries()
+        total = sum(entry["size"] for entry in entries)
+        evicted = []
+        # least recently used entries are at the tail
+        while total > limit and len(entries) > 0:
+            entry = entries.pop()
+            shutil.rmtree(entry["dir"], ignore_errors=True)
+            total -= entry["size"]
+            evicted.append(entry)
+        self.__prune()
+        return evicted
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def __prune(self):
+        if not os.path.isdir(self.root):
+            return
+        for key in os.scandir(self.root):
+            if key.is_dir() and not any(
+                layout.is_dir() for layout in os.scandir(key.path)
+            ):
+                shutil.rmtree(key.path, ignore_errors=True)
+
+
+class CachedReader(SparseMatrixReader):
+    def __init__(self, reader, cache) -> None:
+        self.reader = reader
+        self.cache = cache
+
+    def read(self, mtx_path):
+        if not self.reader.cacheable:
+            return self.reader.read(mtx_path)
+        mtx = self.cache.load(mtx_path, "coo")
+        if mtx is None:
+            mtx = self.reader.read(mtx_path)
+            self.cache.store(mtx_path, mtx)
+        return mtx
+
+    def read_shape(self, mtx_path):
+        return self.reader.read_shape(mtx_path)
+
+    def read_meta(self, mtx_path):
+        return self.reader.read_meta(mtx_path)
+
+    def iter_chunks(self, mtx_path):
+        # streaming consumers use a cached coo when present but never fill the cache
+        mtx = None
+        if self.reader.cacheable:
+            mtx = self.cache.load(mtx_path, "coo", mmap=True)
+        if mtx is None:
+            yield from self.reader.iter_chunks(mtx_path)
+            return
+        step = max(1, self.reader.chunk_size // 16)
+        for begin in range(0, mtx.nnz, step):
+            end = begin + step
+            yield mtx.row[begin:end], mtx.col[begin:end], mtx.data[begin:end]
+
+
+def print_entries(entries):
+    if len(entries) == 0:
+        print()
+        return
+    warnings.filterwarnings("ignore")
+    table = BeautifulTable()
+    table.column_headers = ["file", "layout", "size", "last used"]
+    for entry in entries:
+        table.append_row(
+            [
+                entry["path"],
+                entry["layout"],
+                format_size(entry["size"]),
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(entry["used"])),
+            ]
+        )
+    warnings.resetwarnings()
+    print(table)
+
+
+class CacheProgram:
+    def run(self, parser):
+        parser.add_argument(
+            "--dir", help="cache directory", type=str, default=CACHE_DIR
+        )
+        subparsers = parser.add_subparsers(dest="command", required=True)
+        subparsers.add_parser("list", help="list cached matrices")
+        subparsers.add_parser("clear", help="remove every cached matrix")
+        trim = subparsers.add_parser("trim", help="evict least recently used entries")
+        trim.add_argument(
+            "-l", "--limit", help="cache size cap", type=str, default=CACHE_LIMIT
+        )
+        args = parser.parse_args()
+        cache = MatrixCache(args.dir)
+        if args.command == "list":
+            print_entries(cache.entries())
+            print(
+                "total: {}, cap: {}".format(
+                    format_size(cache.size()), format_size(cache.limit)
+                )
+            )
+        elif args.command == "clear":
+            cache.clear()
+        elif args.command == "trim":
+            print_entries(cache.evict(parse_size(args.limit)))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    CacheProgram().run(parser)
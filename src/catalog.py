@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+import argparse
+import csv
+import hashlib
+import io
+import os
+import sqlite3
+import time
+from urllib.request import urlopen
+from downloader import SS_ROOT_URL
+
+CATALOG_PATH = os.environ.get(
+    "SMT_CATALOG",
+    os.path.join(
+        os.path.expanduser("~"), ".local", "share", "sparse-matrix-tools", "catalog.db"
+    ),
+)
+SNAPSHOT_URL = "/".join((SS_ROOT_URL, "files", "ssstats.csv"))
+COLUMNS = [
+    "id",
+    "grp",
+    "name",
+    "rows",
+    "cols",
+    "nnz",
+    "dtype",
+    "is2d3d",
+    "isspd",
+    "psym",
+    "nsym",
+    "kind",
+]
+
+
+class CatalogMatrix:
+    # the same fields and table columns as ssgetpy.Matrix, so both print alike
+    attr_list = [
+        "Id",
+        "Group",
+        "Name",
+        "Rows",
+        "Cols",
+        "NNZ",
+        "DType",
+        "2D/3D Discretization?",
+        "SPD?",
+        "Pattern Symmetry",
+        "Numerical Symmetry",
+        "Kind",
+        "Spy Plot",
+    ]
+
+    def __init__(
+        self, id, group, name, rows, cols, nnz, dtype, is2d3d, isspd, psym, nsym, kind
+    ) -> None:
+        self.id = id
+        self.group = group
+        self.name = name
+        self.rows = rows
+        self.cols = cols
+        self.nnz = nnz
+        self.dtype = dtype
+        self.is2d3d = bool(is2d3d)
+        self.isspd = bool(isspd)
+        self.psym = psym
+        self.nsym = nsym
+        self.kind = kind
+
+    def icon_url(self):
+        return "/".join((SS_ROOT_URL, "files", self.group, self.name + ".png"))
+
+    def to_tuple(self):
+        return (
+            self.id,
+            self.group,
+            self.name,
+            self.rows,
+            self.cols,
+            self.nnz,
+            self.dtype,
+            self.is2d3d,
+            self.isspd,
+            self.psym,
+            self.nsym,
+            self.kind,
+            self.icon_url(),
+        )
+
+
+def parse_snapshot(stream):
+    # ssstats.csv: entry count, snapshot date, then one line per matrix in id order
+    lines = iter(stream)
+    count = int(next(lines).strip())
+    date = next(lines).strip()
+    rows = []
+    for id, line in enumerate(csv.reader(lines), start=1):
+        if len(line) < 12:
+            continue
+        real, logical = int(line[5]), int(line[6])
+        rows.append(
+            (
+                id,
+                line[0],
+                line[1],
+                int(line[2]),
+                int(line[3]),
+                int(line[4]),
+                "binary" if logical else ("real" if real else "complex"),
+                int(line[7]),
+                int(line[8]),
+                float(line[9]),
+                float(line[10]),
+                line[11],
+            )
+        )
+    if len(rows) != count:
+        raise Exception(
+            "broken catalog snapshot, expect {} entries got {}".format(count, len(rows))
+        )
+    return date, rows
+
+
+def row_digest(row):
+    return hashlib.sha1(repr(row).encode()).hexdigest()
+
+
+class Catalog:
+    def __init__(self, path=CATALOG_PATH) -> None:
+        self.path = path
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.__create()
+
+    def __create(self):
+        # NOCASE because the download prompt lower-cases everything typed into it
+        self.conn.executescript("""
+            CREATE TABLE IF NOT EXISTS matrices (
+                id INTEGER PRIMARY KEY,
+                grp TEXT COLLATE NOCASE,
+                name TEXT COLLATE NOCASE,
+                rows INTEGER,
+                cols INTEGER,
+                nnz INTEGER,
+                dtype TEXT COLLATE NOCASE,
+                is2d3d INTEGER,
+                isspd INTEGER,
+                psym REAL,
+                nsym REAL,
+                kind TEXT COLLATE NOCASE,
+                digest TEXT
+            );
+            CREATE INDEX IF NOT EXISTS matrices_rows ON matrices (rows);
+            CREATE INDEX IF NOT EXISTS matrices_cols ON matrices (cols);
+            CREATE INDEX IF NOT EXISTS matrices_nnz ON matrices (nnz);
+            CREATE INDEX IF NOT EXISTS matrices_grp ON matrices (grp);
+            CREATE INDEX IF NOT EXISTS matrices_name ON matrices (name);
+            CREATE INDEX IF NOT EXISTS matrices_kind ON matrices (kind);
+            CREATE INDEX IF NOT EXISTS matrices_dtype ON matrices (dtype);
+            CREATE TABLE IF NOT EXISTS snapshot (key TEXT PRIMARY KEY, value TEXT);
+            """)
+
+    def close(self):
+        self.conn.close()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM matrices").fetchone()[0]
+
+    def snapshot_date(self):
+        row = self.conn.execute(
+            "SELECT value FROM snapshot WHERE key = 'date'"
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def refresh(self, stream, force=False):
+        # only rows whose content changed are written, removed matrices are dropped
+        date, rows = parse_snapshot(stream)
+        if not force and date == self.snapshot_date():
+            return {"date": date, "added": 0, "updated": 0, "removed": 0}
+        digests = dict(self.conn.execute("SELECT id, digest FROM matrices"))
+        changed = [
+            row + (row_digest(row),)
+            for row in rows
+            if digests.get(row[0]) != row_digest(row)
+        ]
+        ids = set(row[0] for row in rows)
+        removed = [(id,) for id in digests if id not in ids]
+        with self.conn:
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO matrices VALUES ({})".format(
+                    ",".join("?" * (len(COLUMNS) + 1))
+                ),
+                changed,
+            )
+            self.conn.executemany("DELETE FROM matrices WHERE id = ?", removed)
+            self.conn.execute(
+                "INSERT OR REPLACE INTO snapshot VALUES ('date', ?)", (date,)
+            )
+        added = sum(1 for row in changed if row[0] not in digests)
+        return {
+            "date": date,
+            "added": added,
+            "updated": len(changed) - added,
+            "removed": len(removed),
+        }
+
+    def search(
+        self,
+        rowbounds=None,
+        colbounds=None,
+        nzbounds=None,
+        isspd=None,
+        is2d3d=None,
+        dtype=None,
+        group=None,
+        kind=None,
+        name=None,
+        limit=10,
+    ):
+        clauses = []
+        params = []
+        for column, bounds in [
+            ("rows", rowbounds),
+            ("cols", colbounds),
+            ("nnz", nzbounds),
+        ]:
+            if bounds is not None:
+                clauses.append("{} BETWEEN ? AND ?".format(column))
+                params.extend(bounds)
+        for column, value in [("isspd", isspd), ("is2d3d", is2d3d)]:
+            if value is not None:
+                clauses.append("{} = ?".format(column))
+                params.append(int(value))
+        for column, value in [("dtype", dtype), ("grp", group)]:
+            if value is not None:
+                clauses.append("{} = ?".format(column))
+                params.append(value)
+        # ssgetpy matches kind and name as substrings
+        for column, value in [("kind", kind), ("name", name)]:
+            if value is not None:
+                clauses.append("{} LIKE ?".format(column))
+                params.append("%{}%".format(value))
+        query = "SELECT {} FROM matrices".format(", ".join(COLUMNS))
+        if len(clauses) > 0:
+            query += " WHERE " + " AND ".join(clauses)
+        query += " ORDER BY id LIMIT ?"
+        params.append(limit)
+        return [CatalogMatrix(*row) for row in self.conn.execute(query, params)]
+
+    def get(self, id=None, name=None):
+        column, value = ("id", id) if id is not None else ("name", name)
+        row = self.conn.execute(
+            "SELECT {} FROM matrices WHERE {} = ?".format(", ".join(COLUMNS), column),
+            (value,),
+        ).fetchone()
+        if row is None:
+            raise KeyError(value)
+        return CatalogMatrix(*row)
+
+
+class CatalogProgram:
+    def run(self, parser):
+        parser.add_argument(
+            "--catalog", help="catalog database", type=str, default=CATALOG_PATH
+        )
+        subparsers = parser.add_subparsers(dest="command", required=True)
+        load = subparsers.add_parser("import", help="import an ssstats.csv snapshot")
+        load.add_argument("--file", help="snapshot file", type=str, required=True)
+        load.add_argument(
+            "--force", help="import even if the date is unchanged", action="store_true"
+        )
+        fetch = subparsers.add_parser("fetch", help="download and import a snapshot")
+        fetch.add_argument("--url", help="snapshot url", type=str, default=SNAPSHOT_URL)
+        fetch.add_argument(
+            "--force", help="import even if the date is unchanged", action="store_true"
+        )
+        subparsers.add_parser("info", help="show the catalog size and snapshot date")
+        args = parser.parse_args()
+        catalog = Catalog(args.catalog)
+        begin = time.perf_counter()
+        if args.command == "import":
+            if not os.path.isfile(args.file):
+                raise Exception(
+                    "snapshot file is not exists, file: {}".format(args.file)
+                )
+            with open(args.file, newline="") as stream:
+                result = catalog.refresh(stream, args.force)
+        elif args.command == "fetch":
+            with urlopen(args.url) as response:
+                text = io.TextIOWrapper(response, encoding="utf-8", newline="")
+                result = catalog.refresh(text, args.force)
+        else:
+            result = None
+        if result is not None:
+            print(
+                "snapshot {}: {} added, {} updated, {} removed in {:.3f}s".format(
+                    result["date"],
+                    result["added"],
+                    result["updated"],
+                    result["removed"],
+                    time.perf_counter() - begin,
+                )
+            )
+        print(
+            "{} matrices, snapshot {}, catalog {}".format(
+                len(catalog), catalog.snapshot_date(), catalog.path
+            )
+        )
+        catalog.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    CatalogProgram().run(parser)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+import argparse
+from abc import abstractmethod
+
+
+class ArgumentParser(argparse.ArgumentParser):
+    def exit(self, status=0, message=None):
+        raise Exception
+
+
+class Command:
+    def __init__(self, subparsers, states) -> None:
+        self.subparser = None
+        self.states = states
+        pass
+
+    def exec(self, parser, input):
+        try:
+            args = self.parser(parser, input)
+            self.check(args)
+        except Exception:
+            self.print_help()
+            return
+        self.run(args)
+
+    def print_help(self):
+        self.subparser.print_help()
+
+    def parser(self, parser, input):
+        return parser.parse_args(input)
+
+    @abstractmethod
+    def check(self, args):
+        pass
+
+    @abstractmethod
+    def run(self, args):
+        pass
+
+
+class ClearCommand(Command):
+    def __init__(self, subparsers, states) -> None:
+        super().__init__(subparsers, states)
+        self.subparser = subparsers.add_parser("clear", help="clear screen")
+
+    def check(self, args):
+        pass
+
+    def run(self, args):
+        from prompt_toolkit import shortcuts
+
+        shortcuts.clear()
+
+
+class ExitCommand(Command):
+    def __init__(self, subparsers, states) -> None:
+        super().__init__(subparsers, states)
+        self.subparser = subparsers.add_parser("exit", help="exit program")
+
+    def check(self, args):
+        pass
+
+    def run(self, args):
+        exit()
@@ -0,0 +1,348 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import warnings
+import numpy as np
+from beautifultable import BeautifulTable
+from concurrent.futures import ProcessPoolExecutor
+from binary import is_binary_matrix, load_mapped, load_meta
+from reader import MatrixMarketReader, MatlabReader, RbReader, BinaryReader
+from transform import OutOfCoreTransform
+from profiler import add_profile_argument, finish_profile, stage, start_profile
+from util import parse_size
+
+# row blocks are hashed and diffed one at a time, their entries bound the memory
+BLOCK_ROWS = 4096
+# blocks handed to a worker at once
+BLOCKS_PER_TASK = 64
+DIGEST_SIZE = 16
+
+
+def sorted_csr(reader, mtx_path, budget, tmp_dir):
+    # rows become contiguous through the out-of-core transform, native csr
+    # directories are hashed as they are
+    if is_binary_matrix(mtx_path) and load_meta(mtx_path)["layout"] == "csr":
+        return mtx_path
+    csr_dir = os.path.join(tmp_dir, "csr")
+    OutOfCoreTransform(reader, mtx_path, budget, tmp_dir).write_compressed(
+        csr_dir, "csr"
+    )
+    return csr_dir
+
+
+def value_dtype(csr):
+    return np.complex128 if csr.data.dtype.kind == "c" else np.float64
+
+
+def canonical_block(csr, block, block_rows, dtype):
+    # entries of the block sorted by row and col, duplicates summed and zeros dropped,
+    # so the order, storage and value type of the source do not change the hash
+    begin = block * block_rows
+    end = min(begin + block_rows, csr.shape[0])
+    indptr = np.asarray(csr.indptr[begin : end + 1], dtype=np.int64)
+    row = np.repeat(np.arange(end - begin, dtype=np.int64), np.diff(indptr))
+    col = np.asarray(csr.indices[indptr[0] : indptr[-1]], dtype=np.int64)
+    data = np.asarray(csr.data[indptr[0] : indptr[-1]]).astype(dtype)
+    if row.size == 0:
+        return row, col, data
+    order = np.lexsort((col, row))
+    row, col, data = row[order], col[order], data[order]
+    first = np.ones(row.size, dtype=bool)
+    first[1:] = (row[1:] != row[:-1]) | (col[1:] != col[:-1])
+    starts = np.flatnonzero(first)
+    data = np.add.reduceat(data, starts)
+    row, col = row[starts], col[starts]
+    keep = data != 0
+    return row[keep], col[keep], data[keep]
+
+
+def block_digest(row, col, data, rows):
+    digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    digest.update(np.bincount(row, minlength=rows).astype(np.int64).tobytes())
+    digest.update(col.tobytes())
+    digest.update(data.tobytes())
+    return digest.hexdigest()
+
+
+def hash_blocks(csr_dir, first, last, block_rows):
+    # runs in a pool process, the arrays are mapped again there
+    csr = load_mapped(csr_dir)
+    dtype = value_dtype(csr)
+    hashes = []
+    for block in range(first, last):
+        row, col, data = canonical_block(csr, block, block_rows, dtype)
+        rows = min(block_rows, csr.shape[0] - block * block_rows)
+        hashes.append((block_digest(row, col, data, rows), int(row.size)))
+    return hashes
+
+
+def fingerprint(csr_dir, block_rows, workers):
+    csr = load_mapped(csr_dir)
+    blocks = -(-csr.shape[0] // block_rows)
+    tasks = [
+        (first, min(first + BLOCKS_PER_TASK, blocks))
+        for first in range(0, blocks, BLOCKS_PER_TASK)
+    ]
+    if workers > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(workers) as pool:
+            futures = [
+                pool.submit(hash_blocks, csr_dir, first, last, block_rows)
+                for first, last in tasks
+            ]
+            hashes = [digest for future in futures for digest in future.result()]
+    else:
+        hashes = [
+            digest
+            for first, last in tasks
+            for digest in hash_blocks(csr_dir, first, last, block_rows)
+        ]
+    record = {
+        "shape": [int(csr.shape[0]), int(csr.shape[1])],
+        "nnz": sum(nnz for _, nnz in hashes),
+        "values": np.dtype(value_dtype(csr)).name,
+        "block_rows": block_rows,
+        "blocks": [digest for digest, _ in hashes],
+    }
+    # the whole matrix hashes its shape, value type and block hashes in order
+    digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    digest.update(
+        "{} {} {} {}".format(*record["shape"], record["values"], block_rows).encode()
+    )
+    for block in record["blocks"]:
+        digest.update(bytes.fromhex(block))
+    record["fingerprint"] = digest.hexdigest()
+    return record
+
+
+def differing_blocks(left, right):
+    return [
+        block
+        for block, (a, b) in enumerate(zip(left["blocks"], right["blocks"]))
+        if a != b
+    ]
+
+
+def diff_block(left, right, block, block_rows, limit):
+    # entries only one side has or whose values differ, at most limit of them
+    # listed, the counts cover the whole block
+    dtype = np.result_type(value_dtype(left), value_dtype(right))
+    cols = max(left.shape[1], right.shape[1])
+    lr, lc, lv = canonical_block(left, block, block_rows, dtype)
+    rr, rc, rv = canonical_block(right, block, block_rows, dtype)
+    left_keys = lr * cols + lc
+    right_keys = rr * cols + rc
+    _, li, ri = np.intersect1d(
+        left_keys, right_keys, assume_unique=True, return_indices=True
+    )
+    changed = lv[li] != rv[ri]
+    only_left = np.flatnonzero(~np.isin(left_keys, right_keys, assume_unique=True))
+    only_right = np.flatnonzero(~np.isin(right_keys, left_keys, assume_unique=True))
+    entries = (
+        [(left_keys[i], lv[i], None) for i in only_left[:limit]]
+        + [(right_keys[i], None, rv[i]) for i in only_right[:limit]]
+        + [(left_keys[i], lv[i], rv[j]) for i, j in zip(li[changed], ri[changed])][
+            :limit
+        ]
+    )
+    entries = sorted(entries, key=lambda entry: entry[0])[:limit]
+    counts = (only_left.size, only_right.size, int(changed.sum()))
+    first_row = block * block_rows
+    return counts, [
+        (first_row + int(key // cols), int(key % cols), a, b) for key, a, b in entries
+    ]
+
+
+def load_fingerprint(path):
+    with open(path) as stream:
+        return json.load(stream)
+
+
+def print_fingerprint(name, record):
+    print(
+        "{}: {} x {}, nnz {}, {}, {} blocks of {} rows".format(
+            name,
+            record["shape"][0],
+            record["shape"][1],
+            record["nnz"],
+            record["values"],
+            len(record["blocks"]),
+            record["block_rows"],
+        )
+    )
+    print("fingerprint: {}".format(record["fingerprint"]))
+
+
+def print_diff(block, block_rows, rows, counts, entries):
+    print(
+        "rows {}-{}: {} only left, {} only right, {} values differ".format(
+            block * block_rows, min((block + 1) * block_rows, rows) - 1, *counts
+        )
+    )
+    if len(entries) == 0:
+        return
+    warnings.filterwarnings("ignore")
+    # values are shown in full, a rounded one would hide the difference
+    table = BeautifulTable(maxwidth=120, detect_numerics=False)
+    table.column_headers = ["row", "col", "left", "right"]
+    for row, col, a, b in entries:
+        table.append_row(
+            [row, col, "-" if a is None else str(a), "-" if b is None else str(b)]
+        )
+    warnings.resetwarnings()
+    print(table)
+
+
+class CompareProgram:
+    def __init__(self) -> None:
+        self.__reader_factory = {
+            "mm": MatrixMarketReader,
+            "mat": MatlabReader,
+            "rb": RbReader,
+            "bin": BinaryReader,
+        }
+
+    def run(self, parser):
+        parser.add_argument(
+            "--format",
+            help="sparse matrix format",
+            type=str,
+            required=True,
+            choices=self.__reader_factory.keys(),
+        )
+        parser.add_argument(
+            "--file", help="sparse matrix file", type=str, required=True
+        )
+        parser.add_argument(
+            "--other",
+            help="matrix compared with --file, or a fingerprint file saved by --save",
+            type=str,
+        )
+        parser.add_argument(
+            "--other-format",
+            help="format of --other, --format by default",
+            type=str,
+            choices=self.__reader_factory.keys(),
+        )
+        parser.add_argument(
+            "--block-rows", help="rows per hashed block", type=int, default=BLOCK_ROWS
+        )
+        parser.add_argument(
+            "--workers", help="parallel hashing processes", type=int, default=1
+        )
+        parser.add_argument(
+            "--diff-blocks",
+            help="differing blocks whose entries are listed",
+            type=int,
+            default=3,
+        )
+        parser.add_argument(
+            "--limit", help="entries listed per block", type=int, default=20
+        )
+        parser.add_argument(
+            "--save", help="write the fingerprint of --file as json", type=str
+        )
+        parser.add_argument(
+            "--memory", help="memory budget, e.g. 512M or 4G", type=str, default="1G"
+        )
+        parser.add_argument(
+            "--tmp", help="directory for the sorted copies", type=str, default=None
+        )
+        add_profile_argument(parser)
+        args = parser.parse_args()
+        for mtx_file in [args.file, args.other]:
+            if (
+                mtx_file is not None
+                and os.path.isfile(mtx_file) is False
+                and is_binary_matrix(mtx_file) is False
+            ):
+                raise Exception(
+                    "sparse matrix file is not exists, matrix file: {}".format(mtx_file)
+                )
+        if min(args.block_rows, args.workers) < 1:
+            raise Exception("block rows and workers must be positive")
+        if min(args.diff_blocks, args.limit) < 0:
+            raise Exception("diff blocks and limit must not be negative")
+        start_profile(args.profile)
+        same = self.__compare(args)
+        finish_profile(args.profile)
+        if not same:
+            sys.exit(1)
+
+    def __compare(self, args):
+        budget = parse_size(args.memory)
+        stored = args.other is not None and args.other.endswith(".json")
+        block_rows = args.block_rows
+        if stored:
+            right = load_fingerprint(args.other)
+            block_rows = right["block_rows"]
+        with tempfile.TemporaryDirectory(prefix="smt-", dir=args.tmp) as tmp:
+            left_dir = self.__sorted(args.format, args.file, budget, tmp, "left")
+            with stage("hash", side="left"):
+                left = fingerprint(left_dir, block_rows, args.workers)
+            print_fingerprint(args.file, left)
+            if args.save is not None:
+                with open(args.save, "w") as stream:
+                    json.dump(left, stream)
+            if args.other is None:
+                return True
+            if not stored:
+                right_dir = self.__sorted(
+                    args.other_format or args.format, args.other, budget, tmp, "right"
+                )
+                with stage("hash", side="right"):
+                    right = fingerprint(right_dir, block_rows, args.workers)
+            print_fingerprint(args.other, right)
+            if left["fingerprint"] == right["fingerprint"]:
+                print("same")
+                return True
+            if left["shape"] != right["shape"]:
+                print(
+                    "shapes differ: {} x {} and {} x {}".format(
+                        *left["shape"], *right["shape"]
+                    )
+                )
+                return False
+            if left["values"] != right["values"]:
+                # every stored block hashes differently, the diff compares values
+                print(
+                    "value types differ: {} and {}".format(
+                        left["values"], right["values"]
+                    )
+                )
+            blocks = differing_blocks(left, right)
+            print(
+                "{} of {} blocks differ, first: {}".format(
+                    len(blocks),
+                    len(left["blocks"]),
+                    " ".join(str(block) for block in blocks[:10]),
+                )
+            )
+            if stored:
+                # a stored fingerprint has no entries to list
+                return False
+            with stage("diff"):
+                left_csr = load_mapped(left_dir)
+                right_csr = load_mapped(right_dir)
+                for block in blocks[: args.diff_blocks]:
+                    counts, entries = diff_block(
+                        left_csr, right_csr, block, block_rows, args.limit
+                    )
+                    print_diff(block, block_rows, left["shape"][0], counts, entries)
+        return False
+
+    def __sorted(self, mtx_format, mtx_file, budget, tmp, side):
+        side_dir = os.path.join(tmp, side)
+        os.makedirs(side_dir)
+        with stage("sort", side=side):
+            return sorted_csr(
+                self.__reader_factory[mtx_format](), mtx_file, budget, side_dir
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    CompareProgram().run(parser)
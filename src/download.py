@@ -1,11 +1,27 @@
 #!/usr/bin/env python3
 import argparse
-import ssgetpy as ssget
+import os
+import shutil
+import time
 import warnings
 from os import path
-from prompt_toolkit import PromptSession, shortcuts
+from catalog import Catalog
+from downloader import (
+    MEMBER_EXTENSIONS,
+    SS_ROOT_URL,
+    Downloader,
+    DownloadTask,
+    extract,
+    extract_member,
+    matrix_filename,
+    matrix_url,
+    read_checksums,
+)
+from repository import MatrixRepository
+from command import ArgumentParser, Command, ClearCommand, ExitCommand
+from util import format_size
+from prompt_toolkit import PromptSession
 from beautifultable import BeautifulTable
-from abc import abstractmethod
 
 
 def print_mtxs(mtxs):
@@ -22,39 +38,38 @@ def print_mtxs(mtxs):
         print()
 
 
-class ArgumentParser(argparse.ArgumentParser):
-    def exit(self, status=0, message=None):
-        raise Exception
-
-
-class Command:
-    def __init__(self, subparsers, states) -> None:
-        self.subparser = None
-        self.states = states
-        pass
-
-    def exec(self, parser, input):
-        try:
-            args = self.parser(parser, input)
-            self.check(args)
-        except Exception:
-            self.print_help()
-            return
-        self.run(args)
-
-    def print_help(self):
-        self.subparser.print_help()
-
-    def parser(self, parser, input):
-        return parser.parse_args(input)
-
-    @abstractmethod
-    def check(self, args):
-        pass
-
-    @abstractmethod
-    def run(self, args):
-        pass
+def print_tasks(tasks, progress):
+    tasks = list(tasks)
+    # streamed tasks also show what they left on disk next to the matrix text size
+    streamed = any(task.disk is not None for task in tasks)
+    warnings.filterwarnings("ignore")
+    table = BeautifulTable()
+    if streamed:
+        table.column_headers = ["name", "size", "text", "on disk", "seconds", "status"]
+    else:
+        table.column_headers = ["name", "size", "seconds", "status"]
+    for task in tasks:
+        row = [task.name, format_size(task.size), "{:.2f}".format(task.seconds)]
+        if streamed:
+            row[2:2] = [
+                "-" if task.text is None else format_size(task.text),
+                "-" if task.disk is None else format_size(task.disk),
+            ]
+        table.append_row(row + [task.status])
+    warnings.resetwarnings()
+    print(table)
+    print(
+        "received {} at {}/s".format(
+            format_size(progress.received), format_size(progress.throughput())
+        )
+    )
+    if streamed:
+        print(
+            "{} on disk, {:.2f}s end to end".format(
+                format_size(sum(task.disk or 0 for task in tasks)),
+                time.perf_counter() - progress.begin,
+            )
+        )
 
 
 class SearchCommand(Command):
@@ -82,7 +97,7 @@ class SearchCommand(Command):
         self.subparser.add_argument("-l", "--limit", type=int, default=10)
 
     def run(self, args):
-        mtxs = ssget.search(
+        query = dict(
             rowbounds=args.rowbounds,
             colbounds=args.colbounds,
             nzbounds=args.nzbounds,
@@ -93,7 +108,24 @@ class SearchCommand(Command):
             kind=args.kind,
             limit=args.limit,
         )
+        begin = time.perf_counter()
+        if len(self.states.catalog) > 0:
+            mtxs = self.states.catalog.search(**query)
+        else:
+            warnings.warn(
+                "local catalog is empty, run catalog.py fetch to search offline!!!",
+                RuntimeWarning,
+            )
+            # ssgetpy fetches its own index on import, so only load it when needed
+            import ssgetpy as ssget
+
+            mtxs = ssget.search(**query)
         print_mtxs(mtxs)
+        print(
+            "{} matrices in {:.1f}ms".format(
+                len(mtxs), (time.perf_counter() - begin) * 1e3
+            )
+        )
         for mtx in mtxs:
             self.states.mtx_cache.add_item(mtx)
 
@@ -116,10 +148,37 @@ class DownloadCommand(Command):
         self.subparser.add_argument(
             "-d", "--dest", required=False, type=str, default=path.curdir
         )
+        self.subparser.add_argument("-j", "--jobs", required=False, type=int, default=4)
+        self.subparser.add_argument(
+            "-u", "--url", required=False, type=str, default=SS_ROOT_URL
+        )
+        self.subparser.add_argument(
+            "-r", "--retries", required=False, type=int, default=3
+        )
+        # stream archives into native binary coo directories, no tarball or text is kept
+        self.subparser.add_argument(
+            "-p", "--pipeline", required=False, action="store_true", default=False
+        )
+        # md5sum style file, one "<md5>  <file name>" line per matrix
+        self.subparser.add_argument(
+            "-s", "--checksums", required=False, type=str, default=None
+        )
+        # keep one copy per content hash in the local repository instead of --dest
+        self.subparser.add_argument(
+            "-R", "--repository", required=False, action="store_true", default=False
+        )
 
     def check(self, args):
         if path is not None and not path.exists(args.dest):
             raise Exception("dest path is not exist!!!")
+        if args.jobs < 1 or args.retries < 0:
+            raise Exception("jobs must be positive and retries non-negative!!!")
+        if args.checksums is not None and not path.isfile(args.checksums):
+            raise Exception("checksums file is not exist!!!")
+        if args.pipeline and args.format == "mat":
+            raise Exception("pipeline mode streams mm and rb archives only!!!")
+        if args.repository and (args.pipeline or args.extract):
+            raise Exception("the repository keeps matrix files, not pipelines!!!")
 
     def run(self, args):
         if len(self.states.mtx_cart) == 0:
@@ -128,11 +187,92 @@ class DownloadCommand(Command):
                 RuntimeWarning,
             )
             return
+        format = args.format.upper()
+        checksums = read_checksums(args.checksums) if args.checksums is not None else {}
+        tasks = {}
         for mtx in self.states.mtx_cart.values():
-            mtx.download(
-                format=args.format.upper(), extract=args.extract, destpath=args.dest
+            filename = matrix_filename(mtx.name, format)
+            tasks[mtx.id] = DownloadTask(
+                mtx.name,
+                matrix_url(args.url, mtx.group, mtx.name, format),
+                path.join(args.dest, mtx.name if args.pipeline else filename),
+                checksums.get(filename),
+            )
+        downloader = Downloader(args.jobs, args.retries)
+        if args.repository:
+            self.__run_repository(args, format, tasks, downloader)
+            return
+        if args.pipeline:
+            # numpy and the readers are only loaded for pipeline downloads
+            from binary import is_binary_matrix, matrix_bytes
+            from pipeline import binary_sink
+
+            pending = []
+            for task in tasks.values():
+                if is_binary_matrix(task.path):
+                    task.status = "present"
+                    task.disk = matrix_bytes(task.path)
+                elif path.exists(task.path):
+                    task.status = "failed: {} already exists".format(task.path)
+                else:
+                    pending.append(task)
+            progress = downloader.stream(pending, binary_sink(format))
+        else:
+            progress = downloader.download(list(tasks.values()))
+        for id, task in tasks.items():
+            if task.status.startswith("failed"):
+                continue
+            if args.extract and format != "MAT" and not args.pipeline:
+                try:
+                    extract(task.path, args.dest)
+                except Exception as error:
+                    task.status = "failed: {}".format(error)
+                    continue
+            # failed matrices stay in the cart for the next attempt
+            self.states.mtx_cart.remove_item_by_id(id)
+        print_tasks(tasks.values(), progress)
+
+    def __run_repository(self, args, format, tasks, downloader):
+        # stored matrices are skipped, new ones are downloaded to a staging directory,
+        # cut down to the matrix file and moved in under their content hash
+        repository = MatrixRepository()
+        staging = repository.staging()
+        pending = []
+        for id, task in tasks.items():
+            entry = repository.find(id, format)
+            if entry is not None:
+                task.status = "present"
+                task.path = entry["path"]
+            else:
+                task.path = path.join(staging, path.basename(task.path))
+                pending.append(task)
+        try:
+            progress = downloader.download(pending)
+            for id, task in tasks.items():
+                mtx = self.states.mtx_cart.get_item_by_id(id)
+                if task.status == "done":
+                    try:
+                        if format in MEMBER_EXTENSIONS:
+                            archive = task.path
+                            task.path = extract_member(
+                                archive, mtx.name, MEMBER_EXTENSIONS[format], staging
+                            )
+                            os.remove(archive)
+                        entry, deduplicated = repository.add(mtx, format, task.path)
+                        task.path = entry["path"]
+                        task.status = "deduplicated" if deduplicated else "stored"
+                    except Exception as error:
+                        task.status = "failed: {}".format(error)
+                if not task.status.startswith("failed"):
+                    self.states.mtx_cart.remove_item_by_id(id)
+        finally:
+            shutil.rmtree(staging, ignore_errors=True)
+        print_tasks(tasks.values(), progress)
+        print(
+            "repository: {} of {}".format(
+                format_size(repository.size()), format_size(repository.limit)
             )
-        self.states.mtx_cart.clear()
+        )
 
 
 class CacheCommand(Command):
@@ -189,8 +329,13 @@ class AddCommand(Command):
             if args.name is not None:
                 mtx = self.states.mtx_cache.get_item_by_name(args.name)
         except:
-            warnings.warn("input is not in cache!!!")
-            return
+            # matrices not listed by a search are looked up in the local catalog
+            try:
+                mtx = self.states.catalog.get(args.id, args.name)
+            except:
+                warnings.warn("input is not in cache!!!")
+                return
+            self.states.mtx_cache.add_item(mtx)
         self.states.mtx_cart.add_item(mtx)
 
 
@@ -212,30 +357,6 @@ class RemoveCommand(Command):
             self.states.mtx_cart.remove_item_by_name(args.name)
 
 
-class ClearCommand(Command):
-    def __init__(self, subparsers, states) -> None:
-        super().__init__(subparsers, states)
-        self.subparser = subparsers.add_parser("clear", help="clear screen")
-
-    def check(self, args):
-        pass
-
-    def run(self, args):
-        shortcuts.clear()
-
-
-class ExitCommand(Command):
-    def __init__(self, subparsers, states) -> None:
-        super().__init__(subparsers, states)
-        self.subparser = subparsers.add_parser("exit", help="exit program")
-
-    def check(self, args):
-        pass
-
-    def run(self, args):
-        exit()
-
-
 class MtxMap:
     def __init__(self) -> None:
         self.__id_to_mtx_map = dict()
@@ -285,11 +406,15 @@ class MtxMap:
 class State:
     mtx_cache = MtxMap()
     mtx_cart = MtxMap()
+    catalog = None
 
 
 class DownloadProgram:
-    def run(self):
+    def run(self, parser):
+        # everything else happens at the prompt
+        parser.parse_args()
         state = State()
+        state.catalog = Catalog()
         parser = ArgumentParser(prog="Matrix Market Download Program")
         subparsers = parser.add_subparsers()
         commands = {
@@ -316,4 +441,5 @@ class DownloadProgram:
 
 
 if __name__ == "__main__":
-    DownloadProgram().run()
+    parser = argparse.ArgumentParser()
+    DownloadProgram().run(parser)
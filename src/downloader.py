@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+import hashlib
+import http.client
+import os
+import re
+import shutil
+import sys
+import tarfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+from util import format_size
+
+SS_ROOT_URL = "https://sparse.tamu.edu"
+BLOCK_SIZE = 1 << 20
+PART_SUFFIX = ".part"
+MD5_SUFFIX = ".md5"
+# the matrix file inside a sparse.tamu.edu archive
+MEMBER_EXTENSIONS = {"MM": ".mtx", "RB": ".rb"}
+
+
+def matrix_filename(name, format):
+    return name + (".mat" if format == "MAT" else ".tar.gz")
+
+
+def matrix_url(base_url, group, name, format):
+    directory = "mat" if format == "MAT" else format
+    return "/".join(
+        (base_url.rstrip("/"), directory, group, matrix_filename(name, format))
+    )
+
+
+def file_md5(path):
+    digest = hashlib.md5()
+    with open(path, "rb") as stream:
+        for block in iter(lambda: stream.read(BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_checksums(path):
+    # md5sum style lines: "<hex digest>  <file name>"
+    checksums = {}
+    with open(path) as stream:
+        for line in stream:
+            fields = line.split()
+            if len(fields) == 2:
+                checksums[os.path.basename(fields[1].lstrip("*"))] = fields[0].lower()
+    return checksums
+
+
+def extract(path, dest):
+    with tarfile.open(path) as archive:
+        if hasattr(tarfile, "data_filter"):
+            archive.extractall(dest, filter="data")
+        else:
+            archive.extractall(dest)
+
+
+def archive_member(archive, name, extension):
+    # the matrix itself, sparse.tamu.edu archives also hold right-hand sides and aux data
+    for member in archive:
+        if member.isfile() and os.path.basename(member.name) == name + extension:
+            return archive.extractfile(member), member.size
+    raise Exception("no {} in the archive of {}".format(name + extension, name))
+
+
+def extract_member(path, name, extension, dest):
+    # only the matrix is written, the rest of the archive is skipped
+    with tarfile.open(path) as archive:
+        member, _ = archive_member(archive, name, extension)
+        out_path = os.path.join(dest, name + extension)
+        with open(out_path, "wb") as out:
+            shutil.copyfileobj(member, out, BLOCK_SIZE)
+    return out_path
+
+
+class DownloadTask:
+    def __init__(self, name, url, path, md5=None) -> None:
+        self.name = name
+        self.url = url
+        self.path = path
+        self.md5 = md5
+        self.size = 0
+        self.seconds = 0.0
+        self.status = "pending"
+        # bytes left on disk and of the matrix text, set by streaming sinks
+        self.disk = None
+        self.text = None
+
+
+class ReceiveStream:
+    # a response read by its consumer, counted and hashed on the way through
+    def __init__(self, response, task, progress) -> None:
+        self.response = response
+        self.task = task
+        self.progress = progress
+        self.md5 = hashlib.md5()
+        self.size = 0
+
+    def read(self, size=-1):
+        data = self.response.read(size)
+        self.md5.update(data)
+        self.size += len(data)
+        self.progress.receive(self.task, len(data))
+        return data
+
+    def drain(self):
+        # the archive may go on after the part the consumer needed
+        while len(self.read(BLOCK_SIZE)) > 0:
+            pass
+
+
+class Progress:
+    # aggregate bytes of every transfer, printed on one line from any thread
+    def __init__(self, tasks, stream=sys.stdout) -> None:
+        self.lock = threading.Lock()
+        self.tasks = tasks
+        self.stream = stream
+        self.totals = {}
+        self.done = {}
+        self.received = 0
+        self.finished = 0
+        self.begin = time.perf_counter()
+        self.printed = 0.0
+
+    def update(self, task, done, total=None):
+        with self.lock:
+            self.done[task.path] = done
+            if total is not None:
+                self.totals[task.path] = total
+            self.__print(False)
+
+    def receive(self, task, size):
+        with self.lock:
+            self.done[task.path] = self.done.get(task.path, 0) + size
+            self.received += size
+            self.__print(False)
+
+    def finish(self):
+        with self.lock:
+            self.finished += 1
+            self.__print(True)
+
+    def close(self):
+        with self.lock:
+            self.__print(True)
+            self.stream.write("\n")
+            self.stream.flush()
+
+    def throughput(self):
+        # resumed and verified bytes are not transferred, keep them out of the rate
+        return self.received / max(time.perf_counter() - self.begin, 1e-9)
+
+    def __print(self, force):
+        now = time.perf_counter()
+        if not force and now - self.printed < 0.2:
+            return
+        self.printed = now
+        self.stream.write(
+            "\r[{}/{} files] {} / {} at {}/s   ".format(
+                self.finished,
+                len(self.tasks),
+                format_size(sum(self.done.values())),
+                format_size(sum(self.totals.values())),
+                format_size(self.throughput()),
+            )
+        )
+        self.stream.flush()
+
+
+class Downloader:
+    def __init__(self, jobs=4, retries=3, timeout=60) -> None:
+        self.jobs = jobs
+        self.retries = retries
+        self.timeout = timeout
+
+    def download(self, tasks):
+        progress = Progress(tasks)
+        with ThreadPoolExecutor(self.jobs) as pool:
+            list(pool.map(lambda task: self.__download(task, progress), tasks))
+        progress.close()
+        return progress
+
+    def stream(self, tasks, sink):
+        # every archive is consumed while it arrives, only the sink output is written
+        progress = Progress(tasks)
+        with ThreadPoolExecutor(self.jobs) as pool:
+            list(pool.map(lambda task: self.__download(task, progress, sink), tasks))
+        progress.close()
+        return progress
+
+    def __download(self, task, progress, sink=None):
+        begin = time.perf_counter()
+        try:
+            if sink is None and self.__verified(task):
+                task.size = os.path.getsize(task.path)
+                task.status = "present"
+                progress.update(task, task.size, task.size)
+                return
+            for attempt in range(self.retries + 1):
+                try:
+                    if sink is None:
+                        self.__fetch(task, progress)
+                    else:
+                        self.__stream(task, progress, sink)
+                    task.status = "done"
+                    break
+                except HTTPError as error:
+                    task.status = "failed: {}".format(error)
+                    # client errors do not go away on retry
+                    if error.code < 500 or attempt == self.retries:
+                        break
+                    time.sleep(min(2**attempt, 30))
+                except (
+                    URLError,
+                    OSError,
+                    ValueError,
+                    http.client.HTTPException,
+                ) as error:
+                    task.status = "failed: {}".format(error)
+                    if attempt < self.retries:
+                        time.sleep(min(2**attempt, 30))
+        except Exception as error:
+            task.status = "failed: {}".format(error)
+        finally:
+            task.seconds = time.perf_counter() - begin
+            progress.finish()
+
+    def __verified(self, task):
+        if not os.path.isfile(task.path):
+            return False
+        md5 = None
+        if os.path.isfile(task.path + MD5_SUFFIX):
+            with open(task.path + MD5_SUFFIX) as stream:
+                md5 = stream.read().split()[0]
+        expect = task.md5 or md5
+        return expect is not None and file_md5(task.path) == expect
+
+    def __fetch(self, task, progress):
+        part = task.path + PART_SUFFIX
+        offset = os.path.getsize(part) if os.path.isfile(part) else 0
+        headers = {"Range": "bytes={}-".format(offset)} if offset > 0 else {}
+        try:
+            response = urlopen(Request(task.url, headers=headers), timeout=self.timeout)
+        except HTTPError as error:
+            # the partial file already holds every byte
+            if error.code == 416 and offset > 0:
+                self.__complete(task, part, None)
+                return
+            raise
+        with response:
+            total = self.__total(response, offset)
+            if response.status != 206:
+                offset = 0
+            progress.update(task, offset, total)
+            with open(part, "ab" if offset > 0 else "wb") as stream:
+                for block in iter(lambda: response.read(BLOCK_SIZE), b""):
+                    stream.write(block)
+                    progress.receive(task, len(block))
+        self.__complete(task, part, total)
+
+    def __stream(self, task, progress, sink):
+        # nothing to resume, a failed transfer starts over
+        progress.update(task, 0)
+        with urlopen(Request(task.url), timeout=self.timeout) as response:
+            total = self.__total(response, 0)
+            progress.update(task, 0, total)
+            source = ReceiveStream(response, task, progress)
+            output = sink(task, source)
+            try:
+                source.drain()
+                if total is not None and source.size != total:
+                    raise ValueError(
+                        "size mismatch, expect {} got {}".format(total, source.size)
+                    )
+                if task.md5 is not None and source.md5.hexdigest() != task.md5:
+                    raise ValueError("md5 mismatch for {}".format(task.name))
+            except BaseException:
+                shutil.rmtree(output, ignore_errors=True)
+                raise
+        os.replace(output, task.path)
+        task.size = source.size
+
+    def __total(self, response, offset):
+        if response.status == 206:
+            content_range = response.headers.get("Content-Range", "")
+            match = re.match(r"bytes (\d+)-\d+/(\d+|\*)", content_range)
+            if match is None or int(match.group(1)) != offset:
+                raise ValueError("unexpected content range: {}".format(content_range))
+            return None if match.group(2) == "*" else int(match.group(2))
+        length = response.headers.get("Content-Length")
+        return None if length is None else int(length)
+
+    def __complete(self, task, part, total):
+        size = os.path.getsize(part)
+        if total is not None and size != total:
+            raise ValueError("size mismatch, expect {} got {}".format(total, size))
+        md5 = file_md5(part)
+        if task.md5 is not None and md5 != task.md5:
+            # a corrupt partial file must not be resumed again
+            os.remove(part)
+            raise ValueError("md5 mismatch for {}".format(task.name))
+        os.replace(part, task.path)
+        with open(task.path + MD5_SUFFIX, "w") as stream:
+            stream.write("{}  {}\n".format(md5, os.path.basename(task.path)))
+        task.size = size
@@ -0,0 +1,346 @@
+#!/usr/bin/env python3
+import json
+import os
+import shutil
+import tempfile
+import numpy as np
+from binary import is_binary_matrix, load_arrays
+from reader import (
+    CHUNK_SIZE,
+    iter_range,
+    parse_mm_entries,
+    read_mm_header,
+)
+
+# entries per block of the file order offsets the coo view reads
+BLOCK_ENTRIES = 4096
+# lines closer than this are read with one request
+RUN_GAP = 1 << 16
+LINE_BYTES = 512
+INDEX_FILE = "index.json"
+INDEX_VERSION = 2
+INDEX_ARRAYS = ["offset", "row_ptr", "col_ptr", "row_refs", "col_refs"]
+
+
+def is_matrix_index(dir_path):
+    try:
+        with open(os.path.join(dir_path, INDEX_FILE)) as meta:
+            return json.load(meta).get("version") == INDEX_VERSION
+    except (OSError, ValueError):
+        return False
+
+
+class MarketSource:
+    # an uncompressed coordinate .mtx file, block offsets are byte offsets of lines
+    def __init__(self, mtx_path) -> None:
+        if mtx_path.endswith((".gz", ".bz2")):
+            raise Exception(
+                "compressed files can not be read at an offset: {}".format(mtx_path)
+            )
+        with open(mtx_path, "rb") as stream:
+            self.header = read_mm_header(stream)
+        if self.header.format != "coordinate":
+            raise Exception("only coordinate files are indexed: {}".format(mtx_path))
+        self.path = mtx_path
+        self.shape = (self.header.rows, self.header.cols)
+        self.symmetry = self.header.symmetry
+        self.end = os.path.getsize(mtx_path)
+
+    def iter_entries(self):
+        # entries with the byte offset of their line, one entry per line is required
+        start = self.header.offset
+        for buf in iter_range(self.path, start, self.end, CHUNK_SIZE):
+            if len(buf.strip()) > 0:
+                row, col, _ = parse_mm_entries(buf, self.header)
+                lines = np.flatnonzero(np.frombuffer(buf, dtype=np.uint8) == 10)
+                offset = np.concatenate(([0], lines + 1))[: row.size] + start
+                if lines.size + (not buf.endswith(b"\n")) != row.size:
+                    raise Exception(
+                        "blank lines between entries, matrix file: {}".format(self.path)
+                    )
+                yield row, col, offset
+            start += len(buf)
+
+    def fetch(self, begin, end):
+        with open(self.path, "rb") as stream:
+            stream.seek(begin)
+            buf = stream.read(end - begin)
+        if len(buf.strip()) == 0:
+            return parse_mm_entries(b"", self.header)
+        return parse_mm_entries(buf, self.header)
+
+    def fetch_at(self, offsets):
+        # the entries on the lines starting at the sorted offsets
+        parts = []
+        runs = np.split(offsets, np.flatnonzero(np.diff(offsets) > RUN_GAP) + 1)
+        with open(self.path, "rb") as stream:
+            for run in runs:
+                if run.size == 0:
+                    continue
+                first, last = int(run[0]), int(run[-1]) - int(run[0])
+                stream.seek(first)
+                buf = stream.read(last + LINE_BYTES)
+                while buf.find(b"\n", last) < 0:
+                    more = stream.read(LINE_BYTES)
+                    if len(more) == 0:
+                        break
+                    buf += more
+                if buf.find(b"\n", last) >= 0:
+                    buf = buf[: buf.find(b"\n", last) + 1]
+                row, col, data = parse_mm_entries(buf, self.header)
+                lines = np.flatnonzero(np.frombuffer(buf, dtype=np.uint8) == 10)
+                starts = np.concatenate(([0], lines + 1))[: row.size] + first
+                pick = np.searchsorted(starts, run)
+                parts.append((row[pick], col[pick], data[pick]))
+        if len(parts) == 0:
+            return parse_mm_entries(b"", self.header)
+        return tuple(np.concatenate(arrays) for arrays in zip(*parts))
+
+
+class BinarySource:
+    # a native binary coo matrix, block offsets are entry positions
+    def __init__(self, dir_path) -> None:
+        meta, self.arrays = load_arrays(dir_path, "r")
+        if meta["layout"] != "coo":
+            raise Exception(
+                "only coo binary matrices are indexed, layout: {}".format(
+                    meta["layout"]
+                )
+            )
+        self.shape = tuple(meta["shape"])
+        self.symmetry = "general"
+        self.end = meta["nnz"]
+
+    def iter_entries(self):
+        step = CHUNK_SIZE // 16
+        for begin in range(0, self.end, step):
+            end = min(begin + step, self.end)
+            yield (
+                np.array(self.arrays["row"][begin:end]),
+                np.array(self.arrays["col"][begin:end]),
+                np.arange(begin, end, dtype=np.int64),
+            )
+
+    def fetch(self, begin, end):
+        return tuple(
+            np.array(self.arrays[name][begin:end]) for name in ["row", "col", "data"]
+        )
+
+    def fetch_at(self, positions):
+        return tuple(
+            np.asarray(self.arrays[name][positions]) for name in ["row", "col", "data"]
+        )
+
+
+def open_source(mtx_path):
+    if is_binary_matrix(mtx_path):
+        return BinarySource(mtx_path)
+    return MarketSource(mtx_path)
+
+
+def expanded(source, row, col, ref):
+    # stored entries and, for symmetric files, their mirrors, a mirror refers to its
+    # stored entry as -(ref + 1)
+    if source.symmetry == "general":
+        return row, col, ref
+    off = row != col
+    return (
+        np.concatenate((row, col[off])),
+        np.concatenate((col, row[off])),
+        np.concatenate((ref, -ref[off] - 1)),
+    )
+
+
+def scatter(refs, fill, keys, values):
+    # counting sort of one chunk into the refs table, file order within a line
+    order = np.argsort(keys, kind="stable")
+    keys, values = keys[order], values[order]
+    lines, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+    rank = np.arange(keys.size) - np.repeat(starts, counts)
+    refs[fill[keys] + rank] = values
+    fill[lines] += counts
+
+
+def build_index(source, dir_path):
+    # the first pass counts the entries of every row and col, the second one sorts
+    # the source positions of the entries by row and by col into row_refs and
+    # col_refs, a line is then read at the positions of its entries only
+    rows, cols = source.shape
+    row_count = np.zeros(rows, dtype=np.int64)
+    col_count = np.zeros(cols, dtype=np.int64)
+    offsets = []
+    stored = 0
+    for row, col, offset in source.iter_entries():
+        # the position of every BLOCK_ENTRIES-th stored entry for the coo view
+        offsets.append(offset[(-stored) % BLOCK_ENTRIES :: BLOCK_ENTRIES])
+        stored += row.size
+        row, col, _ = expanded(source, row, col, offset)
+        row_count += np.bincount(row, minlength=rows)
+        col_count += np.bincount(col, minlength=cols)
+    arrays = {
+        "offset": (
+            np.concatenate(offsets) if len(offsets) > 0 else np.empty(0, np.int64)
+        ),
+        "row_ptr": np.concatenate(([0], np.cumsum(row_count))),
+        "col_ptr": np.concatenate(([0], np.cumsum(col_count))),
+    }
+    for name in INDEX_ARRAYS[:3]:
+        np.save(os.path.join(dir_path, name + ".npy"), arrays[name])
+    nnz = int(arrays["row_ptr"][-1])
+    refs = {
+        by: np.lib.format.open_memmap(
+            os.path.join(dir_path, by + "_refs.npy"), "w+", np.int64, (nnz,)
+        )
+        for by in ["row", "col"]
+    }
+    fill = {"row": arrays["row_ptr"][:-1].copy(), "col": arrays["col_ptr"][:-1].copy()}
+    for row, col, offset in source.iter_entries():
+        row, col, ref = expanded(source, row, col, offset.astype(np.int64))
+        scatter(refs["row"], fill["row"], row, ref)
+        scatter(refs["col"], fill["col"], col, ref)
+    for table in refs.values():
+        table.flush()
+    del refs
+    # index.json is written last, a directory without it is incomplete
+    with open(os.path.join(dir_path, INDEX_FILE), "w") as meta:
+        json.dump(
+            {
+                "version": INDEX_VERSION,
+                "shape": list(source.shape),
+                "nnz": nnz,
+                "stored": stored,
+                "symmetry": source.symmetry,
+                "block": BLOCK_ENTRIES,
+                "end": int(source.end),
+            },
+            meta,
+        )
+
+
+class MatrixIndex:
+    # answers rows or cols by reading the entries the refs point at, and stored
+    # entries by reading the blocks that hold them
+    def __init__(self, dir_path, source) -> None:
+        with open(os.path.join(dir_path, INDEX_FILE)) as meta:
+            self.meta = json.load(meta)
+        for name in INDEX_ARRAYS:
+            setattr(
+                self,
+                name,
+                np.load(os.path.join(dir_path, name + ".npy"), mmap_mode="r"),
+            )
+        self.source = source
+        self.shape = tuple(self.meta["shape"])
+        self.nnz = self.meta["nnz"]
+        self.symmetry = self.meta["symmetry"]
+
+    def entries(self, begin, end):
+        # stored entries [begin, end) in file order
+        block = self.meta["block"]
+        first = begin // block
+        last = -(-end // block)
+        row, col, data = self.source.fetch(
+            int(self.offset[first]),
+            int(self.offset[last]) if last < self.offset.size else self.meta["end"],
+        )
+        skip = begin - first * block
+        return (
+            row[skip : skip + end - begin],
+            col[skip : skip + end - begin],
+            data[skip : skip + end - begin],
+        )
+
+    def lines(self, begin, end, by):
+        # rows (or cols) [begin, end) of the expanded matrix, sorted like a csr/csc
+        ptr, refs = (
+            (self.row_ptr, self.row_refs)
+            if by == "row"
+            else (self.col_ptr, self.col_refs)
+        )
+        refs = np.array(refs[ptr[begin] : ptr[end]])
+        mirrored = refs < 0
+        positions, inverse = np.unique(
+            np.where(mirrored, -refs - 1, refs), return_inverse=True
+        )
+        row, col, data = [array[inverse] for array in self.source.fetch_at(positions)]
+        row, col = np.where(mirrored, col, row), np.where(mirrored, row, col)
+        if self.symmetry == "skew-symmetric":
+            data = np.where(mirrored, -data, data)
+        elif self.symmetry == "hermitian":
+            data = np.where(mirrored, np.conj(data), data)
+        major, minor = (row, col) if by == "row" else (col, row)
+        order = np.lexsort((minor, major))
+        return major[order], minor[order], data[order]
+
+
+class IndexedArray:
+    # one array of a csr, csc or coo view, sliced like the in-memory array
+    def __init__(self, index, by, name) -> None:
+        self.index = index
+        self.by = by
+        self.name = name
+        self.ptr = {"row": index.row_ptr, "col": index.col_ptr}.get(by)
+        self.shape = (index.nnz if by != "entry" else index.meta["stored"],)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            begin, end, step = key.indices(self.shape[0])
+        else:
+            begin = key + self.shape[0] if key < 0 else key
+            end, step = begin + 1, 1
+        if end <= begin:
+            return np.empty(0)
+        if self.by == "entry":
+            arrays = dict(zip(["row", "col", "data"], self.index.entries(begin, end)))
+            first = begin
+        else:
+            # the lines holding the entries, the first one may start before begin
+            line = int(np.searchsorted(self.ptr, begin, "right")) - 1
+            last = int(np.searchsorted(self.ptr, end - 1, "right"))
+            arrays = self.index.lines(line, last, self.by)
+            arrays = dict(zip(["major", "minor", "data"], arrays))
+            first = int(self.ptr[line])
+        values = arrays[self.name][begin - first : end - first : step]
+        return values if isinstance(key, slice) else values[0]
+
+
+class IndexedMatrix:
+    # the arrays a read program shows, only the pointers are held in memory
+    def __init__(self, index, layout) -> None:
+        self.format = layout
+        self.shape = index.shape
+        if layout == "coo":
+            if index.symmetry != "general":
+                raise Exception("the indexed coo view needs a general matrix")
+            self.nnz = index.meta["stored"]
+            for name in ["row", "col", "data"]:
+                setattr(self, name, IndexedArray(index, "entry", name))
+            return
+        by = "row" if layout == "csr" else "col"
+        self.nnz = index.nnz
+        self.indptr = index.row_ptr if by == "row" else index.col_ptr
+        self.indices = IndexedArray(index, by, "minor")
+        self.data = IndexedArray(index, by, "data")
+
+
+def cached_index(cache, mtx_path):
+    # built once next to the cached layouts and evicted with them
+    key_dir = cache.prepare(mtx_path)
+    entry = os.path.join(key_dir, "index")
+    source = open_source(mtx_path)
+    if not is_matrix_index(entry):
+        # an index of an older version is built again
+        shutil.rmtree(entry, ignore_errors=True)
+        tmp = tempfile.mkdtemp(prefix=".tmp-", dir=key_dir)
+        try:
+            build_index(source, tmp)
+            os.rename(tmp, entry)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)
+        except Exception:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        cache.evict()
+    else:
+        os.utime(entry)
+    return MatrixIndex(entry, source)
@@ -0,0 +1,340 @@
+#!/usr/bin/env python3
+import numpy as np
+import scipy.sparse as sparse
+
+# padded slots use this index, products read it from a zero appended to x
+PAD = -1
+# dia and ell refuse layouts that would store more slots per nonzero
+DIA_MAX_FILL = 16
+ELL_MAX_FILL = 16
+# narrowest first, int32 before uint32 so scipy takes the arrays as they are
+INDEX_DTYPES = [np.uint8, np.uint16, np.int32, np.int64]
+# tried narrowest first, float32 before int32 keeps float products in float
+FLOAT_DTYPES = [np.int8, np.int16, np.float32, np.int32]
+INT_DTYPES = [np.int8, np.int16, np.int32, np.int64]
+COMPACT_ARRAYS = {
+    "coo": ["row", "col", "data"],
+    "csr": ["indptr", "indices", "data"],
+    "csc": ["indptr", "indices", "data"],
+}
+
+
+def row_positions(indptr):
+    lengths = np.diff(indptr)
+    return np.arange(indptr[-1], dtype=np.int64) - np.repeat(
+        indptr[:-1].astype(np.int64), lengths
+    )
+
+
+def entry_rows(indptr):
+    return np.repeat(np.arange(indptr.shape[0] - 1), np.diff(indptr))
+
+
+def padded(x):
+    x = np.asarray(x)
+    return np.concatenate([x, np.zeros((1,) + x.shape[1:], dtype=x.dtype)])
+
+
+def csr_bytes(csr):
+    return csr.data.nbytes + csr.indices.nbytes + csr.indptr.nbytes
+
+
+class EllMatrix:
+    format = "ell"
+
+    def __init__(self, coo) -> None:
+        csr = sparse.csr_matrix(coo)
+        csr.sum_duplicates()
+        self.shape = csr.shape
+        self.nnz = csr.nnz
+        lengths = np.diff(csr.indptr)
+        self.width = int(lengths.max()) if lengths.size > 0 else 0
+        if self.shape[0] * self.width > ELL_MAX_FILL * max(self.nnz, 1):
+            raise Exception(
+                "ell layout would store {} slots for {} nonzeros, use sell".format(
+                    self.shape[0] * self.width, self.nnz
+                )
+            )
+        self.indices = np.full(
+            (self.shape[0], self.width), PAD, dtype=csr.indices.dtype
+        )
+        self.data = np.zeros((self.shape[0], self.width), dtype=csr.data.dtype)
+        rows = entry_rows(csr.indptr)
+        positions = row_positions(csr.indptr)
+        self.indices[rows, positions] = csr.indices
+        self.data[rows, positions] = csr.data
+
+    @property
+    def stored(self):
+        return self.data.size
+
+    @property
+    def nbytes(self):
+        return self.indices.nbytes + self.data.nbytes
+
+    def __matmul__(self, x):
+        x = padded(x)
+        if x.ndim == 1:
+            return (self.data * x[self.indices]).sum(axis=1)
+        return np.einsum("rw,rwk->rk", self.data, x[self.indices])
+
+
+class SellMatrix:
+    format = "sell"
+
+    def __init__(self, coo, slice_height=8, sigma=256) -> None:
+        csr = sparse.csr_matrix(coo)
+        csr.sum_duplicates()
+        self.shape = csr.shape
+        self.nnz = csr.nnz
+        self.slice_height = slice_height
+        self.sigma = sigma
+        rows = self.shape[0]
+        lengths = np.diff(csr.indptr)
+        window = np.arange(rows) // sigma
+        self.permutation = np.lexsort((-lengths, window))
+        slots = -(-rows // slice_height) * slice_height
+        sorted_lengths = np.zeros(slots, dtype=np.int64)
+        sorted_lengths[:rows] = lengths[self.permutation]
+        self.slice_width = sorted_lengths.reshape(-1, slice_height).max(axis=1)
+        self.slice_ptr = np.zeros(self.slice_width.size + 1, dtype=np.int64)
+        np.cumsum(self.slice_width * slice_height, out=self.slice_ptr[1:])
+        rank = np.empty(rows, dtype=np.int64)
+        rank[self.permutation] = np.arange(rows)
+        target = rank[entry_rows(csr.indptr)]
+        slot = (
+            self.slice_ptr[target // slice_height]
+            + row_positions(csr.indptr) * slice_height
+            + target % slice_height
+        )
+        self.indices = np.full(self.slice_ptr[-1], PAD, dtype=csr.indices.dtype)
+        self.data = np.zeros(self.slice_ptr[-1], dtype=csr.data.dtype)
+        self.indices[slot] = csr.indices
+        self.data[slot] = csr.data
+        self.__slot_rows = None
+
+    @property
+    def stored(self):
+        return self.data.size
+
+    @property
+    def nbytes(self):
+        return (
+            self.indices.nbytes
+            + self.data.nbytes
+            + self.slice_ptr.nbytes
+            + self.permutation.nbytes
+        )
+
+    def slot_rows(self):
+        # original row of every slot, padding rows past the end map to the last row
+        if self.__slot_rows is None:
+            slot = np.arange(self.stored, dtype=np.int64)
+            slice_id = np.searchsorted(self.slice_ptr, slot, "right") - 1
+            target = (
+                slice_id * self.slice_height
+                + (slot - self.slice_ptr[slice_id]) % self.slice_height
+            )
+            rows = self.shape[0]
+            self.__slot_rows = self.permutation[np.minimum(target, rows - 1)]
+        return self.__slot_rows
+
+    def __matmul__(self, x):
+        x = padded(x)
+        products = self.data.reshape((-1,) + (1,) * (x.ndim - 1)) * x[self.indices]
+        y = np.zeros((self.shape[0],) + x.shape[1:], dtype=products.dtype)
+        np.add.at(y, self.slot_rows(), products)
+        return y
+
+
+class BsrMatrix:
+    format = "bsr"
+
+    def __init__(self, coo, block_size=(4, 4)) -> None:
+        coo = sparse.coo_matrix(coo)
+        coo.sum_duplicates()
+        self.shape = coo.shape
+        self.nnz = coo.nnz
+        self.block_size = tuple(block_size)
+        r, c = self.block_size
+        block_rows = -(-self.shape[0] // r)
+        block_cols = -(-self.shape[1] // c)
+        keys = (coo.row.astype(np.int64) // r) * block_cols + coo.col // c
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        first = np.ones(keys.size, dtype=bool)
+        first[1:] = keys[1:] != keys[:-1]
+        block_id = np.cumsum(first) - 1
+        blocks = keys[first]
+        self.indices = (blocks % block_cols).astype(coo.col.dtype)
+        self.indptr = np.zeros(block_rows + 1, dtype=np.int64)
+        np.cumsum(
+            np.bincount(blocks // block_cols, minlength=block_rows), out=self.indptr[1:]
+        )
+        self.data = np.zeros((blocks.size, r, c), dtype=coo.data.dtype)
+        self.data[block_id, coo.row[order] % r, coo.col[order] % c] = coo.data[order]
+
+    @property
+    def stored(self):
+        return self.data.size
+
+    @property
+    def nbytes(self):
+        return self.indices.nbytes + self.indptr.nbytes + self.data.nbytes
+
+    def __matmul__(self, x):
+        r, c = self.block_size
+        x = np.asarray(x)
+        shape = x.shape[1:]
+        xb = np.zeros((-(-self.shape[1] // c) * c,) + shape, dtype=x.dtype)
+        xb[: self.shape[1]] = x
+        xb = xb.reshape((-1, c) + shape)
+        products = np.einsum("bij,bj...->bi...", self.data, xb[self.indices])
+        y = np.zeros((self.indptr.size - 1, r) + shape, dtype=products.dtype)
+        nonempty = np.diff(self.indptr) > 0
+        if products.shape[0] > 0:
+            y[nonempty] = np.add.reduceat(products, self.indptr[:-1][nonempty], axis=0)
+        return y.reshape((-1,) + shape)[: self.shape[0]]
+
+
+class DiaMatrix:
+    # scipy's dia convention, data[k, j] = A[j - offset, j]
+    format = "dia"
+
+    def __init__(self, coo) -> None:
+        coo = sparse.coo_matrix(coo)
+        coo.sum_duplicates()
+        self.shape = coo.shape
+        self.nnz = coo.nnz
+        diagonals = coo.col.astype(np.int64) - coo.row
+        offsets = np.sort(diagonals)
+        if offsets.size > 0:
+            offsets = offsets[np.concatenate(([True], offsets[1:] != offsets[:-1]))]
+        if offsets.size * self.shape[1] > DIA_MAX_FILL * max(self.nnz, 1):
+            raise Exception(
+                "dia layout would store {} slots for {} nonzeros".format(
+                    offsets.size * self.shape[1], self.nnz
+                )
+            )
+        self.offsets = offsets
+        self.data = np.zeros((offsets.size, self.shape[1]), dtype=coo.data.dtype)
+        self.data[np.searchsorted(offsets, diagonals), coo.col] = coo.data
+
+    @property
+    def stored(self):
+        return self.data.size
+
+    @property
+    def nbytes(self):
+        return self.offsets.nbytes + self.data.nbytes
+
+    def __matmul__(self, x):
+        return sparse.dia_matrix((self.data, self.offsets), shape=self.shape) @ x
+
+
+def narrow_index_dtype(array):
+    top = int(array.max()) if array.size > 0 else 0
+    for dtype in INDEX_DTYPES:
+        if top <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return array.dtype
+
+
+def holds(array, dtype):
+    if np.dtype(dtype).kind in "iu":
+        if array.dtype.kind in "fc" and not np.isfinite(array).all():
+            return False
+        info = np.iinfo(dtype)
+        if array.size > 0 and (array.min() < info.min or array.max() > info.max):
+            return False
+    back = array.astype(dtype).astype(array.dtype)
+    if not np.array_equal(back, array, equal_nan=array.dtype.kind in "fc"):
+        return False
+    # -0.0 equals 0.0, an integer type would keep the value and lose the sign
+    if array.dtype.kind == "c":
+        back, array = np.stack((back.real, back.imag)), np.stack(
+            (array.real, array.imag)
+        )
+    if array.dtype.kind == "f":
+        return np.array_equal(np.signbit(back), np.signbit(array))
+    return True
+
+
+def narrow_value_dtype(array):
+    kind = array.dtype.kind
+    if kind == "c":
+        candidates = [np.complex64]
+    elif kind == "f":
+        candidates = FLOAT_DTYPES
+    elif kind in "iu":
+        candidates = INT_DTYPES
+    else:
+        candidates = []
+    for dtype in candidates:
+        if np.dtype(dtype).itemsize >= array.dtype.itemsize:
+            break
+        if holds(array, dtype):
+            return np.dtype(dtype)
+    return array.dtype
+
+
+class CompactMatrix:
+    # scipy refuses 8 and 16 bit indices, so products run on numpy
+    def __init__(self, mtx) -> None:
+        if mtx.format not in COMPACT_ARRAYS:
+            raise Exception(
+                "only coo, csr and csc compact, format: {}".format(mtx.format)
+            )
+        self.format = mtx.format
+        self.shape = mtx.shape
+        self.nnz = int(mtx.nnz)
+        self.savings = []
+        for name in COMPACT_ARRAYS[self.format]:
+            array = np.asarray(getattr(mtx, name))
+            if name == "data":
+                dtype = narrow_value_dtype(array)
+            else:
+                dtype = narrow_index_dtype(array)
+            compact = array.astype(dtype, copy=False)
+            setattr(self, name, compact)
+            self.savings.append(
+                (name, array.dtype.name, dtype.name, array.nbytes, compact.nbytes)
+            )
+
+    @property
+    def nbytes(self):
+        return sum(saving[4] for saving in self.savings)
+
+    def __matmul__(self, x):
+        x = np.asarray(x)
+        shape = x.shape[1:]
+        data = self.data.reshape((-1,) + (1,) * len(shape))
+        y = np.zeros(
+            (self.shape[0],) + shape, dtype=np.result_type(self.data.dtype, x.dtype)
+        )
+        if self.format == "coo":
+            np.add.at(y, self.row, data * np.take(x, self.col, axis=0))
+        elif self.format == "csc":
+            np.add.at(
+                y, self.indices, data * np.take(x, entry_rows(self.indptr), axis=0)
+            )
+        elif self.nnz > 0:
+            nonempty = np.diff(self.indptr) > 0
+            y[nonempty] = np.add.reduceat(
+                data * np.take(x, self.indices, axis=0),
+                self.indptr[:-1][nonempty],
+                axis=0,
+            )
+        return y
+
+
+def overhead(mtx, csr):
+    stored = getattr(mtx, "stored", mtx.nnz)
+    return {
+        "stored": stored,
+        "padding": stored - mtx.nnz,
+        "fill": mtx.nnz / stored if stored > 0 else 1.0,
+        "bytes": mtx.nbytes,
+        "csr bytes": csr_bytes(csr),
+        "vs csr": mtx.nbytes / max(csr_bytes(csr), 1),
+    }
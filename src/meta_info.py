@@ -1,28 +1,68 @@
 #!/usr/bin/env python3
 import argparse
+import csv
+import glob
+import json
 import os
-import scipy.io as sio
+import sys
+import time
 import scipy.sparse as sparse
 import warnings
-from plot import MatrixMarketReader, MatlabReader
+from cache import MatrixCache, CachedReader
+from binary import is_binary_matrix
+from reader import (
+    MatrixMarketReader,
+    MatlabReader,
+    RbReader,
+    BinaryReader,
+    MatrixMeta,
+)
+from stats import STATISTICS, StructureProfile
+from layout import CompactMatrix
+from util import format_size
+from repository import resolve_matrix
+from profiler import (
+    add_profile_argument,
+    finish_profile,
+    profiled_chunks,
+    stage,
+    start_profile,
+)
 from beautifultable import BeautifulTable
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+BATCH_EXTENSIONS = {
+    "mm": (".mtx", ".mtx.gz", ".mtx.bz2", ".mm"),
+    "mat": (".mat",),
+    "rb": (".rb", ".rb.gz"),
+}
 
 
 class MetaInfo:
-    def __init__(self, name, format, mtx) -> None:
+    def __init__(self, name, format, mtx, statistics=None) -> None:
         isinstance(mtx, sparse.coo_matrix)
         self.name = name
         self.format = format
         self.rows = mtx.shape[0]
         self.cols = mtx.shape[1]
         self.nnz = mtx.nnz
-        self.nnz_per_row = mtx.nnz / mtx.shape[0]
+        self.nnz_per_row = mtx.nnz / mtx.shape[0] if mtx.shape[0] > 0 else 0.0
+        self.statistics = statistics or []
+        # known without the entries when only the header was read
+        self.field = getattr(mtx, "field", None)
+        self.symmetry = getattr(mtx, "symmetry", None)
+        # per array dtypes and bytes before and after --compact narrowed them
+        self.savings = getattr(mtx, "savings", [])
 
     def __header(self):
-        return ["name", "format", "rows", "cols", "nnz", "nnz/row"]
+        header = ["name", "format", "rows", "cols", "nnz", "nnz/row"]
+        if self.field is not None:
+            header += ["field", "symmetry"]
+        return header
 
     def __body(self):
-        return [
+        body = [
             self.name,
             self.format,
             self.rows,
@@ -30,67 +70,342 @@ class MetaInfo:
             self.nnz,
             self.nnz_per_row,
         ]
+        if self.field is not None:
+            body += [self.field, self.symmetry]
+        return body
+
+    def to_dict(self):
+        record = dict(
+            zip(
+                [
+                    "name",
+                    "format",
+                    "rows",
+                    "cols",
+                    "nnz",
+                    "nnz_per_row",
+                    "field",
+                    "symmetry",
+                ],
+                self.__body(),
+            )
+        )
+        for name, value, seconds in self.statistics:
+            record[name] = value
+        if len(self.savings) > 0:
+            record["bytes"] = sum(saving[3] for saving in self.savings)
+            record["compact_bytes"] = sum(saving[4] for saving in self.savings)
+            record["compact_dtypes"] = " ".join(
+                "{}:{}".format(name, dtype) for name, _, dtype, _, _ in self.savings
+            )
+        return record
 
     def __str__(self) -> str:
         warnings.filterwarnings("ignore")
         table = BeautifulTable()
         table.column_headers = self.__header()
         table.append_row(self.__body())
+        text = table.__str__()
+        if len(self.statistics) > 0:
+            table = BeautifulTable(maxwidth=160)
+            table.column_headers = ["statistic", "value", "seconds"]
+            for name, value, seconds in self.statistics:
+                table.append_row([name, value, "{:.4f}".format(seconds)])
+            text += "\n" + table.__str__()
+        if len(self.savings) > 0:
+            text += "\n" + self.__savings().__str__()
         warnings.resetwarnings()
-        return table.__str__()
+        return text
+
+    def __savings(self):
+        table = BeautifulTable()
+        table.column_headers = ["array", "dtype", "compact", "bytes", "compact bytes"]
+        for name, dtype, compact, size, compact_size in self.savings:
+            table.append_row(
+                [name, dtype, compact, format_size(size), format_size(compact_size)]
+            )
+        size = sum(saving[3] for saving in self.savings)
+        compact_size = sum(saving[4] for saving in self.savings)
+        table.append_row(
+            [
+                "total",
+                "",
+                "saved {:.1%}".format(1 - compact_size / size if size > 0 else 0),
+                format_size(size),
+                format_size(compact_size),
+            ]
+        )
+        return table
+
+
+def profile_matrix(reader, mtx_path, statistics):
+    profile = StructureProfile(reader.read_shape(mtx_path), statistics)
+    for row, col, data in profiled_chunks("parse", reader.iter_chunks(mtx_path)):
+        with stage("statistics"):
+            profile.update(row, col, data)
+    return profile
+
+
+def info_matrix(reader, mtx_format, mtx_path, statistics, full=False, compact=False):
+    # entries are only parsed for statistics, the expanded nnz or compact arrays
+    results = None
+    if len(statistics) > 0:
+        profile = profile_matrix(reader, mtx_path, statistics)
+        with stage("statistics"):
+            results = profile.finish()
+        if not compact:
+            return MetaInfo(mtx_path, mtx_format, profile, results)
+    if compact:
+        with stage("compact"):
+            mtx = CompactMatrix(sparse.csr_matrix(reader.read(mtx_path)))
+        return MetaInfo(mtx_path, mtx_format, mtx, results)
+    if full:
+        return MetaInfo(mtx_path, mtx_format, reader.read(mtx_path))
+    meta = reader.read_meta(mtx_path)
+    if meta.symmetry not in (None, "general"):
+        # the header counts one stored triangle, nnz is the expanded count
+        nnz = sum(
+            chunk[0].size
+            for chunk in profiled_chunks("parse", reader.iter_chunks(mtx_path))
+        )
+        meta = MatrixMeta(meta.shape, nnz, meta.field, meta.symmetry)
+    return MetaInfo(mtx_path, mtx_format, meta)
+
+
+def analysis_matrix(
+    reader, mtx_format, mtx_path, statistics, full=False, compact=False
+):
+    return info_matrix(
+        reader, mtx_format, mtx_path, statistics, full, compact
+    ).__str__()
+
+
+def batch_files(mtx_format, patterns):
+    # directories are walked for files of the format, anything else is a glob
+    files = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern) and not is_binary_matrix(pattern):
+            for root, dirs, names in os.walk(pattern):
+                if mtx_format == "bin":
+                    files.update(
+                        os.path.join(root, d)
+                        for d in dirs
+                        if is_binary_matrix(os.path.join(root, d))
+                    )
+                else:
+                    files.update(
+                        os.path.join(root, name)
+                        for name in names
+                        if name.endswith(BATCH_EXTENSIONS[mtx_format])
+                    )
+        else:
+            files.update(glob.glob(pattern, recursive=True))
+    return sorted(files)
+
+
+def batch_record(
+    mtx_format, mtx_path, statistics, workers, cache, full=False, compact=False
+):
+    # runs in a pool process, failures become part of the record
+    begin = time.perf_counter()
+    reader = {
+        "mm": MatrixMarketReader,
+        "mat": MatlabReader,
+        "rb": RbReader,
+        "bin": BinaryReader,
+    }[mtx_format]()
+    reader.workers = workers
+    if cache:
+        reader = CachedReader(reader, MatrixCache())
+    try:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            record = info_matrix(
+                reader, mtx_format, mtx_path, statistics, full, compact
+            ).to_dict()
+        record["error"] = ""
+    except Exception as error:
+        record = {"name": mtx_path, "format": mtx_format, "error": repr(error)}
+    record["seconds"] = round(time.perf_counter() - begin, 4)
+    return record
 
 
 class MatrixMarketMetaInfo:
     reader_ = MatrixMarketReader()
 
-    def analysis(self, mtx_format, mtx_path) -> str:
-        mtx = self.reader_.read(mtx_path)
-        return MetaInfo(mtx_path, mtx_format, mtx).__str__()
+    def analysis(
+        self, mtx_format, mtx_path, statistics=(), full=False, compact=False
+    ) -> str:
+        return analysis_matrix(
+            self.reader_, mtx_format, mtx_path, statistics, full, compact
+        )
 
 
 class MatlabMetaInfo:
     reader_ = MatlabReader()
 
-    def analysis(self, mtx_format, mtx_path) -> str:
-        mtx = self.reader_.read(mtx_path)
-        return MetaInfo(mtx_path, mtx_format, mtx).__str__()
+    def analysis(
+        self, mtx_format, mtx_path, statistics=(), full=False, compact=False
+    ) -> str:
+        return analysis_matrix(
+            self.reader_, mtx_format, mtx_path, statistics, full, compact
+        )
+
+
+class RbMetaInfo:
+    reader_ = RbReader()
+
+    def analysis(
+        self, mtx_format, mtx_path, statistics=(), full=False, compact=False
+    ) -> str:
+        return analysis_matrix(
+            self.reader_, mtx_format, mtx_path, statistics, full, compact
+        )
+
+
+class BinaryMetaInfo:
+    reader_ = BinaryReader()
+
+    def analysis(
+        self, mtx_format, mtx_path, statistics=(), full=False, compact=False
+    ) -> str:
+        return analysis_matrix(
+            self.reader_, mtx_format, mtx_path, statistics, full, compact
+        )
 
 
 class MetaInfoProgram:
     def __init__(self) -> None:
-        self.__info_factory = {"mm": MatrixMarketMetaInfo(), "mat": MatlabMetaInfo()}
+        self.__info_factory = {
+            "mm": MatrixMarketMetaInfo(),
+            "mat": MatlabMetaInfo(),
+            "rb": RbMetaInfo(),
+            "bin": BinaryMetaInfo(),
+        }
         self.__mtx_format = ""
         self.__mtx_file = ""
+        self.__workers = 1
+        self.__cache = True
+        self.__statistics = []
+        self.__batch = None
+        self.__jobs = 1
+        self.__output = None
+        self.__output_format = "jsonl"
+        self.__full = False
+        self.__compact = False
+        self.__profile = None
         pass
 
     def run(self, parser):
         self.__parse_args(parser)
         self.__check_args()
-        self.__print()
+        start_profile(self.__profile)
+        if self.__batch is not None:
+            # matrices are read in pool processes, only the batch as a whole is timed
+            with stage("batch"):
+                self.__run_batch()
+        else:
+            self.__print()
+        finish_profile(self.__profile)
 
     def __parse_args(self, parser):
         parser.add_argument(
             "--format",
-            help="sparse matrix format",
+            help="sparse matrix format, taken from the repository with --name",
             type=str,
-            required=True,
             choices=self.__info_factory.keys(),
         )
+        inputs = parser.add_mutually_exclusive_group(required=True)
+        inputs.add_argument("--file", help="sparse matrix file", type=str)
+        inputs.add_argument(
+            "--name", help="matrix name (or group/name) in the repository", type=str
+        )
+        inputs.add_argument(
+            "--batch",
+            help="directories or glob patterns analyzed as one batch",
+            type=str,
+            nargs="+",
+        )
+        parser.add_argument(
+            "--workers", help="parallel parsing processes", type=int, default=1
+        )
+        parser.add_argument(
+            "--jobs",
+            help="matrices analyzed at once in batch mode",
+            type=int,
+            default=1,
+        )
+        parser.add_argument(
+            "--output", help="batch result file, stdout by default", type=str
+        )
+        parser.add_argument(
+            "--output-format",
+            help="batch result format",
+            type=str,
+            default="jsonl",
+            choices=["jsonl", "csv"],
+        )
+        parser.add_argument(
+            "--no-cache", help="skip the binary parse cache", action="store_true"
+        )
+        parser.add_argument(
+            "--full",
+            help="parse the entries for the expanded nnz instead of reading the header",
+            action="store_true",
+        )
+        parser.add_argument(
+            "--compact",
+            help="report the memory csr saves with the narrowest lossless index and value types",
+            action="store_true",
+        )
         parser.add_argument(
-            "--file", help="sparse matrix file", type=str, required=True
+            "--stats",
+            help="structural statistics computed in one pass over the entries",
+            type=str,
+            nargs="+",
+            default=[],
+            choices=STATISTICS + ["all"],
         )
+        add_profile_argument(parser)
         args = parser.parse_args()
+        if args.name is not None:
+            args.file, args.format = resolve_matrix(args.name, args.format)
+        elif args.format is None:
+            raise Exception("--file and --batch need --format")
         self.__mtx_format = args.format
         self.__mtx_file = args.file
+        self.__workers = args.workers
+        self.__cache = not args.no_cache
+        self.__statistics = STATISTICS if "all" in args.stats else args.stats
+        self.__batch = args.batch
+        self.__jobs = args.jobs
+        self.__output = args.output
+        self.__output_format = args.output_format
+        self.__full = args.full
+        self.__compact = args.compact
+        self.__profile = args.profile
 
     def __check_args(self):
-        if os.path.isfile(self.__mtx_file) is False:
+        if self.__jobs < 1:
+            raise Exception("jobs must be positive, jobs: {}".format(self.__jobs))
+        if self.__batch is not None:
+            self.__batch = batch_files(self.__mtx_format, self.__batch)
+            if len(self.__batch) == 0:
+                raise Exception("no sparse matrix file matches the batch patterns")
+        elif (
+            os.path.isfile(self.__mtx_file) is False
+            and is_binary_matrix(self.__mtx_file) is False
+        ):
             raise Exception(
                 "sparse matrix file is not exists, matrix file: {}".format(
                     self.__mtx_file
                 )
             )
-        if self.__mtx_format == "mat":
+        if self.__workers < 1:
+            raise Exception(
+                "workers must be positive, workers: {}".format(self.__workers)
+            )
+        if self.__mtx_format == "mat" and self.__batch is None:
             warnings.warn(
                 "only the matlab-format sparse matrix downloaded form sparse.tamu.edu is supported!!!",
                 RuntimeWarning,
@@ -115,8 +430,16 @@ class MetaInfoProgram:
 
     def __print(self):
         try:
-            meta_info = self.__info_factory[self.__mtx_format].analysis(
-                self.__mtx_format, self.__mtx_file
+            info = self.__info_factory[self.__mtx_format]
+            info.reader_.workers = self.__workers
+            if self.__cache:
+                info.reader_ = CachedReader(info.reader_, MatrixCache())
+            meta_info = info.analysis(
+                self.__mtx_format,
+                self.__mtx_file,
+                self.__statistics,
+                self.__full,
+                self.__compact,
             )
         except KeyError:
             raise Exception(
@@ -132,6 +455,98 @@ class MetaInfoProgram:
             )
         print(meta_info)
 
+    def __run_batch(self):
+        # records are written as soon as each matrix finishes, in completion order
+        begin = time.perf_counter()
+        stream = (
+            sys.stdout
+            if self.__output is None
+            else open(self.__output, "w", newline="")
+        )
+        fields = (
+            ["name", "format", "rows", "cols", "nnz", "nnz_per_row"]
+            + (
+                []
+                if self.__full or self.__statistics or self.__compact
+                else ["field", "symmetry"]
+            )
+            + self.__statistics
+            + (["bytes", "compact_bytes", "compact_dtypes"] if self.__compact else [])
+            + ["seconds", "error"]
+        )
+        writer = None
+        if self.__output_format == "csv":
+            writer = csv.DictWriter(stream, fields, extrasaction="ignore")
+            writer.writeheader()
+        failed = 0
+        try:
+            for record in self.__batch_records():
+                failed += 1 if record["error"] else 0
+                if writer is not None:
+                    writer.writerow(record)
+                else:
+                    stream.write(json.dumps(record) + "\n")
+                stream.flush()
+        finally:
+            if stream is not sys.stdout:
+                stream.close()
+        print(
+            "{} matrices, {} failed in {:.3f}s".format(
+                len(self.__batch), failed, time.perf_counter() - begin
+            ),
+            file=sys.stderr,
+        )
+
+    def __batch_records(self):
+        # a worker killed on one matrix breaks the pool and fails every pending
+        # future, those files run again one at a time, so the first of them to
+        # break that pool is the one that died, its error is recorded and the rest
+        # go back to a pool of --jobs
+        pending = list(self.__batch)
+        jobs = self.__jobs
+        while len(pending) > 0:
+            broken = []
+            with ProcessPoolExecutor(jobs) as pool:
+                futures = {
+                    pool.submit(
+                        batch_record,
+                        self.__mtx_format,
+                        mtx_file,
+                        self.__statistics,
+                        self.__workers,
+                        self.__cache,
+                        self.__full,
+                        self.__compact,
+                    ): mtx_file
+                    for mtx_file in pending
+                }
+                for future in as_completed(futures):
+                    try:
+                        yield future.result()
+                    except BrokenProcessPool:
+                        broken.append(futures[future])
+                    except Exception as error:
+                        yield self.__error_record(futures[future], error)
+            order = {mtx_file: i for i, mtx_file in enumerate(pending)}
+            broken.sort(key=order.get)
+            if len(broken) > 0 and jobs == 1:
+                yield self.__error_record(
+                    broken[0], "worker process died, out of memory or crashed"
+                )
+                broken = broken[1:]
+                jobs = self.__jobs
+            elif len(broken) > 0:
+                jobs = 1
+            pending = broken
+
+    def __error_record(self, mtx_file, error):
+        return {
+            "name": mtx_file,
+            "format": self.__mtx_format,
+            "error": error if isinstance(error, str) else repr(error),
+            "seconds": None,
+        }
+
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
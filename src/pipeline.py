@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+import os
+import shutil
+import tarfile
+import tempfile
+import numpy as np
+import scipy.sparse as sparse
+from downloader import MEMBER_EXTENSIONS, archive_member
+from binary import matrix_bytes, open_array, save_matrix, save_meta, truncate_array
+from reader import expand_symmetric, iter_mm_entries, parse_rb, read_mm_header
+
+
+def stream_mm_binary(stream, out_dir, chunk_size):
+    # entries go straight into memory-mapped coo arrays, symmetric files are sized
+    # for both triangles and cut to the expanded count at the end
+    header = read_mm_header(stream)
+    if header.format != "coordinate":
+        raise Exception("only coordinate matrix market files are streamed")
+    bound = header.nnz * (1 if header.symmetry == "general" else 2)
+    names = ["row", "col", "data"]
+    dtypes = [header.index_dtype(), header.index_dtype(), header.value_dtype()]
+    arrays = [
+        open_array(out_dir, name, dtype, bound) for name, dtype in zip(names, dtypes)
+    ]
+    offset = 0
+    for chunk in iter_mm_entries(stream, header, chunk_size):
+        chunk = expand_symmetric(*chunk, header.symmetry)
+        end = offset + chunk[0].size
+        if end > bound:
+            raise Exception("matrix market file has more entries than its size line")
+        for array, values in zip(arrays, chunk):
+            array[offset:end] = values
+        offset = end
+    for array in arrays:
+        if isinstance(array, np.memmap):
+            array.flush()
+    del arrays
+    if bound > 0:
+        for name in names:
+            truncate_array(out_dir, name, offset)
+    save_meta(out_dir, "coo", (header.rows, header.cols), offset)
+
+
+def stream_rb_binary(stream, out_dir):
+    # rutherford-boeing sections are not in entry order, the member is parsed in memory
+    header, csc = parse_rb(np.frombuffer(stream.read(), dtype=np.uint8))
+    coo = csc.tocoo()
+    row, col, data = expand_symmetric(coo.row, coo.col, coo.data, header.symmetry)
+    save_matrix(out_dir, sparse.coo_matrix((data, (row, col)), shape=csc.shape))
+
+
+def binary_sink(format, chunk_size=1 << 24):
+    # consumes an archive while it downloads and leaves a native binary coo matrix,
+    # the downloader moves it to the task path once the transfer is verified
+    extension = MEMBER_EXTENSIONS[format]
+
+    def sink(task, stream):
+        tmp = tempfile.mkdtemp(
+            prefix=".tmp-", dir=os.path.dirname(os.path.abspath(task.path))
+        )
+        # mkdtemp directories are private, the matrix is not
+        os.chmod(tmp, 0o755)
+        try:
+            with tarfile.open(fileobj=stream, mode="r|gz") as archive:
+                member, task.text = archive_member(archive, task.name, extension)
+                if format == "MM":
+                    stream_mm_binary(member, tmp, chunk_size)
+                else:
+                    stream_rb_binary(member, tmp)
+            task.disk = matrix_bytes(tmp)
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+        return tmp
+
+    return sink
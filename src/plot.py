@@ -1,76 +1,244 @@
 #!/usr/bin/env python3
 import argparse
 import os
-import scipy.io as sio
 import scipy.sparse as sparse
 import numpy as np
 import warnings
-from matplotlib.pyplot import figure, show, title
+from matplotlib.colors import LogNorm
+from matplotlib.pyplot import figure, show, title, switch_backend
+from cache import MatrixCache, CachedReader
+from binary import is_binary_matrix
+from reader import (
+    MatrixMarketReader,
+    MatlabReader,
+    RbReader,
+    BinaryReader,
+)
+from reorder import METHODS, order_matrix
+from repository import resolve_matrix
+from sample import sample_matrix
+from profiler import (
+    add_profile_argument,
+    finish_profile,
+    profiled_chunks,
+    stage,
+    start_profile,
+)
 
 
-# basic class
-class SparseMatrixReader:
-    def read(self, mtx_path):
-        pass
-
-
-class MatrixMarketReader(SparseMatrixReader):
-    def read(self, mtx_path):
-        return sio.mmread(mtx_path)
+def density_grid(shape, pixels):
+    # one bin per pixel along the longer side, never more bins than rows or cols
+    scale = min(1.0, pixels / max(shape[0], shape[1], 1))
+    height = max(1, int(np.ceil(shape[0] * scale)))
+    width = max(1, int(np.ceil(shape[1] * scale)))
+    return height, width
 
 
-class MatlabReader(SparseMatrixReader):
-    def read(self, mtx_path):
-        mtx = sio.loadmat(mtx_path)
-        mtx = mtx["Problem"]["A"][0][0]
-        mtx = sparse.csc_matrix(mtx).tocoo()
-        return mtx
+def bin_density(chunks, shape, grid):
+    counts = np.zeros(grid[0] * grid[1], dtype=np.int64)
+    for row, col, _ in chunks:
+        y = row.astype(np.int64) * grid[0] // shape[0]
+        x = col.astype(np.int64) * grid[1] // shape[1]
+        counts += np.bincount(y * grid[1] + x, minlength=counts.size)
+    return counts.reshape(grid)
 
 
 class PlotProgram:
     def __init__(self) -> None:
-        self.__reader_factory = {"mm": MatrixMarketReader(), "mat": MatlabReader()}
+        self.__reader_factory = {
+            "mm": MatrixMarketReader(),
+            "mat": MatlabReader(),
+            "rb": RbReader(),
+            "bin": BinaryReader(),
+        }
         self.__mtx_format = ""
         self.__mtx_file = ""
+        self.__workers = 1
+        self.__cache = True
+        self.__render = "spy"
+        self.__pixels = 1024
+        self.__output = None
+        self.__reorder = None
+        self.__permutation_file = None
+        self.__rank = None
+        self.__sample = None
+        self.__sampled = None
+        self.__profile = None
         pass
 
     def run(self, parser):
         self.__parse_args(parser)
         self.__check_args()
-        mtx = self.__read_mtx()
-        self.__plot(mtx)
+        start_profile(self.__profile)
+        if self.__output is not None:
+            switch_backend("Agg")
+        mtx = None
+        if self.__reorder is not None or self.__permutation_file is not None:
+            mtx = self.__read_mtx()
+            self.__set_permutation(mtx)
+        if self.__render == "density" and self.__sample is None:
+            self.__plot_density()
+        elif self.__render == "density":
+            mtx = self.__read_mtx() if mtx is None else mtx
+            self.__plot_density_sample(mtx)
+        else:
+            mtx = self.__read_mtx() if mtx is None else mtx
+            if self.__rank is not None:
+                with stage("permute"):
+                    mtx = sparse.coo_matrix(
+                        (mtx.data, (self.__rank[mtx.row], self.__rank[mtx.col])),
+                        shape=mtx.shape,
+                    )
+            self.__plot(mtx)
+        finish_profile(self.__profile)
 
     def __parse_args(self, parser):
         parser.add_argument(
             "--format",
-            help="sparse matrix format",
+            help="sparse matrix format, taken from the repository with --name",
             type=str,
-            required=True,
             choices=self.__reader_factory.keys(),
         )
+        inputs = parser.add_mutually_exclusive_group(required=True)
+        inputs.add_argument("--file", help="sparse matrix file", type=str)
+        inputs.add_argument(
+            "--name", help="matrix name (or group/name) in the repository", type=str
+        )
         parser.add_argument(
-            "--file", help="sparse matrix file", type=str, required=True
+            "--workers", help="parallel parsing processes", type=int, default=1
         )
+        parser.add_argument(
+            "--no-cache", help="skip the binary parse cache", action="store_true"
+        )
+        parser.add_argument(
+            "--render",
+            help="spy draws every nonzero, density bins them into pixels",
+            type=str,
+            default="spy",
+            choices=["spy", "density"],
+        )
+        parser.add_argument(
+            "--pixels",
+            help="density grid size of the longer side",
+            type=int,
+            default=1024,
+        )
+        parser.add_argument(
+            "--output", help="save the image instead of showing it", type=str
+        )
+        permutation = parser.add_mutually_exclusive_group()
+        permutation.add_argument(
+            "--reorder",
+            help="plot the matrix under a bandwidth-reducing ordering",
+            type=str,
+            choices=METHODS,
+        )
+        permutation.add_argument(
+            "--permutation",
+            help="plot under a permutation written by reorder.py",
+            type=str,
+        )
+        parser.add_argument(
+            "--sample",
+            help="plot N distinct nonzeros drawn at random (all when N exceeds nnz) instead of parsing the whole matrix",
+            type=int,
+        )
+        add_profile_argument(parser)
         args = parser.parse_args()
+        if args.name is not None:
+            args.file, args.format = resolve_matrix(args.name, args.format)
+        elif args.format is None:
+            raise Exception("--file needs --format")
         self.__mtx_format = args.format
         self.__mtx_file = args.file
+        self.__workers = args.workers
+        self.__cache = not args.no_cache
+        self.__render = args.render
+        self.__pixels = args.pixels
+        self.__output = args.output
+        self.__reorder = args.reorder
+        self.__permutation_file = args.permutation
+        self.__sample = args.sample
+        self.__profile = args.profile
 
     def __check_args(self):
-        if os.path.isfile(self.__mtx_file) is False:
+        if (
+            os.path.isfile(self.__mtx_file) is False
+            and is_binary_matrix(self.__mtx_file) is False
+        ):
             raise Exception(
                 "sparse matrix file is not exists, matrix file: {}".format(
                     self.__mtx_file
                 )
             )
+        if self.__workers < 1:
+            raise Exception(
+                "workers must be positive, workers: {}".format(self.__workers)
+            )
+        if self.__pixels < 1:
+            raise Exception("pixels must be positive, pixels: {}".format(self.__pixels))
+        if self.__sample is not None and self.__sample < 1:
+            raise Exception("sample must be positive, sample: {}".format(self.__sample))
+        if self.__sample is not None and self.__reorder is not None:
+            raise Exception("--reorder orders every nonzero, it does not take --sample")
         if self.__mtx_format == "mat":
             warnings.warn(
                 "only the matlab-format sparse matrix downloaded form sparse.tamu.edu is supported!!!",
                 RuntimeWarning,
             )
 
+    def __set_permutation(self, mtx):
+        if self.__reorder is not None:
+            with stage("reorder", method=self.__reorder):
+                permutation = order_matrix(mtx, self.__reorder)
+        else:
+            permutation = np.loadtxt(self.__permutation_file, dtype=np.int64, ndmin=1)
+        if mtx.shape[0] != mtx.shape[1] or not np.array_equal(
+            np.sort(permutation), np.arange(mtx.shape[0])
+        ):
+            raise Exception(
+                "permutation does not match the matrix, matrix file: {}".format(
+                    self.__mtx_file
+                )
+            )
+        self.__rank = np.empty(permutation.size, dtype=np.int64)
+        self.__rank[permutation] = np.arange(permutation.size)
+
+    def __permuted(self, chunks):
+        for row, col, data in chunks:
+            yield self.__rank[row], self.__rank[col], data
+
+    def __title(self):
+        name = self.__mtx_file
+        if self.__reorder is not None:
+            name = "{} ({})".format(self.__mtx_file, self.__reorder)
+        if self.__permutation_file is not None:
+            name = "{} ({})".format(self.__mtx_file, self.__permutation_file)
+        if self.__sampled is not None:
+            name += "\n{}".format(self.__sampled)
+        return name
+
+    def __reader(self):
+        reader = self.__reader_factory[self.__mtx_format]
+        reader.workers = self.__workers
+        if self.__cache:
+            reader = CachedReader(reader, MatrixCache())
+        return reader
+
     def __read_mtx(self):
         try:
-            mtx = self.__reader_factory[self.__mtx_format].read(self.__mtx_file)
+            if self.__sample is not None:
+                # the sample is drawn from the file, the cache holds whole matrices
+                with stage("sample", count=self.__sample):
+                    self.__sampled = sample_matrix(
+                        self.__reader_factory[self.__mtx_format],
+                        self.__mtx_file,
+                        self.__sample,
+                    )
+                print(self.__sampled)
+                return self.__sampled.coo
+            with stage("read"):
+                mtx = self.__reader().read(self.__mtx_file)
         except KeyError:
             raise Exception(
                 "unsupported sparse matrix format, sparse matrix format: {}".format(
@@ -87,11 +255,70 @@ class PlotProgram:
 
     def __plot(self, mtx):
         assert isinstance(mtx, sparse.coo_matrix)
+        with stage("render", nnz=mtx.nnz):
+            fig = figure()
+            ax1 = fig.add_subplot()
+            ax1.spy(mtx, markersize=1)
+            title(self.__title())
+        self.__show(fig)
+
+    def __plot_density(self):
+        try:
+            reader = self.__reader()
+            shape = reader.read_shape(self.__mtx_file)
+            grid = density_grid(shape, self.__pixels)
+            chunks = profiled_chunks("parse", reader.iter_chunks(self.__mtx_file))
+            if self.__rank is not None:
+                chunks = self.__permuted(chunks)
+            with stage("bin", grid=list(grid)):
+                counts = bin_density(chunks, shape, grid)
+        except Exception:
+            raise Exception(
+                "illegal matrix, sparse matrix format: {}, sparse matrix file: {}".format(
+                    self.__mtx_format, self.__mtx_file
+                )
+            )
+        with stage("render", pixels=int(counts.size)):
+            fig = self.__draw_density(counts, shape)
+        self.__show(fig)
+
+    def __plot_density_sample(self, mtx):
+        # sampled counts are scaled by the sampling rate to estimate the full ones
+        shape = mtx.shape
+        grid = density_grid(shape, self.__pixels)
+        chunks = [(mtx.row, mtx.col, mtx.data)]
+        if self.__rank is not None:
+            chunks = self.__permuted(chunks)
+        with stage("bin", grid=list(grid)):
+            counts = bin_density(chunks, shape, grid) / self.__sampled.rate
+        with stage("render", pixels=int(counts.size)):
+            fig = self.__draw_density(counts, shape, "estimated nnz per pixel")
+        self.__show(fig)
+
+    def __draw_density(self, counts, shape, label="nnz per pixel"):
         fig = figure()
         ax1 = fig.add_subplot()
-        ax1.spy(mtx, markersize=1)
-        title(self.__mtx_file)
-        show()
+        # log scale keeps sparse regions visible next to dense blocks
+        image = ax1.imshow(
+            np.ma.masked_equal(counts, 0),
+            cmap="viridis",
+            norm=LogNorm(vmin=1, vmax=max(1, counts.max())),
+            extent=(0, shape[1], shape[0], 0),
+            interpolation="nearest",
+            aspect="equal",
+        )
+        fig.colorbar(image, ax=ax1, label=label)
+        title(self.__title())
+        return fig
+
+    def __show(self, fig):
+        if self.__output is None:
+            # the window stays open until it is closed, it is not part of the profile
+            finish_profile(self.__profile)
+            show()
+        else:
+            with stage("save"):
+                fig.savefig(self.__output, dpi=200)
 
 
 if __name__ == "__main__":
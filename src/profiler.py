@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import warnings
+from contextlib import contextmanager
+from functools import wraps
+from beautifultable import BeautifulTable
+from util import format_size
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+
+def peak_rss():
+    # process high-water mark so far, ru_maxrss is KB on linux and bytes on macos
+    if resource is None:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Stage:
+    def __init__(self, name, begin, parents, args) -> None:
+        self.name = name
+        self.begin = begin
+        self.end = begin
+        # names of the enclosing stages, outermost first
+        self.path = tuple(parent.name for parent in parents) + (name,)
+        self.args = args
+        self.thread = threading.get_ident()
+        # traced bytes when the stage began and the highest count inside it, none
+        # for stages timed by their caller
+        self.traced = 0
+        self.peak = None
+        self.rss = 0
+
+    @property
+    def seconds(self):
+        return self.end - self.begin
+
+    @property
+    def allocated(self):
+        return None if self.peak is None else max(0, self.peak - self.traced)
+
+
+class Profiler:
+    # stages nest, each one records wall time, the peak rss at its end and the
+    # most bytes it held above what was allocated when it began
+    def __init__(self) -> None:
+        self.enabled = False
+        self.stages = []
+        self.origin = time.perf_counter()
+        self.__local = threading.local()
+        self.__lock = threading.Lock()
+
+    def start(self):
+        self.enabled = True
+        self.stages = []
+        self.origin = time.perf_counter()
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stop(self):
+        self.enabled = False
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    def __stack(self):
+        if not hasattr(self.__local, "stack"):
+            self.__local.stack = []
+        return self.__local.stack
+
+    def enter(self, name, **args):
+        stack = self.__stack()
+        stage = Stage(name, time.perf_counter(), stack, args)
+        stage.traced, peak = tracemalloc.get_traced_memory()
+        # the parent keeps the peak reached before its child resets it
+        if len(stack) > 0:
+            stack[-1].peak = max(stack[-1].peak, peak)
+        stage.peak = stage.traced
+        # python 3.8 has no reset_peak, a stage's peak there can be one reached
+        # by an earlier stage
+        if hasattr(tracemalloc, "reset_peak"):
+            tracemalloc.reset_peak()
+        stack.append(stage)
+        return stage
+
+    def exit(self, stage):
+        stack = self.__stack()
+        _, peak = tracemalloc.get_traced_memory()
+        stage.end = time.perf_counter()
+        stage.peak = max(stage.peak, peak)
+        stage.rss = peak_rss()
+        stack.remove(stage)
+        if len(stack) > 0:
+            stack[-1].peak = max(stack[-1].peak, stage.peak)
+        with self.__lock:
+            self.stages.append(stage)
+
+    @contextmanager
+    def stage(self, name, **args):
+        if not self.enabled:
+            yield None
+            return
+        stage = self.enter(name, **args)
+        try:
+            yield stage
+        finally:
+            self.exit(stage)
+
+    def record(self, name, begin, **args):
+        # a stage its caller already timed with time.perf_counter(), its memory is unknown
+        if not self.enabled:
+            return
+        stage = Stage(name, begin, self.__stack(), args)
+        stage.end = time.perf_counter()
+        stage.rss = peak_rss()
+        with self.__lock:
+            self.stages.append(stage)
+
+    def trace(self):
+        # chrome trace event format, complete events plus an rss counter
+        events = []
+        pid = os.getpid()
+        for stage in sorted(self.stages, key=lambda stage: stage.begin):
+            ts = (stage.begin - self.origin) * 1e6
+            events.append(
+                {
+                    "name": stage.name,
+                    "cat": "stage",
+                    "ph": "X",
+                    "ts": ts,
+                    "dur": stage.seconds * 1e6,
+                    "pid": pid,
+                    "tid": stage.thread,
+                    "args": dict(
+                        stage.args, allocated=stage.allocated, peak_rss=stage.rss
+                    ),
+                }
+            )
+            events.append(
+                {
+                    "name": "peak rss",
+                    "ph": "C",
+                    "ts": ts + stage.seconds * 1e6,
+                    "pid": pid,
+                    "args": {"bytes": stage.rss},
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write(self, trace_path):
+        with open(trace_path, "w") as trace:
+            json.dump(self.trace(), trace)
+
+    def summary(self):
+        # stages with the same path are summed, shares are of the outermost stages
+        rows = {}
+        total = sum(stage.seconds for stage in self.stages if len(stage.path) == 1)
+        for stage in sorted(self.stages, key=lambda stage: stage.begin):
+            key = stage.path
+            if key not in rows:
+                rows[key] = [0, 0.0, None, 0]
+            row = rows[key]
+            row[0] += 1
+            row[1] += stage.seconds
+            if stage.allocated is not None:
+                row[2] = max(row[2] or 0, stage.allocated)
+            row[3] = max(row[3], stage.rss)
+        warnings.filterwarnings("ignore")
+        table = BeautifulTable(maxwidth=160)
+        table.column_headers = [
+            "stage",
+            "calls",
+            "seconds",
+            "share",
+            "allocated",
+            "peak rss",
+        ]
+        table.column_alignments["stage"] = BeautifulTable.ALIGN_LEFT
+        for path, (calls, seconds, allocated, rss) in rows.items():
+            table.append_row(
+                [
+                    " > ".join(path),
+                    calls,
+                    "{:.4f}".format(seconds),
+                    "{:.1%}".format(seconds / total if total > 0 else 0),
+                    "-" if allocated is None else format_size(allocated),
+                    format_size(rss),
+                ]
+            )
+        warnings.resetwarnings()
+        return table.__str__()
+
+
+PROFILER = Profiler()
+
+
+def stage(name, **args):
+    return PROFILER.stage(name, **args)
+
+
+def profiled(name):
+    # readers and transforms mark a method as a stage, free while profiling is off
+    def decorator(function):
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if not PROFILER.enabled:
+                return function(*args, **kwargs)
+            with PROFILER.stage(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def profiled_chunks(name, chunks):
+    # every chunk a reader yields is its own stage, the consumer's work is not counted
+    iterator = iter(chunks)
+    while True:
+        with PROFILER.stage(name):
+            try:
+                chunk = next(iterator)
+            except StopIteration:
+                return
+        yield chunk
+
+
+def add_profile_argument(parser):
+    parser.add_argument(
+        "--profile",
+        help="write a chrome trace of the stages to this file and print a summary",
+        type=str,
+    )
+
+
+def start_profile(trace_path):
+    if trace_path is not None:
+        PROFILER.start()
+
+
+def finish_profile(trace_path):
+    if trace_path is None or not PROFILER.enabled:
+        return
+    PROFILER.stop()
+    PROFILER.write(trace_path)
+    print(PROFILER.summary(), file=sys.stderr)
+    print("trace: {}".format(trace_path), file=sys.stderr)
@@ -1,15 +1,25 @@
 #!/usr/bin/env python3
-import argparse
-import os
 import warnings
-import scipy.io as sio
-import scipy.sparse as sparse
-from prompt_toolkit import PromptSession, shortcuts
+from prompt_toolkit import PromptSession
 from beautifultable import BeautifulTable
 from abc import abstractmethod
-from download import ArgumentParser, Command, ExitCommand, ClearCommand
-from plot import MatrixMarketReader, MatlabReader
+from command import ArgumentParser, Command, ExitCommand, ClearCommand
+from cache import MatrixCache, CachedReader
+from index import IndexedMatrix, cached_index
+from binary import LAYOUT_ARRAYS, is_binary_matrix, load_meta, load_mapped
+from reader import MatrixMarketReader, MatlabReader, RbReader, BinaryReader
 from meta_info import MetaInfo
+from repository import resolve_matrix
+from sample import sample_matrix
+from profiler import add_profile_argument, finish_profile, stage, start_profile
+from layout import (
+    CompactMatrix,
+    EllMatrix,
+    SellMatrix,
+    BsrMatrix,
+    DiaMatrix,
+    overhead,
+)
 
 
 class ReadProgram:
@@ -21,6 +31,9 @@ class ReadProgram:
     def set_mtx(self, coo_mtx):
         pass
 
+    def configure(self, args):
+        pass
+
     @abstractmethod
     def set_meta_info(self, meta_info):
         self.meta_info = meta_info
@@ -197,45 +210,299 @@ class ReadCscProgram(ReadProgram):
         super().run(parser, commands)
 
 
-if __name__ == "__main__":
-    parser = ArgumentParser(prog="Matrix Market Read Program")
-    read_factory = {"mm": MatrixMarketReader(), "mat": MatlabReader()}
-    as_factory = {
-        "csr": ReadCsrProgram(),
-        "coo": ReadCooProgram(),
-        "csc": ReadCscProgram(),
-    }
-    parser.add_argument(
-        "--format",
-        help="input sparse matrix format",
-        type=str,
-        required=True,
-        choices=read_factory.keys(),
-    )
-    parser.add_argument("--file", help="sparse matrx file", type=str, required=True)
-    parser.add_argument(
-        "--to", help="read format", type=str, required=True, choices=as_factory.keys()
+def print_overhead(mtx, coo_mtx):
+    warnings.filterwarnings("ignore")
+    table = BeautifulTable()
+    report = overhead(mtx, coo_mtx.tocsr())
+    table.column_headers = list(report.keys())
+    table.append_row(
+        [
+            report["stored"],
+            report["padding"],
+            "{:.2%}".format(report["fill"]),
+            report["bytes"],
+            report["csr bytes"],
+            "{:.2f}x".format(report["vs csr"]),
+        ]
     )
-    try:
-        args = parser.parse_args()
-    except Exception:
-        parser.print_help()
-        exit()
-    try:
-        coo_mtx = read_factory[args.format].read(args.file)
-    except KeyError:
-        raise Exception(
-            "unsupported sparse matrix format, sparse matrix format: {}".format(
-                args.format
-            )
+    warnings.resetwarnings()
+    print(table)
+
+
+class LayoutReadProgram(ReadProgram):
+    # padded layouts print their padding and memory next to csr before the prompt
+    def __init__(self) -> None:
+        super().__init__()
+        self.coo_mtx = None
+
+    def run(self, name, commands):
+        if self.coo_mtx is not None:
+            print_overhead(self.mtx, self.coo_mtx)
+        parser = ArgumentParser(name)
+        subparsers = parser.add_subparsers()
+        commands = dict(
+            (key, command(subparsers, self.mtx, self.meta_info))
+            for key, command in commands.items()
         )
-    except Exception:
-        raise Exception(
-            "illegal matrix, sparse matrix format: {}, sparse matrix file: {}".format(
-                args.format, args.file
-            )
+        commands["exit"] = ExitCommand(subparsers, None)
+        commands["clear"] = ClearCommand(subparsers, None)
+        super().run(parser, commands)
+
+
+def array_command(prog, help_msg, name):
+    # the arrays are shown flattened, -1 marks a padded slot
+    def command(subparsers, mtx, meta_info):
+        data = getattr(mtx, name).reshape(-1)
+        return ReadCommand(subparsers, prog, help_msg, data, 0, data.shape[0])
+
+    return command
+
+
+class ReadEllProgram(LayoutReadProgram):
+    def set_mtx(self, coo_mtx):
+        self.coo_mtx = coo_mtx
+        self.mtx = EllMatrix(coo_mtx)
+
+    def run(self):
+        super().run(
+            "ELL Format Read Program (row-major, width {})".format(self.mtx.width),
+            {
+                "c": array_command("c", "displace padded col index", "indices"),
+                "v": array_command("v", "displace padded value", "data"),
+            },
+        )
+
+
+class ReadSellProgram(LayoutReadProgram):
+    def __init__(self) -> None:
+        super().__init__()
+        self.slice_height = 8
+        self.sigma = 256
+
+    def configure(self, args):
+        self.slice_height = args.slice_height
+        self.sigma = args.sigma
+
+    def set_mtx(self, coo_mtx):
+        self.coo_mtx = coo_mtx
+        self.mtx = SellMatrix(coo_mtx, self.slice_height, self.sigma)
+
+    def run(self):
+        super().run(
+            "SELL-{}-{} Format Read Program".format(self.slice_height, self.sigma),
+            {
+                "p": array_command("p", "displace slice offset", "slice_ptr"),
+                "w": array_command("w", "displace slice width", "slice_width"),
+                "m": array_command("m", "displace row permutation", "permutation"),
+                "c": array_command("c", "displace padded col index", "indices"),
+                "v": array_command("v", "displace padded value", "data"),
+            },
         )
-    meta_info = MetaInfo(args.file, args.format, coo_mtx)
-    as_factory[args.to].set_mtx(coo_mtx)
-    as_factory[args.to].set_meta_info(meta_info)
-    as_factory[args.to].run()
+
+
+class ReadBsrProgram(LayoutReadProgram):
+    def __init__(self) -> None:
+        super().__init__()
+        self.block_size = (4, 4)
+
+    def configure(self, args):
+        self.block_size = tuple(args.block_size)
+
+    def set_mtx(self, coo_mtx):
+        self.coo_mtx = coo_mtx
+        self.mtx = BsrMatrix(coo_mtx, self.block_size)
+
+    def run(self):
+        super().run(
+            "BSR {}x{} Format Read Program".format(*self.block_size),
+            {
+                "r": array_command("r", "displace block row offset", "indptr"),
+                "c": array_command("c", "displace block col index", "indices"),
+                "v": array_command("v", "displace block values", "data"),
+            },
+        )
+
+
+class ReadDiaProgram(LayoutReadProgram):
+    def set_mtx(self, coo_mtx):
+        self.coo_mtx = coo_mtx
+        self.mtx = DiaMatrix(coo_mtx)
+
+    def run(self):
+        super().run(
+            "DIA Format Read Program",
+            {
+                "o": array_command("o", "displace diagonal offset", "offsets"),
+                "v": array_command("v", "displace diagonal values", "data"),
+            },
+        )
+
+
+class MatrixReadProgram:
+    def run(self, parser):
+        read_factory = {
+            "mm": MatrixMarketReader(),
+            "mat": MatlabReader(),
+            "rb": RbReader(),
+            "bin": BinaryReader(),
+        }
+        as_factory = {
+            "csr": ReadCsrProgram(),
+            "coo": ReadCooProgram(),
+            "csc": ReadCscProgram(),
+            "ell": ReadEllProgram(),
+            "sell": ReadSellProgram(),
+            "bsr": ReadBsrProgram(),
+            "dia": ReadDiaProgram(),
+        }
+        parser.add_argument(
+            "--format",
+            help="input sparse matrix format, taken from the repository with --name",
+            type=str,
+            choices=read_factory.keys(),
+        )
+        inputs = parser.add_mutually_exclusive_group(required=True)
+        inputs.add_argument("--file", help="sparse matrx file", type=str)
+        inputs.add_argument(
+            "--name", help="matrix name (or group/name) in the repository", type=str
+        )
+        parser.add_argument(
+            "--to",
+            help="read format",
+            type=str,
+            required=True,
+            choices=as_factory.keys(),
+        )
+        parser.add_argument(
+            "--workers", help="parallel parsing processes", type=int, default=1
+        )
+        parser.add_argument(
+            "--no-cache", help="skip the binary parse cache", action="store_true"
+        )
+        parser.add_argument(
+            "--index",
+            help="answer csr/csc/coo reads from a cached row/col index instead of loading the matrix",
+            action="store_true",
+        )
+        parser.add_argument(
+            "--sample",
+            help="browse N distinct nonzeros drawn at random (all when N exceeds nnz) instead of parsing the whole matrix",
+            type=int,
+        )
+        parser.add_argument(
+            "--compact",
+            help="browse csr/csc/coo arrays in the narrowest lossless index and value types",
+            action="store_true",
+        )
+        parser.add_argument(
+            "--slice-height", help="sell rows per slice (C)", type=int, default=8
+        )
+        parser.add_argument(
+            "--sigma", help="sell sorting window in rows", type=int, default=256
+        )
+        parser.add_argument(
+            "--block-size",
+            help="bsr block rows and cols",
+            type=int,
+            nargs=2,
+            default=[4, 4],
+        )
+        add_profile_argument(parser)
+        try:
+            args = parser.parse_args()
+        except Exception:
+            parser.print_help()
+            exit()
+        if args.name is not None:
+            args.file, args.format = resolve_matrix(args.name, args.format)
+        elif args.format is None:
+            raise Exception("--file needs --format")
+        if args.workers < 1:
+            raise Exception(
+                "workers must be positive, workers: {}".format(args.workers)
+            )
+        if args.index and (args.no_cache or args.to not in LAYOUT_ARRAYS):
+            raise Exception("--index needs the cache and a csr, csc or coo view")
+        if args.compact and (args.index or args.to not in LAYOUT_ARRAYS):
+            raise Exception("--compact needs a csr, csc or coo view without --index")
+        if args.sample is not None and (args.sample < 1 or args.index):
+            raise Exception("--sample must be positive and does not take --index")
+        if min(args.slice_height, args.sigma, *args.block_size) < 1:
+            raise Exception("slice height, sigma and block size must be positive")
+        start_profile(args.profile)
+        cache = None if args.no_cache else MatrixCache()
+        program = as_factory[args.to]
+        program.configure(args)
+        mtx = None
+        sampled = None
+        if args.sample is not None:
+            # the sample is drawn from the file and never cached
+            cache = None
+            with stage("sample", count=args.sample):
+                sampled = sample_matrix(
+                    read_factory[args.format], args.file, args.sample
+                )
+            with stage("convert", to=args.to):
+                program.set_mtx(sampled.coo)
+            mtx = program.mtx
+        # binary and cached arrays are memory-mapped, opening them costs the same at any size
+        elif is_binary_matrix(args.file):
+            if load_meta(args.file)["layout"] == args.to:
+                mtx = load_mapped(args.file)
+        elif cache is not None:
+            mtx = cache.load(args.file, args.to, mmap=True)
+        # uncompressed .mtx and binary coo files are read at the positions of the entries asked
+        if mtx is None and args.index:
+            try:
+                with stage("index"):
+                    mtx = IndexedMatrix(cached_index(cache, args.file), args.to)
+            except Exception as error:
+                warnings.warn(
+                    "the matrix is loaded as a whole, {}".format(error), RuntimeWarning
+                )
+        if mtx is None:
+            try:
+                reader = read_factory[args.format]
+                reader.workers = args.workers
+                if cache is not None:
+                    reader = CachedReader(reader, cache)
+                with stage("read"):
+                    coo_mtx = reader.read(args.file)
+            except KeyError:
+                raise Exception(
+                    "unsupported sparse matrix format, sparse matrix format: {}".format(
+                        args.format
+                    )
+                )
+            except Exception:
+                raise Exception(
+                    "illegal matrix, sparse matrix format: {}, sparse matrix file: {}".format(
+                        args.format, args.file
+                    )
+                )
+            with stage("convert", to=args.to):
+                program.set_mtx(coo_mtx)
+            # padded layouts are rebuilt from the cached coo instead of stored
+            if (
+                cache is not None
+                and not is_binary_matrix(args.file)
+                and program.mtx.format in LAYOUT_ARRAYS
+            ):
+                cache.store(args.file, program.mtx)
+        else:
+            program.mtx = mtx
+        # the cache keeps the scipy arrays, the compact copy only lives for this run
+        if args.compact:
+            with stage("compact"):
+                program.mtx = CompactMatrix(program.mtx)
+        meta_info = MetaInfo(args.file, args.format, program.mtx)
+        program.set_meta_info(meta_info)
+        # the prompt is not profiled
+        finish_profile(args.profile)
+        if sampled is not None:
+            print(sampled)
+        program.run()
+
+
+if __name__ == "__main__":
+    MatrixReadProgram().run(ArgumentParser(prog="Matrix Market Read Program"))
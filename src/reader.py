@@ -0,0 +1,1033 @@
+#!/usr/bin/env python3
+import bz2
+import gzip
+import os
+import re
+import struct
+import tempfile
+import warnings
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import scipy.sparse as sparse
+from binary import load_arrays, load_matrix, load_meta
+from profiler import profiled, stage
+
+# bytes of the coordinate section parsed per chunk
+CHUNK_SIZE = 16 * 1024 * 1024
+# ranges handed to each parallel worker, more ranges balance uneven lines
+RANGES_PER_WORKER = 4
+SHM_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+class MatrixMarketHeader:
+    def __init__(self) -> None:
+        self.object = "matrix"
+        self.format = "coordinate"
+        self.field = "real"
+        self.symmetry = "general"
+        self.rows = 0
+        self.cols = 0
+        self.nnz = 0
+        # byte offset of the first entry line
+        self.offset = 0
+
+    def columns(self):
+        return {"pattern": 2, "complex": 4}.get(self.field, 3)
+
+    def index_dtype(self):
+        if max(self.rows, self.cols) <= np.iinfo(np.int32).max:
+            return np.int32
+        return np.int64
+
+    def value_dtype(self):
+        return {"integer": np.int64, "complex": np.complex128}.get(
+            self.field, np.float64
+        )
+
+
+def open_mm(mtx_path):
+    if mtx_path.endswith(".gz"):
+        return gzip.open(mtx_path, "rb")
+    if mtx_path.endswith(".bz2"):
+        return bz2.open(mtx_path, "rb")
+    return open(mtx_path, "rb")
+
+
+def read_mm_header(stream):
+    header = MatrixMarketHeader()
+    banner = stream.readline()
+    header.offset += len(banner)
+    tokens = banner.decode("ascii").lower().split()
+    if len(tokens) != 5 or tokens[0] != "%%matrixmarket":
+        raise Exception("illegal matrix market banner: {}".format(banner))
+    header.object, header.format, header.field, header.symmetry = tokens[1:]
+    while True:
+        line = stream.readline()
+        if len(line) == 0:
+            raise Exception("matrix market size line is missing")
+        header.offset += len(line)
+        if line.startswith(b"%") or len(line.strip()) == 0:
+            continue
+        sizes = [int(size) for size in line.split()]
+        break
+    if header.format == "coordinate":
+        header.rows, header.cols, header.nnz = sizes
+    else:
+        header.rows, header.cols = sizes
+        header.nnz = header.rows * header.cols
+    return header
+
+
+def parse_mm_entries(buf, header):
+    # integer and pattern entries are parsed as int64 so large values stay exact
+    dtype = np.float64 if header.field in ["real", "complex"] else np.int64
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        tokens = np.fromstring(buf, dtype=dtype, sep=" ")
+    columns = header.columns()
+    if tokens.size % columns != 0:
+        raise Exception(
+            "illegal matrix market entries, expect {} columns per line".format(columns)
+        )
+    tokens = tokens.reshape(-1, columns)
+    index_dtype = header.index_dtype()
+    row = tokens[:, 0].astype(index_dtype)
+    col = tokens[:, 1].astype(index_dtype)
+    row -= 1
+    col -= 1
+    if header.field == "pattern":
+        data = np.ones(tokens.shape[0], dtype=np.float64)
+    elif header.field == "complex":
+        data = tokens[:, 2] + 1j * tokens[:, 3]
+    else:
+        data = tokens[:, 2].astype(header.value_dtype())
+    return row, col, data
+
+
+def iter_mm_entries(stream, header, chunk_size=CHUNK_SIZE):
+    # yields the entries as stored in the file, chunks are cut on line boundaries
+    while True:
+        buf = stream.read(chunk_size)
+        if len(buf) == 0:
+            break
+        if not buf.endswith(b"\n"):
+            buf += stream.readline()
+        if len(buf.strip()) > 0:
+            yield parse_mm_entries(buf, header)
+
+
+@profiled("expand symmetric")
+def expand_symmetric(row, col, data, symmetry):
+    if symmetry == "general":
+        return row, col, data
+    off = row != col
+    mirror = data[off]
+    if symmetry == "skew-symmetric":
+        mirror = -mirror
+    elif symmetry == "hermitian":
+        mirror = np.conj(mirror)
+    return (
+        np.concatenate((row, col[off])),
+        np.concatenate((col, row[off])),
+        np.concatenate((data, mirror)),
+    )
+
+
+def split_mm_ranges(mtx_path, header, parts):
+    # byte ranges of the entry section, every range starts at a line boundary
+    size = os.path.getsize(mtx_path)
+    bounds = [header.offset]
+    with open(mtx_path, "rb") as stream:
+        for i in range(1, parts):
+            pos = header.offset + (size - header.offset) * i // parts
+            if pos <= bounds[-1]:
+                continue
+            stream.seek(pos - 1)
+            pos += len(stream.readline()) - 1
+            if pos > bounds[-1] and pos < size:
+                bounds.append(pos)
+    bounds.append(size)
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def iter_range(mtx_path, start, stop, chunk_size):
+    with open(mtx_path, "rb") as stream:
+        stream.seek(start)
+        while start < stop:
+            buf = stream.read(min(chunk_size, stop - start))
+            start += len(buf)
+            if start < stop and not buf.endswith(b"\n"):
+                line = stream.readline()
+                start += len(line)
+                buf += line
+            yield buf
+
+
+def count_mm_range(mtx_path, start, stop, chunk_size):
+    lines = 0
+    last = b"\n"
+    for buf in iter_range(mtx_path, start, stop, chunk_size):
+        lines += buf.count(b"\n")
+        last = buf[-1:]
+    # the last line of the file may miss its newline
+    return lines + (0 if last == b"\n" else 1)
+
+
+def shared_array(path, dtype, size, mode):
+    if size == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode=mode, shape=(size,))
+
+
+def parse_mm_range(mtx_path, header, start, stop, offset, count, buffers, chunk_size):
+    row, col, data = [
+        shared_array(path, dtype, header.nnz, "r+") for path, dtype in buffers
+    ]
+    end = offset + count
+    for buf in iter_range(mtx_path, start, stop, chunk_size):
+        if len(buf.strip()) == 0:
+            continue
+        chunk_row, chunk_col, chunk_data = parse_mm_entries(buf, header)
+        if offset + chunk_row.size > end:
+            raise Exception("matrix market range has more entries than lines")
+        row[offset : offset + chunk_row.size] = chunk_row
+        col[offset : offset + chunk_row.size] = chunk_col
+        data[offset : offset + chunk_row.size] = chunk_data
+        offset += chunk_row.size
+    if offset != end:
+        raise Exception("matrix market range has blank lines")
+    for array in [row, col, data]:
+        if isinstance(array, np.memmap):
+            array.flush()
+
+
+# MAT v5 element and array class codes
+MI_INT32 = 5
+MI_UINT32 = 6
+MI_MATRIX = 14
+MI_COMPRESSED = 15
+MX_STRUCT_CLASS = 2
+MX_SPARSE_CLASS = 5
+MX_COMPLEX_FLAG = 0x0800
+MX_LOGICAL_FLAG = 0x0200
+# numeric element types, values are often stored in the smallest type that holds them
+MI_DTYPES = {
+    1: "i1",
+    2: "u1",
+    3: "i2",
+    4: "u2",
+    5: "i4",
+    6: "u4",
+    7: "f4",
+    9: "f8",
+    12: "i8",
+    13: "u8",
+}
+# v7.3 files are HDF5 behind a 512-byte matlab text header
+HDF5_SIGNATURE = b"\x89HDF\r\n\x1a\n"
+HDF5_USERBLOCK = 512
+
+
+class MatrixMeta:
+    # what a header tells without the entries, field and symmetry when known
+    def __init__(self, shape, nnz, field=None, symmetry=None) -> None:
+        self.shape = tuple(shape)
+        self.nnz = int(nnz)
+        self.field = field
+        self.symmetry = symmetry
+
+
+class InflateStream:
+    # a miCOMPRESSED element inflated on demand, skipped bytes are never kept
+    def __init__(self, stream, size) -> None:
+        self.stream = stream
+        self.left = size
+        self.inflater = zlib.decompressobj()
+        self.buffer = b""
+
+    def read(self, size):
+        # pieces are joined once, large arrays are not copied on every inflate
+        parts = [self.buffer]
+        have = len(self.buffer)
+        while have < size:
+            if len(self.inflater.unconsumed_tail) > 0:
+                data = self.inflater.unconsumed_tail
+            elif self.left > 0:
+                data = self.stream.read(min(self.left, 1 << 20))
+                self.left -= len(data)
+                if len(data) == 0:
+                    break
+            else:
+                break
+            part = self.inflater.decompress(data, max(size - have, 1 << 16))
+            parts.append(part)
+            have += len(part)
+        data = b"".join(parts)
+        data, self.buffer = data[:size], data[size:]
+        if len(data) < size:
+            raise Exception("truncated matlab element")
+        return data
+
+    def skip(self, size):
+        # inflate and drop, only the bytes past the skipped range are buffered
+        while len(self.buffer) < size:
+            size -= len(self.buffer)
+            self.buffer = b""
+            if len(self.inflater.unconsumed_tail) > 0:
+                data = self.inflater.unconsumed_tail
+            elif self.left > 0:
+                data = self.stream.read(min(self.left, 1 << 20))
+                self.left -= len(data)
+                if len(data) == 0:
+                    raise Exception("truncated matlab element")
+            else:
+                raise Exception("truncated matlab element")
+            self.buffer = self.inflater.decompress(data, 1 << 22)
+        self.buffer = self.buffer[size:]
+
+
+class PlainStream:
+    def __init__(self, stream) -> None:
+        self.stream = stream
+
+    def read(self, size):
+        data = self.stream.read(size)
+        if len(data) < size:
+            raise Exception("truncated matlab element")
+        return data
+
+    def skip(self, size):
+        self.stream.seek(size, os.SEEK_CUR)
+
+
+def read_mat_tag(stream, endian):
+    # small elements pack up to 4 data bytes into the tag itself
+    raw = stream.read(8)
+    first, second = struct.unpack(endian + "II", raw)
+    if first >> 16:
+        return first & 0xFFFF, first >> 16, raw[4 : 4 + (first >> 16)]
+    return first, second, None
+
+
+def read_mat_element(stream, endian):
+    kind, size, data = read_mat_tag(stream, endian)
+    if data is None:
+        data = stream.read(size)
+        stream.skip(-size % 8)
+    return kind, data
+
+
+def read_mat_numeric(stream, endian):
+    kind, data = read_mat_element(stream, endian)
+    if kind not in MI_DTYPES:
+        raise Exception("unsupported matlab numeric type: {}".format(kind))
+    return np.frombuffer(data, dtype=np.dtype(MI_DTYPES[kind]).newbyteorder(endian))
+
+
+def read_mat_array_header(stream, endian):
+    _, flags = read_mat_element(stream, endian)
+    flags, nzmax = struct.unpack(endian + "II", flags[:8])
+    _, dims = read_mat_element(stream, endian)
+    dims = struct.unpack(endian + "{}i".format(len(dims) // 4), dims)
+    _, name = read_mat_element(stream, endian)
+    return flags, dims, name.decode("ascii", "replace")
+
+
+def read_mat_sparse(stream, endian, flags, dims):
+    # ir is skipped, nnz is the last column pointer of jc, the values are never read
+    kind, size, data = read_mat_tag(stream, endian)
+    stream.skip(size + (-size % 8) if data is None else 0)
+    kind, size, data = read_mat_tag(stream, endian)
+    if data is None:
+        stream.skip(size - 4)
+        data = stream.read(4)
+        stream.skip(-size % 8)
+    nnz = struct.unpack(endian + "i", data[-4:])[0]
+    if flags & MX_LOGICAL_FLAG:
+        field = "pattern"
+    elif flags & MX_COMPLEX_FLAG:
+        field = "complex"
+    else:
+        field = "real"
+    return MatrixMeta(dims[:2], nnz, field, "general")
+
+
+def read_mat_sparse_arrays(stream, endian, flags, dims):
+    # ir, jc, then the real and imaginary parts, read once in file order
+    ir = read_mat_numeric(stream, endian)
+    jc = read_mat_numeric(stream, endian).astype(np.int64)
+    nnz = int(jc[-1])
+    data = read_mat_numeric(stream, endian)[:nnz]
+    if flags & MX_LOGICAL_FLAG:
+        data = data.astype(bool)
+    elif flags & MX_COMPLEX_FLAG:
+        data = data + 1j * read_mat_numeric(stream, endian)[:nnz]
+    else:
+        data = data.astype(np.float64)
+    return sparse.csc_matrix((data, ir[:nnz].astype(np.int32), jc), shape=dims[:2])
+
+
+def read_mat_problem(stream, endian, read_sparse=read_mat_sparse):
+    # Problem struct of sparse.tamu.edu files, A is found without loading the other fields
+    flags, dims, name = read_mat_array_header(stream, endian)
+    if name != "Problem" or flags & 0xFF != MX_STRUCT_CLASS:
+        return None
+    _, length = read_mat_element(stream, endian)
+    length = struct.unpack(endian + "i", length[:4])[0]
+    _, names = read_mat_element(stream, endian)
+    fields = [
+        names[i : i + length].split(b"\0")[0].decode("ascii")
+        for i in range(0, len(names), length)
+    ]
+    for field in fields:
+        kind, size, _ = read_mat_tag(stream, endian)
+        if field != "A":
+            stream.skip(size)
+            continue
+        if size == 0:
+            return None
+        flags, dims, _ = read_mat_array_header(stream, endian)
+        if flags & 0xFF != MX_SPARSE_CLASS:
+            return None
+        return read_sparse(stream, endian, flags, dims)
+    return None
+
+
+def mat_version(mtx_path):
+    with open(mtx_path, "rb") as stream:
+        header = stream.read(HDF5_USERBLOCK + len(HDF5_SIGNATURE))
+    if header[HDF5_USERBLOCK:] == HDF5_SIGNATURE or header.startswith(HDF5_SIGNATURE):
+        return "hdf5"
+    if len(header) >= 128 and header[126:128] in [b"IM", b"MI"]:
+        return "v5"
+    raise Exception("not a matlab file: {}".format(mtx_path))
+
+
+def scan_mat_problem(mtx_path, read_sparse):
+    # walks the top-level variables, only the one holding Problem is inflated
+    with open(mtx_path, "rb") as stream:
+        header = stream.read(128)
+        if len(header) < 128 or header[126:128] not in [b"IM", b"MI"]:
+            raise Exception("not a matlab v5 file: {}".format(mtx_path))
+        endian = "<" if header[126:128] == b"IM" else ">"
+        plain = PlainStream(stream)
+        while True:
+            raw = stream.read(8)
+            if len(raw) < 8:
+                break
+            kind, size = struct.unpack(endian + "II", raw)
+            if kind == MI_COMPRESSED:
+                begin = stream.tell()
+                inflated = InflateStream(stream, size)
+                if read_mat_tag(inflated, endian)[0] == MI_MATRIX:
+                    meta = read_mat_problem(inflated, endian, read_sparse)
+                    if meta is not None:
+                        return meta
+                stream.seek(begin + size)
+            elif kind == MI_MATRIX:
+                begin = stream.tell()
+                meta = read_mat_problem(plain, endian, read_sparse)
+                if meta is not None:
+                    return meta
+                stream.seek(begin + size + (-size % 8))
+            else:
+                stream.seek(size + (-size % 8), os.SEEK_CUR)
+    raise Exception("no sparse Problem.A in matlab file: {}".format(mtx_path))
+
+
+def read_mat_header(mtx_path):
+    return scan_mat_problem(mtx_path, read_mat_sparse)
+
+
+def read_mat_csc(mtx_path):
+    try:
+        mtx = scan_mat_problem(mtx_path, read_mat_sparse_arrays)
+    except Exception:
+        # layouts the streaming parser does not know, still only Problem is loaded
+        import scipy.io as sio
+
+        mtx = sio.loadmat(mtx_path, variable_names=["Problem"])
+        mtx = mtx["Problem"]["A"][0][0]
+    return sparse.csc_matrix(mtx)
+
+
+class Hdf5Slices:
+    # slices of a v7.3 dataset as numpy arrays, complex values are a compound type
+    def __init__(self, dataset, dtype) -> None:
+        self.dataset = dataset
+        self.dtype = np.dtype(dtype)
+        self.itemsize = self.dtype.itemsize
+
+    def __getitem__(self, index):
+        values = self.dataset[index]
+        if values.dtype.names is not None:
+            values = values["real"] + 1j * values["imag"]
+        return values.astype(self.dtype)
+
+
+def open_mat_hdf5(mtx_path):
+    try:
+        import h5py
+    except ImportError:
+        raise Exception(
+            "matlab v7.3 files need the optional h5py package, matrix file: {}".format(
+                mtx_path
+            )
+        )
+    return h5py.File(mtx_path, "r")
+
+
+def hdf5_problem(mtx_file):
+    # Problem/A is a group of ir, jc and data datasets, the other fields are never opened
+    if "Problem" not in mtx_file or "A" not in mtx_file["Problem"]:
+        raise Exception("no Problem.A in matlab file: {}".format(mtx_file.filename))
+    group = mtx_file["Problem"]["A"]
+    if "MATLAB_sparse" not in group.attrs:
+        raise Exception("Problem.A is not sparse: {}".format(mtx_file.filename))
+    matlab_class = group.attrs.get("MATLAB_class", b"double")
+    if isinstance(matlab_class, bytes):
+        matlab_class = matlab_class.decode("ascii")
+    jc = np.asarray(group["jc"][:], dtype=np.int64)
+    shape = (int(group.attrs["MATLAB_sparse"]), jc.shape[0] - 1)
+    if matlab_class == "logical":
+        field, dtype = "pattern", bool
+    elif "data" in group and group["data"].dtype.names is not None:
+        field, dtype = "complex", np.complex128
+    else:
+        field, dtype = "real", np.float64
+    if "data" not in group or jc[-1] == 0:
+        # an empty matrix may come without ir and data
+        ir = np.empty(0, dtype=np.int32)
+        data = np.empty(0, dtype=dtype)
+    else:
+        ir = Hdf5Slices(group["ir"], np.int32 if shape[0] < 2**31 else np.int64)
+        data = Hdf5Slices(group["data"], dtype)
+    return shape, field, jc, ir, data
+
+
+def iter_compressed(indptr, indices, data, step, layout):
+    # whole rows (or cols) of about step entries, a longer one goes alone
+    majors = indptr.shape[0] - 1
+    begin = 0
+    while begin < majors:
+        end = int(np.searchsorted(indptr, indptr[begin] + step, "right")) - 1
+        end = min(max(end, begin + 1), majors)
+        lengths = np.diff(indptr[begin : end + 1])
+        major = np.repeat(np.arange(begin, end, dtype=indices.dtype), lengths)
+        minor = np.array(indices[indptr[begin] : indptr[end]])
+        values = np.array(data[indptr[begin] : indptr[end]])
+        if layout == "csr":
+            yield major, minor, values
+        else:
+            yield minor, major, values
+        begin = end
+
+
+# Rutherford-Boeing type letters, q is a pattern with values given elsewhere
+RB_FIELDS = {
+    "r": "real",
+    "c": "complex",
+    "i": "integer",
+    "p": "pattern",
+    "q": "pattern",
+}
+RB_SYMMETRIES = {
+    "u": "general",
+    "r": "general",
+    "s": "symmetric",
+    "h": "hermitian",
+    "z": "skew-symmetric",
+}
+# repeat, letter and width of a Fortran edit descriptor such as (1P,3E26.16)
+FORTRAN_FORMAT = re.compile(r"\(\s*(?:\d*P\s*,?\s*)?(\d*)\s*([IEDFG])\s*(\d+)", re.I)
+# Fortran writes double exponents with D
+FORTRAN_EXPONENT = bytes.maketrans(b"Dd", b"EE")
+# lines of a section cut into fields per step
+RB_LINES = 1 << 16
+
+
+class RbHeader:
+    def __init__(self) -> None:
+        self.title = ""
+        self.key = ""
+        self.mxtype = "rua"
+        self.rows = 0
+        self.cols = 0
+        self.nnz = 0
+        # lines of the pointer, index and value sections
+        self.crd = [0, 0, 0]
+        # (per line, width) of the fields of each section
+        self.formats = []
+        # header lines before the pointer section
+        self.lines = 4
+
+    @property
+    def field(self):
+        return RB_FIELDS[self.mxtype[0]]
+
+    @property
+    def symmetry(self):
+        return RB_SYMMETRIES[self.mxtype[1]]
+
+    def index_dtype(self):
+        if max(self.rows, self.cols, self.nnz + 1) <= np.iinfo(np.int32).max:
+            return np.int32
+        return np.int64
+
+
+def parse_fortran_format(text):
+    match = FORTRAN_FORMAT.search(text)
+    if match is None:
+        raise Exception("illegal fortran format: {}".format(text.strip()))
+    return int(match.group(1) or 1), int(match.group(3))
+
+
+def read_rb_header(lines):
+    # harwell-boeing headers are read too, their right-hand side lines are skipped
+    header = RbHeader()
+    lines = [line.decode("ascii", "replace").rstrip("\r\n") for line in lines]
+    if len(lines) < 4:
+        raise Exception("rutherford-boeing header is truncated")
+    header.title, header.key = lines[0][:72].strip(), lines[0][72:80].strip()
+    counts = [int(count) for count in lines[1].split()]
+    if len(counts) < 4:
+        raise Exception("illegal rutherford-boeing card counts: {}".format(lines[1]))
+    header.crd = counts[1:4]
+    header.mxtype = lines[2][:3].lower()
+    if (
+        len(header.mxtype) != 3
+        or header.mxtype[0] not in RB_FIELDS
+        or header.mxtype[1] not in RB_SYMMETRIES
+        or header.mxtype[2] != "a"
+    ):
+        raise Exception(
+            "unsupported rutherford-boeing matrix type: {}".format(header.mxtype)
+        )
+    sizes = [int(size) for size in lines[2][3:].split()]
+    header.rows, header.cols, header.nnz = sizes[:3]
+    header.formats = [
+        parse_fortran_format(lines[3][begin:end])
+        for begin, end in [(0, 16), (16, 32), (32, 52)]
+        if len(lines[3][begin:end].strip()) > 0
+    ]
+    if len(counts) > 4 and counts[4] > 0:
+        header.lines = 5
+    return header
+
+
+def parse_fixed_integers(fields):
+    # right-justified fields are summed as digit * 10^position, blank fields are dropped
+    digits = fields - np.uint8(48)
+    is_digit = digits < 10
+    present = is_digit.any(axis=1)
+    if not (is_digit[:, -1] | ~present).all():
+        return None
+    np.multiply(digits, is_digit, out=digits)
+    value = np.zeros(fields.shape[0], dtype=np.int64)
+    for column in range(fields.shape[1]):
+        value += digits[:, column] * np.int64(10) ** (fields.shape[1] - 1 - column)
+    minus = fields == 45
+    if minus.any():
+        value[minus.any(axis=1)] *= -1
+    return value[present]
+
+
+def parse_fixed_width(raw, starts, ends, per_line, width, dtype):
+    # fields are cut by position, so values that touch each other still split
+    length = per_line * width
+    lines = starts.size
+    if lines == 0:
+        return np.empty(0, dtype=dtype)
+    if (ends - starts == length).all() and (
+        lines == 1 or (np.diff(starts) == length + 1).all()
+    ):
+        # full lines back to back, the block is one strided view of the file
+        grid = np.asarray(raw[starts[0] : starts[0] + lines * (length + 1)])
+        grid = grid[: lines * (length + 1)]
+        if grid.size < lines * (length + 1):
+            grid = np.concatenate([grid, np.full(1, 10, dtype=np.uint8)])
+        grid = grid.reshape(lines, length + 1)[:, :length]
+    else:
+        # short or trailing-blank lines are padded with spaces first
+        grid = np.full((lines, length), 32, dtype=np.uint8)
+        column = np.arange(length)
+        mask = column < (ends - starts)[:, None]
+        grid[mask] = np.asarray(raw)[(starts[:, None] + column)[mask]]
+    if np.dtype(dtype).kind == "i":
+        value = parse_fixed_integers(grid.reshape(-1, width))
+        if value is not None:
+            return value
+    fields = np.full((lines * per_line, width + 1), 32, dtype=np.uint8)
+    fields[:, :width] = grid.reshape(-1, width)
+    text = fields.tobytes()
+    if b"D" in text or b"d" in text:
+        text = text.translate(FORTRAN_EXPONENT)
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        return np.fromstring(text, dtype=dtype, sep=" ")
+
+
+def line_bounds(raw, step=CHUNK_SIZE * 4):
+    # start and end of every line, the newline search runs over the file in steps
+    ends = [
+        np.flatnonzero(np.asarray(raw[begin : begin + step]) == 10) + begin
+        for begin in range(0, raw.shape[0], step)
+    ]
+    ends = np.concatenate(ends) if len(ends) > 0 else np.empty(0, dtype=np.int64)
+    if raw.shape[0] > 0 and raw[-1] != 10:
+        ends = np.concatenate([ends, [raw.shape[0]]])
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    # carriage returns of dos files are not part of the fields
+    cr = ends > starts
+    cr[cr] = np.asarray(raw)[ends[cr] - 1] == 13
+    return starts, ends - cr
+
+
+def read_rb_section(raw, starts, ends, fmt, count, dtype):
+    per_line, width = fmt
+    values = [
+        parse_fixed_width(
+            raw,
+            starts[begin : begin + RB_LINES],
+            ends[begin : begin + RB_LINES],
+            per_line,
+            width,
+            dtype,
+        )
+        for begin in range(0, starts.size, RB_LINES)
+    ]
+    values = np.concatenate(values) if len(values) > 0 else np.empty(0, dtype=dtype)
+    if values.size < count:
+        raise Exception(
+            "rutherford-boeing section has {} values, expect {}".format(
+                values.size, count
+            )
+        )
+    return values[:count]
+
+
+def open_rb(mtx_path):
+    # plain files are memory-mapped, compressed ones are inflated into memory
+    if mtx_path.endswith((".gz", ".bz2")):
+        with open_mm(mtx_path) as stream:
+            return np.frombuffer(stream.read(), dtype=np.uint8)
+    if os.path.getsize(mtx_path) == 0:
+        raise Exception("empty rutherford-boeing file: {}".format(mtx_path))
+    return np.memmap(mtx_path, dtype=np.uint8, mode="r")
+
+
+def read_rb_csc(mtx_path):
+    return parse_rb(open_rb(mtx_path))
+
+
+def parse_rb(raw):
+    # the stored part of the matrix, one triangle for symmetric types
+    starts, ends = line_bounds(raw)
+    header = read_rb_header(
+        [bytes(raw[begin:end]) for begin, end in zip(starts[:5], ends[:5])]
+    )
+    bounds = np.cumsum([header.lines] + header.crd)
+    sections = [
+        (starts[begin:end], ends[begin:end])
+        for begin, end in zip(bounds[:-1], bounds[1:])
+    ]
+    index_dtype = header.index_dtype()
+    indptr = read_rb_section(
+        raw, *sections[0], header.formats[0], header.cols + 1, np.int64
+    )
+    indices = read_rb_section(
+        raw, *sections[1], header.formats[1], header.nnz, np.int64
+    )
+    if header.field == "pattern":
+        data = np.ones(header.nnz, dtype=np.float64)
+    elif header.field == "complex":
+        data = read_rb_section(
+            raw, *sections[2], header.formats[2], 2 * header.nnz, np.float64
+        )
+        data = data[0::2] + 1j * data[1::2]
+    elif header.field == "integer":
+        data = read_rb_section(
+            raw, *sections[2], header.formats[2], header.nnz, np.int64
+        )
+    else:
+        data = read_rb_section(
+            raw, *sections[2], header.formats[2], header.nnz, np.float64
+        )
+    indptr -= 1
+    indices -= 1
+    csc = sparse.csc_matrix(
+        (data, indices.astype(index_dtype), indptr.astype(index_dtype)),
+        shape=(header.rows, header.cols),
+    )
+    return header, csc
+
+
+# basic class
+class SparseMatrixReader:
+    workers = 1
+    cacheable = True
+    chunk_size = CHUNK_SIZE
+
+    def read(self, mtx_path):
+        pass
+
+    def read_shape(self, mtx_path):
+        return self.read(mtx_path).shape
+
+    def read_meta(self, mtx_path):
+        # readers without a cheap header parse the whole matrix
+        mtx = self.read(mtx_path)
+        return MatrixMeta(mtx.shape, mtx.nnz)
+
+
+class MatrixMarketReader(SparseMatrixReader):
+    def __init__(self, chunk_size=CHUNK_SIZE, workers=1) -> None:
+        self.chunk_size = chunk_size
+        self.workers = workers
+
+    def read_header(self, mtx_path):
+        with open_mm(mtx_path) as stream:
+            return read_mm_header(stream)
+
+    def read_shape(self, mtx_path):
+        header = self.read_header(mtx_path)
+        return header.rows, header.cols
+
+    @profiled("header")
+    def read_meta(self, mtx_path):
+        # nnz is the header count, symmetric files store one triangle of it
+        header = self.read_header(mtx_path)
+        return MatrixMeta(
+            (header.rows, header.cols), header.nnz, header.field, header.symmetry
+        )
+
+    def iter_chunks(self, mtx_path):
+        with open_mm(mtx_path) as stream:
+            header = read_mm_header(stream)
+            if header.format != "coordinate":
+                import scipy.io as sio
+
+                mtx = sio.mmread(mtx_path)
+                mtx = sparse.coo_matrix(mtx)
+                yield mtx.row, mtx.col, mtx.data
+                return
+            for row, col, data in iter_mm_entries(stream, header, self.chunk_size):
+                yield expand_symmetric(row, col, data, header.symmetry)
+
+    @profiled("parse")
+    def read(self, mtx_path):
+        with open_mm(mtx_path) as stream:
+            header = read_mm_header(stream)
+            if header.format != "coordinate":
+                # array files are rare, scipy.io is not loaded for coordinate files
+                import scipy.io as sio
+
+                return sparse.coo_matrix(sio.mmread(mtx_path))
+            if self.__parallel(mtx_path, header):
+                try:
+                    return self.__read_parallel(mtx_path, header)
+                except Exception:
+                    warnings.warn(
+                        "parallel parsing failed, fall back to serial parsing",
+                        RuntimeWarning,
+                    )
+            return self.__fill(stream, header)
+
+    def __parallel(self, mtx_path, header):
+        if self.workers <= 1 or mtx_path.endswith((".gz", ".bz2")):
+            return False
+        return os.path.getsize(mtx_path) - header.offset > self.chunk_size
+
+    def __read_parallel(self, mtx_path, header):
+        ranges = split_mm_ranges(mtx_path, header, self.workers * RANGES_PER_WORKER)
+        buffers = []
+        try:
+            for dtype in [
+                header.index_dtype(),
+                header.index_dtype(),
+                header.value_dtype(),
+            ]:
+                fd, path = tempfile.mkstemp(prefix="smt-", suffix=".shm", dir=SHM_DIR)
+                os.ftruncate(fd, header.nnz * np.dtype(dtype).itemsize)
+                os.close(fd)
+                buffers.append((path, dtype))
+            with ProcessPoolExecutor(self.workers) as pool:
+                with stage("count lines"):
+                    counts = list(
+                        pool.map(
+                            count_mm_range,
+                            *zip(
+                                *[
+                                    (mtx_path, start, stop, self.chunk_size)
+                                    for start, stop in ranges
+                                ]
+                            )
+                        )
+                    )
+                if sum(counts) != header.nnz:
+                    raise Exception("matrix market line count mismatches its header")
+                offsets = np.cumsum([0] + counts[:-1]).tolist()
+                with stage("parse ranges"):
+                    futures = [
+                        pool.submit(
+                            parse_mm_range,
+                            mtx_path,
+                            header,
+                            start,
+                            stop,
+                            offset,
+                            count,
+                            buffers,
+                            self.chunk_size,
+                        )
+                        for (start, stop), offset, count in zip(ranges, offsets, counts)
+                    ]
+                    for future in futures:
+                        future.result()
+            # the parent keeps the shared pages mapped after the files are unlinked
+            row, col, data = [
+                shared_array(path, dtype, header.nnz, "r+") for path, dtype in buffers
+            ]
+        finally:
+            for path, _ in buffers:
+                os.unlink(path)
+        row, col, data = expand_symmetric(row, col, data, header.symmetry)
+        return sparse.coo_matrix(
+            (data, (row, col)), shape=(header.rows, header.cols), copy=False
+        )
+
+    def __fill(self, stream, header):
+        # the arrays are sized from the header so the peak stays near the final size
+        row = np.empty(header.nnz, dtype=header.index_dtype())
+        col = np.empty(header.nnz, dtype=header.index_dtype())
+        data = np.empty(header.nnz, dtype=header.value_dtype())
+        offset = 0
+        for chunk_row, chunk_col, chunk_data in iter_mm_entries(
+            stream, header, self.chunk_size
+        ):
+            end = offset + chunk_row.size
+            if end > header.nnz:
+                raise Exception("matrix market file has more entries than its header")
+            row[offset:end] = chunk_row
+            col[offset:end] = chunk_col
+            data[offset:end] = chunk_data
+            offset = end
+        if offset != header.nnz:
+            raise Exception(
+                "matrix market file has {} entries, header declares {}".format(
+                    offset, header.nnz
+                )
+            )
+        row, col, data = expand_symmetric(row, col, data, header.symmetry)
+        return sparse.coo_matrix(
+            (data, (row, col)), shape=(header.rows, header.cols), copy=False
+        )
+
+
+class MatlabReader(SparseMatrixReader):
+    @profiled("parse")
+    def read(self, mtx_path):
+        if mat_version(mtx_path) == "hdf5":
+            with open_mat_hdf5(mtx_path) as mtx_file:
+                shape, _, jc, ir, data = hdf5_problem(mtx_file)
+                return sparse.csc_matrix((data[:], ir[:], jc), shape=shape).tocoo()
+        return read_mat_csc(mtx_path).tocoo()
+
+    @profiled("header")
+    def read_meta(self, mtx_path):
+        if mat_version(mtx_path) == "hdf5":
+            with open_mat_hdf5(mtx_path) as mtx_file:
+                shape, field, jc, _, _ = hdf5_problem(mtx_file)
+                return MatrixMeta(shape, jc[-1], field, "general")
+        try:
+            return read_mat_header(mtx_path)
+        except Exception:
+            return super().read_meta(mtx_path)
+
+    def read_shape(self, mtx_path):
+        return self.read_meta(mtx_path).shape
+
+    def iter_chunks(self, mtx_path):
+        if mat_version(mtx_path) != "hdf5":
+            # a v5 element is one zlib stream, ir comes before jc so it is read whole
+            mtx = read_mat_csc(mtx_path)
+            yield from iter_compressed(
+                mtx.indptr,
+                mtx.indices,
+                mtx.data,
+                max(1, self.chunk_size // (mtx.indices.itemsize + mtx.data.itemsize)),
+                "csc",
+            )
+            return
+        with open_mat_hdf5(mtx_path) as mtx_file:
+            _, _, jc, ir, data = hdf5_problem(mtx_file)
+            step = max(1, self.chunk_size // (ir.itemsize + data.itemsize))
+            yield from iter_compressed(jc, ir, data, step, "csc")
+
+
+class RbReader(SparseMatrixReader):
+    def read_header(self, mtx_path):
+        with open_mm(mtx_path) as stream:
+            return read_rb_header([stream.readline() for _ in range(4)])
+
+    def read_shape(self, mtx_path):
+        header = self.read_header(mtx_path)
+        return header.rows, header.cols
+
+    @profiled("header")
+    def read_meta(self, mtx_path):
+        # nnz is the header count, symmetric files store one triangle of it
+        header = self.read_header(mtx_path)
+        return MatrixMeta(
+            (header.rows, header.cols), header.nnz, header.field, header.symmetry
+        )
+
+    @profiled("parse")
+    def read(self, mtx_path):
+        header, csc = read_rb_csc(mtx_path)
+        coo = csc.tocoo()
+        row, col, data = expand_symmetric(coo.row, coo.col, coo.data, header.symmetry)
+        return sparse.coo_matrix((data, (row, col)), shape=csc.shape)
+
+    def iter_chunks(self, mtx_path):
+        header, csc = read_rb_csc(mtx_path)
+        step = max(1, self.chunk_size // (csc.indices.itemsize + csc.data.itemsize))
+        for row, col, data in iter_compressed(
+            csc.indptr, csc.indices, csc.data, step, "csc"
+        ):
+            yield expand_symmetric(row, col, data, header.symmetry)
+
+
+class BinaryReader(SparseMatrixReader):
+    # native binary matrices are memory-mapped already, caching them gains nothing
+    cacheable = False
+
+    @profiled("parse")
+    def read(self, mtx_path):
+        return load_matrix(mtx_path, "r").tocoo()
+
+    def read_shape(self, mtx_path):
+        return tuple(load_meta(mtx_path)["shape"])
+
+    def read_meta(self, mtx_path):
+        meta = load_meta(mtx_path)
+        return MatrixMeta(meta["shape"], meta["nnz"])
+
+    def iter_chunks(self, mtx_path):
+        meta, arrays = load_arrays(mtx_path, "r")
+        step = max(
+            1, self.chunk_size // sum(array.itemsize for array in arrays.values())
+        )
+        if meta["layout"] == "coo":
+            for begin in range(0, arrays["data"].shape[0], step):
+                end = begin + step
+                yield (
+                    np.array(arrays["row"][begin:end]),
+                    np.array(arrays["col"][begin:end]),
+                    np.array(arrays["data"][begin:end]),
+                )
+            return
+        yield from iter_compressed(
+            arrays["indptr"], arrays["indices"], arrays["data"], step, meta["layout"]
+        )
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import warnings
+import numpy as np
+import scipy.sparse as sparse
+from beautifultable import BeautifulTable
+from scipy.sparse import csgraph
+from binary import LAYOUT_ARRAYS, is_binary_matrix, save_matrix
+from cache import MatrixCache, CachedReader
+from reader import MatrixMarketReader, MatlabReader, RbReader, BinaryReader
+from spmv import timed
+from stats import StructureProfile
+from writer import MatrixMarketWriter, MatlabWriter, RbWriter
+from profiler import add_profile_argument, finish_profile, stage, start_profile
+
+METHODS = ["rcm", "degree", "partition"]
+
+
+def adjacency(coo):
+    # orderings work on the symmetric pattern without self loops
+    coo = sparse.coo_matrix(coo)
+    if coo.shape[0] != coo.shape[1]:
+        raise Exception("reordering needs a square matrix, shape: {}".format(coo.shape))
+    off = coo.row != coo.col
+    row = np.concatenate([coo.row[off], coo.col[off]])
+    col = np.concatenate([coo.col[off], coo.row[off]])
+    graph = sparse.csr_matrix(
+        (np.ones(row.size, dtype=np.int8), (row, col)), shape=coo.shape
+    )
+    graph.sum_duplicates()
+    return graph
+
+
+def rcm_order(graph):
+    return csgraph.reverse_cuthill_mckee(graph, symmetric_mode=True).astype(np.int64)
+
+
+def degree_order(graph):
+    # stable, so vertices of equal degree keep their relative order
+    return np.argsort(np.diff(graph.indptr), kind="stable").astype(np.int64)
+
+
+def bfs_order(graph):
+    # one search reaches every component through a virtual root linked to the
+    # lowest degree vertex of each component, a cheap pseudo-peripheral start
+    n = graph.shape[0]
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+    count, labels = csgraph.connected_components(graph, directed=False)
+    degree = np.diff(graph.indptr)
+    order = np.lexsort((degree, labels))
+    starts = order[np.concatenate(([True], labels[order][1:] != labels[order][:-1]))]
+    root = sparse.csr_matrix(
+        (np.ones(count, dtype=np.int8), (np.full(count, n), starts)),
+        shape=(n + 1, n + 1),
+    )
+    rooted = sparse.bmat([[graph, None], [None, sparse.csr_matrix((1, 1))]]).tocsr()
+    rooted = (rooted + root + root.T).tocsr()
+    return csgraph.breadth_first_order(rooted, n, directed=False)[0][1:].astype(
+        np.int64
+    )
+
+
+def partition_order(graph, parts):
+    # recursive bisection of the bfs order, every part is a connected-ish block
+    def split(vertices, parts):
+        sub = graph[vertices][:, vertices]
+        ordered = vertices[bfs_order(sub)]
+        if parts <= 1 or ordered.size < 2:
+            return [ordered]
+        half = ordered.size // 2
+        return split(ordered[:half], parts // 2) + split(
+            ordered[half:], parts - parts // 2
+        )
+
+    return np.concatenate(split(np.arange(graph.shape[0]), parts))
+
+
+def order_matrix(coo, method, parts=16):
+    graph = adjacency(coo)
+    if method == "rcm":
+        return rcm_order(graph)
+    if method == "degree":
+        return degree_order(graph)
+    return partition_order(graph, parts)
+
+
+def permute(coo, permutation):
+    # new row i is old row permutation[i], the same for columns
+    rank = np.empty(permutation.size, dtype=np.int64)
+    rank[permutation] = np.arange(permutation.size)
+    coo = sparse.coo_matrix(coo)
+    return sparse.coo_matrix(
+        (coo.data, (rank[coo.row], rank[coo.col])), shape=coo.shape
+    )
+
+
+def locality(coo, repeat=10):
+    profile = StructureProfile(coo.shape, ["band"])
+    profile.update(coo.row, coo.col, coo.data)
+    size = min(coo.shape)
+    csr = coo.tocsr()
+    x = np.ones(coo.shape[1], dtype=csr.dtype)
+    return {
+        "bandwidth": max(profile.lower_band, profile.upper_band),
+        "profile": int((np.arange(size) - profile.first[:size]).sum()),
+        "spmv seconds": float(np.median(timed(lambda: csr @ x, 2, repeat))),
+    }
+
+
+class ReorderProgram:
+    def __init__(self) -> None:
+        self.__reader_factory = {
+            "mm": MatrixMarketReader(),
+            "mat": MatlabReader(),
+            "rb": RbReader(),
+            "bin": BinaryReader(),
+        }
+        self.__writers = ["mm", "mat", "rb"] + list(LAYOUT_ARRAYS.keys())
+
+    def run(self, parser):
+        parser.add_argument(
+            "--format",
+            help="input sparse matrix format",
+            type=str,
+            required=True,
+            choices=self.__reader_factory.keys(),
+        )
+        parser.add_argument(
+            "--file", help="sparse matrix file", type=str, required=True
+        )
+        parser.add_argument(
+            "--method", help="ordering", type=str, default="rcm", choices=METHODS
+        )
+        parser.add_argument(
+            "--parts", help="parts of the partition ordering", type=int, default=16
+        )
+        parser.add_argument("--output", help="permuted matrix path", type=str)
+        parser.add_argument(
+            "--to",
+            help="permuted matrix format, coo/csr/csc are native binary directories",
+            type=str,
+            default="mm",
+            choices=self.__writers,
+        )
+        parser.add_argument(
+            "--permutation",
+            help="write the permutation, one zero-based old index per line",
+            type=str,
+        )
+        parser.add_argument("--repeat", help="timed spmv runs", type=int, default=10)
+        parser.add_argument(
+            "--workers",
+            help="parallel parsing and mm formatting processes",
+            type=int,
+            default=1,
+        )
+        parser.add_argument(
+            "--no-cache", help="skip the binary parse cache", action="store_true"
+        )
+        add_profile_argument(parser)
+        args = parser.parse_args()
+        if os.path.isfile(args.file) is False and is_binary_matrix(args.file) is False:
+            raise Exception(
+                "sparse matrix file is not exists, matrix file: {}".format(args.file)
+            )
+        if args.output is not None and os.path.exists(args.output):
+            raise Exception("output already exists, output: {}".format(args.output))
+        if args.parts < 1 or args.repeat < 1 or args.workers < 1:
+            raise Exception("parts, repeat and workers must be positive")
+        start_profile(args.profile)
+        reader = self.__reader_factory[args.format]
+        reader.workers = args.workers
+        if not args.no_cache and not is_binary_matrix(args.file):
+            reader = CachedReader(reader, MatrixCache())
+        with stage("read"):
+            coo = sparse.coo_matrix(reader.read(args.file))
+        with stage("locality"):
+            before = locality(coo, args.repeat)
+        with stage("reorder", method=args.method):
+            permutation = order_matrix(coo, args.method, args.parts)
+        with stage("permute"):
+            reordered = permute(coo, permutation)
+        with stage("locality"):
+            after = locality(reordered, args.repeat)
+        self.__print(args.method, before, after)
+        if args.permutation is not None:
+            np.savetxt(args.permutation, permutation, fmt="%d")
+        if args.output is not None:
+            with stage("write", to=args.to):
+                self.__write(args.output, args.to, reordered, args.workers)
+        finish_profile(args.profile)
+
+    def __write(self, output, to, mtx, workers):
+        if to == "mm":
+            # a symmetric permutation keeps a symmetric matrix symmetric
+            MatrixMarketWriter(workers).write(output, mtx, symmetry="detect")
+        elif to == "mat":
+            MatlabWriter().write(
+                output, mtx, os.path.splitext(os.path.basename(output))[0]
+            )
+        elif to == "rb":
+            RbWriter().write(output, mtx)
+        else:
+            save_matrix(output, mtx.asformat(to))
+
+    def __print(self, method, before, after):
+        warnings.filterwarnings("ignore")
+        table = BeautifulTable()
+        table.column_headers = ["", "bandwidth", "profile", "spmv us"]
+        for name, report in [("original", before), (method, after)]:
+            table.append_row(
+                [
+                    name,
+                    report["bandwidth"],
+                    report["profile"],
+                    "{:.1f}".format(report["spmv seconds"] * 1e6),
+                ]
+            )
+        warnings.resetwarnings()
+        print(table)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    ReorderProgram().run(parser)
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+import warnings
+from beautifultable import BeautifulTable
+from util import parse_size, format_size
+
+REPO_DIR = os.environ.get(
+    "SMT_REPO_DIR",
+    os.path.join(
+        os.path.expanduser("~"), ".local", "share", "sparse-matrix-tools", "repository"
+    ),
+)
+REPO_LIMIT = os.environ.get("SMT_REPO_LIMIT", "32G")
+BLOCK_SIZE = 1 << 20
+# download format -> reader format, the order is the preference when a name is
+# stored in several formats
+READ_FORMATS = {"MM": "mm", "RB": "rb", "MAT": "mat"}
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as stream:
+        for block in iter(lambda: stream.read(BLOCK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def shared_mode(mode):
+    # the umask is only read by setting it, a group sharing the repository sets
+    # 002 and its directories and files become group-writable
+    umask = os.umask(0)
+    os.umask(umask)
+    return mode & ~umask
+
+
+def touch(path):
+    # another user's access file is updated through its group write permission,
+    # a use that cannot be recorded only lets the object age
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0o666))
+        except OSError:
+            pass
+    except OSError:
+        pass
+
+
+def tree_bytes(dir_path):
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(dir_path)
+        for name in names
+    )
+
+
+class MatrixRepository:
+    # entries/<id>.<format>.json names a matrix, objects/<sha256>/ holds its file once
+    # however many entries point at it; eviction is least recently opened first by
+    # the mtime of access/<sha256>, a file every user of the repository touches
+    def __init__(self, root=REPO_DIR, limit=REPO_LIMIT) -> None:
+        self.root = root
+        self.limit = parse_size(limit)
+        self.entry_dir = os.path.join(root, "entries")
+        self.object_dir = os.path.join(root, "objects")
+        self.access_dir = os.path.join(root, "access")
+
+    def staging(self):
+        # one directory per run, concurrent downloads never share a .part file
+        tmp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        return tempfile.mkdtemp(prefix="download-", dir=tmp_dir)
+
+    def __entry_path(self, id, format):
+        return os.path.join(self.entry_dir, "{}.{}.json".format(id, format))
+
+    def __access_path(self, digest):
+        return os.path.join(self.access_dir, digest)
+
+    def __used(self, digest):
+        try:
+            return os.stat(self.__access_path(digest)).st_mtime
+        except OSError:
+            return os.stat(os.path.join(self.object_dir, digest)).st_mtime
+
+    def __load(self, entry_path):
+        try:
+            with open(entry_path) as entry:
+                entry = json.load(entry)
+        except Exception:
+            return None
+        entry["path"] = os.path.join(self.object_dir, entry["hash"], entry["file"])
+        # entries of evicted or removed objects are dropped on sight
+        if not os.path.isfile(entry["path"]):
+            try:
+                os.remove(entry_path)
+            except OSError:
+                pass
+            return None
+        return entry
+
+    def find(self, id, format):
+        # a download skipped because the matrix is stored counts as a use
+        entry = self.__load(self.__entry_path(id, format))
+        if entry is not None:
+            touch(self.__access_path(entry["hash"]))
+        return entry
+
+    def lookup(self, name, format=None):
+        # by name or group/name, opening a matrix counts as a use for eviction
+        found = [
+            entry
+            for entry in self.entries()
+            if name in (entry["name"], "{}/{}".format(entry["group"], entry["name"]))
+            and (format is None or entry["format"] == format.upper())
+        ]
+        if len(found) == 0:
+            return None
+        entry = min(found, key=lambda entry: list(READ_FORMATS).index(entry["format"]))
+        touch(self.__access_path(entry["hash"]))
+        return entry
+
+    def add(self, mtx, format, file_path):
+        # the file is moved in, a copy already stored under the same hash wins
+        digest = file_sha256(file_path)
+        object_path = os.path.join(self.object_dir, digest)
+        deduplicated = os.path.isdir(object_path)
+        if not deduplicated:
+            os.makedirs(self.object_dir, exist_ok=True)
+            tmp = tempfile.mkdtemp(prefix=".tmp-", dir=self.object_dir)
+            os.chmod(tmp, shared_mode(0o777))
+            shutil.move(file_path, os.path.join(tmp, os.path.basename(file_path)))
+            try:
+                os.rename(tmp, object_path)
+            except OSError:
+                shutil.rmtree(tmp, ignore_errors=True)
+                deduplicated = True
+        else:
+            os.remove(file_path)
+        touch(self.__access_path(digest))
+        entry = {
+            "id": mtx.id,
+            "group": mtx.group,
+            "name": mtx.name,
+            "format": format,
+            "hash": digest,
+            "file": os.listdir(object_path)[0],
+            "added": time.time(),
+        }
+        os.makedirs(self.entry_dir, exist_ok=True)
+        entry_path = self.__entry_path(mtx.id, format)
+        # a temporary of its own per writer, replaced into place
+        fd, tmp = tempfile.mkstemp(suffix=".tmp", dir=self.entry_dir)
+        os.chmod(tmp, shared_mode(0o666))
+        with os.fdopen(fd, "w") as out:
+            json.dump(entry, out)
+        os.replace(tmp, entry_path)
+        self.evict(keep=[digest])
+        return self.find(mtx.id, format), deduplicated
+
+    def entries(self):
+        entries = []
+        if not os.path.isdir(self.entry_dir):
+            return entries
+        for entry_file in os.scandir(self.entry_dir):
+            if entry_file.name.endswith(".json"):
+                entry = self.__load(entry_file.path)
+                if entry is not None:
+                    entries.append(entry)
+        return entries
+
+    def objects(self):
+        # every stored file with the entries sharing it, most recently used first
+        objects = {}
+        if not os.path.isdir(self.object_dir):
+            return []
+        for entry in self.entries():
+            objects.setdefault(entry["hash"], []).append(entry)
+        for stored in os.scandir(self.object_dir):
+            if stored.is_dir() and not stored.name.startswith(".tmp-"):
+                objects.setdefault(stored.name, [])
+        records = []
+        for digest, entries in objects.items():
+            object_path = os.path.join(self.object_dir, digest)
+            records.append(
+                {
+                    "hash": digest,
+                    "dir": object_path,
+                    "entries": entries,
+                    "size": tree_bytes(object_path),
+                    "used": self.__used(digest),
+                }
+            )
+        return sorted(records, key=lambda record: record["used"], reverse=True)
+
+    def size(self):
+        return sum(record["size"] for record in self.objects())
+
+    def evict(self, limit=None, keep=()):
+        limit = self.limit if limit is None else limit
+        records = self.objects()
+        total = sum(record["size"] for record in records)
+        evicted = []
+        # least recently used objects are at the tail, their entries go with them
+        for record in reversed(records):
+            if total <= limit:
+                break
+            if record["hash"] in keep:
+                continue
+            # an object another user's permissions keep in place still counts
+            if self.__drop(record):
+                total -= record["size"]
+                evicted.append(record)
+        return evicted
+
+    def remove(self, name):
+        removed = []
+        for record in self.objects():
+            if any(
+                name in (entry["name"], "{}/{}".format(entry["group"], entry["name"]))
+                for entry in record["entries"]
+            ) and self.__drop(record):
+                removed.append(record)
+        return removed
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def __drop(self, record):
+        # the entries go once the object is gone, true if it is
+        shutil.rmtree(record["dir"], ignore_errors=True)
+        if os.path.exists(record["dir"]):
+            return False
+        paths = [self.__access_path(record["hash"])] + [
+            self.__entry_path(entry["id"], entry["format"])
+            for entry in record["entries"]
+        ]
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        return True
+
+
+def resolve_matrix(name, format=None):
+    # --name of plot, meta_info and read, the format comes from the stored entry
+    entry = MatrixRepository().lookup(name, format)
+    if entry is None:
+        raise Exception(
+            "matrix is not in the repository, name: {}, repository: {}".format(
+                name, REPO_DIR
+            )
+        )
+    return entry["path"], READ_FORMATS[entry["format"]]
+
+
+def print_objects(records):
+    if len(records) == 0:
+        print()
+        return
+    warnings.filterwarnings("ignore")
+    table = BeautifulTable(maxwidth=160)
+    table.column_headers = ["matrices", "hash", "size", "last used"]
+    for record in records:
+        table.append_row(
+            [
+                " ".join(
+                    "{}/{} ({})".format(entry["group"], entry["name"], entry["format"])
+                    for entry in record["entries"]
+                )
+                or "-",
+                record["hash"][:12],
+                format_size(record["size"]),
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(record["used"])),
+            ]
+        )
+    warnings.resetwarnings()
+    print(table)
+
+
+class RepositoryProgram:
+    def run(self, parser):
+        parser.add_argument(
+            "--dir", help="repository directory", type=str, default=REPO_DIR
+        )
+        subparsers = parser.add_subparsers(dest="command", required=True)
+        subparsers.add_parser("list", help="list stored matrices")
+        subparsers.add_parser("clear", help="remove every stored matrix")
+        trim = subparsers.add_parser("trim", help="evict least recently used matrices")
+        trim.add_argument(
+            "-l", "--limit", help="repository size cap", type=str, default=REPO_LIMIT
+        )
+        remove = subparsers.add_parser("remove", help="remove a matrix")
+        remove.add_argument(
+            "-n", "--name", help="name or group/name", type=str, required=True
+        )
+        args = parser.parse_args()
+        repository = MatrixRepository(args.dir)
+        if args.command == "list":
+            print_objects(repository.objects())
+            print(
+                "total: {}, cap: {}".format(
+                    format_size(repository.size()), format_size(repository.limit)
+                )
+            )
+        elif args.command == "clear":
+            repository.clear()
+        elif args.command == "trim":
+            print_objects(repository.evict(parse_size(args.limit)))
+        elif args.command == "remove":
+            print_objects(repository.remove(args.name))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    RepositoryProgram().run(parser)
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+import os
+import numpy as np
+import scipy.sparse as sparse
+from binary import is_binary_matrix, load_mapped, load_meta
+from reader import (
+    MatrixMarketReader,
+    expand_symmetric,
+    open_mm,
+    parse_mm_entries,
+    read_mm_header,
+)
+from profiler import profiled_chunks
+
+# bytes read after a random offset, it holds the rest of one line and the next one
+LINE_WINDOW = 512
+# offsets drawn at least per round, a round finding no new line ends the sampling
+MIN_DRAWS = 1024
+
+
+class MatrixSample:
+    def __init__(self, coo, sampled, total, method) -> None:
+        self.coo = coo
+        # entries drawn and entries they were drawn from, symmetric files count the
+        # stored triangle when sampled by offsets
+        self.sampled = sampled
+        self.total = total
+        self.method = method
+
+    @property
+    def rate(self):
+        return self.sampled / self.total if self.total > 0 else 1.0
+
+    def __str__(self) -> str:
+        return "sample: {} of {} nonzeros ({:.4%}) by {}".format(
+            self.sampled, self.total, self.rate, self.method
+        )
+
+
+def sample_mm_lines(mtx_path, header, count, rng):
+    # the line after each random byte offset, sorted offsets read the file forward,
+    # a line is a little more likely to be drawn after a long one; offsets landing
+    # on a line already drawn are drawn again until count lines are found, the
+    # surplus of the last round is dropped at random
+    size = os.path.getsize(mtx_path)
+    starts = set()
+    lines = []
+    with open(mtx_path, "rb") as stream:
+        while len(lines) < count:
+            found = len(starts)
+            positions = rng.integers(
+                header.offset - 1,
+                max(size - 1, header.offset),
+                max(count - len(lines), MIN_DRAWS),
+            )
+            for position in np.sort(positions).tolist():
+                stream.seek(position)
+                window = stream.read(LINE_WINDOW)
+                begin = window.find(b"\n") + 1
+                end = window.find(b"\n", begin)
+                if end < 0 and position + len(window) >= size:
+                    end = len(window)
+                if begin == 0 or end < begin or position + begin in starts:
+                    continue
+                starts.add(position + begin)
+                line = window[begin:end]
+                if len(line.strip()) > 0 and not line.startswith(b"%"):
+                    lines.append(line)
+            # a file with fewer lines than its header says runs out of new ones
+            if len(starts) == found:
+                break
+    if len(lines) > count:
+        lines = [lines[i] for i in rng.choice(len(lines), count, replace=False)]
+    return b"\n".join(lines)
+
+
+def sample_offsets(mtx_path, header, count, rng):
+    row, col, data = parse_mm_entries(
+        sample_mm_lines(mtx_path, header, count, rng), header
+    )
+    sampled = row.size
+    row, col, data = expand_symmetric(row, col, data, header.symmetry)
+    coo = sparse.coo_matrix((data, (row, col)), shape=(header.rows, header.cols))
+    return MatrixSample(coo, sampled, header.nnz, "byte offsets")
+
+
+def sample_mapped(mtx_path, count, rng):
+    # binary arrays are mapped, entries at random positions are read directly
+    meta = load_meta(mtx_path)
+    mtx = load_mapped(mtx_path)
+    positions = np.sort(
+        rng.choice(mtx.nnz, min(count, mtx.nnz), replace=False, shuffle=False)
+    )
+    if meta["layout"] == "coo":
+        row, col = mtx.row[positions], mtx.col[positions]
+    else:
+        major = np.searchsorted(mtx.indptr, positions, "right") - 1
+        minor = mtx.indices[positions]
+        row, col = (major, minor) if meta["layout"] == "csr" else (minor, major)
+    coo = sparse.coo_matrix((mtx.data[positions], (row, col)), shape=mtx.shape)
+    return MatrixSample(coo, positions.size, mtx.nnz, "mapped positions")
+
+
+def sample_reservoir(reader, mtx_path, count, rng):
+    # one pass keeping the entries with the smallest random keys, a uniform sample
+    # in memory for count entries and one chunk
+    row, col, data, keys = None, None, None, None
+    total = 0
+    for chunk in profiled_chunks("parse", reader.iter_chunks(mtx_path)):
+        total += chunk[0].size
+        chunk_keys = rng.random(chunk[0].size)
+        if keys is None:
+            row, col, data = [np.asarray(array) for array in chunk]
+            keys = chunk_keys
+        else:
+            row, col, data = [
+                np.concatenate((kept, array))
+                for kept, array in zip((row, col, data), chunk)
+            ]
+            keys = np.concatenate((keys, chunk_keys))
+        if keys.size > count:
+            keep = np.argpartition(keys, count - 1)[:count]
+            row, col, data, keys = row[keep], col[keep], data[keep], keys[keep]
+    shape = reader.read_shape(mtx_path)
+    if keys is None:
+        return MatrixSample(sparse.coo_matrix(shape), 0, 0, "reservoir")
+    coo = sparse.coo_matrix((data, (row, col)), shape=shape)
+    return MatrixSample(coo, row.size, total, "reservoir")
+
+
+def sample_matrix(reader, mtx_path, count, seed=0):
+    # uncompressed .mtx and binary matrices are sampled without reading them whole,
+    # everything else streams once through the reader
+    rng = np.random.default_rng(seed)
+    if is_binary_matrix(mtx_path):
+        return sample_mapped(mtx_path, count, rng)
+    if isinstance(reader, MatrixMarketReader) and not mtx_path.endswith(
+        (".gz", ".bz2")
+    ):
+        with open_mm(mtx_path) as stream:
+            header = read_mm_header(stream)
+        # redrawn offsets find new lines slower as the sample fills the file, from
+        # half of it on one pass through the reader is faster
+        if header.format == "coordinate" and count <= header.nnz // 2:
+            return sample_offsets(mtx_path, header, count, rng)
+    return sample_reservoir(reader, mtx_path, count, rng)
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+import argparse
+import importlib
+import sys
+
+# subcommand -> module, program class and help, the module is imported only when
+# its subcommand runs so a command never pays for another one's dependencies
+COMMANDS = {
+    "plot": ("plot", "PlotProgram", "plot a sparse matrix"),
+    "meta": ("meta_info", "MetaInfoProgram", "sizes, fields and structure statistics"),
+    "read": ("read", "MatrixReadProgram", "browse the arrays of a storage format"),
+    "download": ("download", "DownloadProgram", "search and download sparse.tamu.edu"),
+    "transform": ("transform", "TransformProgram", "convert formats out of core"),
+    "reorder": ("reorder", "ReorderProgram", "bandwidth-reducing orderings"),
+    "compare": ("compare", "CompareProgram", "fingerprint or diff two matrices"),
+    "cache": ("cache", "CacheProgram", "list, trim or clear the parse cache"),
+    "repo": ("repository", "RepositoryProgram", "list, trim or remove stored matrices"),
+    "catalog": ("catalog", "CatalogProgram", "import the sparse.tamu.edu catalog"),
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    parser = argparse.ArgumentParser(prog="smt")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    for command, (_, _, help_msg) in COMMANDS.items():
+        subparsers.add_parser(command, help=help_msg, add_help=False)
+    # only the subcommand is parsed here, its program parses the rest
+    command = parser.parse_args(argv[:1]).command
+    module, program, _ = COMMANDS[command]
+    program = getattr(importlib.import_module(module), program)()
+    # programs parse sys.argv themselves
+    sys.argv = ["smt " + command] + argv[1:]
+    program.run(argparse.ArgumentParser(prog="smt " + command))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+import time
+import numpy as np
+from layout import CompactMatrix, EllMatrix, SellMatrix, BsrMatrix, DiaMatrix
+
+LAYOUTS = {
+    "coo": lambda coo: coo,
+    "csr": lambda coo: coo.tocsr(),
+    "csc": lambda coo: coo.tocsc(),
+    "ell": EllMatrix,
+    "sell": SellMatrix,
+    "bsr": BsrMatrix,
+    "dia": DiaMatrix,
+    "compact": lambda coo: CompactMatrix(coo.tocsr()),
+}
+# numpy gathers compare padding and traffic rather than compiled speed
+BACKENDS = {
+    "coo": "scipy",
+    "csr": "scipy",
+    "csc": "scipy",
+    "ell": "numpy",
+    "sell": "numpy",
+    "bsr": "numpy",
+    "dia": "scipy",
+    "compact": "numpy",
+}
+
+
+def layout_bytes(mtx):
+    if hasattr(mtx, "stored"):
+        return mtx.nbytes
+    names = ["data", "indices", "indptr", "row", "col", "offsets"]
+    return sum(getattr(mtx, name).nbytes for name in names if hasattr(mtx, name))
+
+
+def timed(function, warmup, repeat):
+    for _ in range(warmup):
+        function()
+    seconds = []
+    for _ in range(repeat):
+        begin = time.perf_counter()
+        function()
+        seconds.append(time.perf_counter() - begin)
+    return np.array(seconds)
+
+
+def bench_layout(coo, layout, kernels, warmup=2, repeat=10, seed=0):
+    seconds = timed(lambda: LAYOUTS[layout](coo), 0, max(1, repeat // 5))
+    mtx = LAYOUTS[layout](coo)
+    convert = float(seconds.min())
+    rng = np.random.default_rng(seed)
+    rows, cols = coo.shape
+    nnz = coo.nnz
+    records = []
+    for kernel in kernels:
+        k = 1 if kernel == "spmv" else int(kernel.split(":")[1])
+        x = rng.random(cols) if k == 1 else rng.random((cols, k))
+        itemsize = np.result_type(coo.dtype, x.dtype).itemsize
+        seconds = timed(lambda: mtx @ x, warmup, repeat)
+        median = float(np.median(seconds))
+        # matrix once, x read and y written once per right-hand side
+        traffic = layout_bytes(mtx) + k * (cols + rows) * itemsize
+        records.append(
+            {
+                "layout": layout,
+                "kernel": kernel,
+                "backend": BACKENDS[layout],
+                "rows": rows,
+                "cols": cols,
+                "nnz": nnz,
+                "convert_seconds": convert,
+                "median_seconds": median,
+                "min_seconds": float(seconds.min()),
+                "std_seconds": float(seconds.std()),
+                "gflops": 2.0 * nnz * k / median / 1e9,
+                "bandwidth_gbs": traffic / median / 1e9,
+                "layout_bytes": layout_bytes(mtx),
+            }
+        )
+    return records
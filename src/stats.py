@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+import time
+import numpy as np
+
+STATISTICS = ["rows", "cols", "empty", "band", "diag", "symmetry", "blocks"]
+BLOCK_SIZES = [2, 4, 8, 16]
+
+
+def describe_lengths(lengths):
+    if lengths.size == 0:
+        return "n/a"
+    # power-of-two buckets: 0, 1, 2-3, 4-7, ...
+    buckets = np.zeros(lengths.size, dtype=np.int64)
+    nonzero = lengths > 0
+    buckets[nonzero] = np.floor(np.log2(lengths[nonzero])).astype(np.int64) + 1
+    histogram = np.bincount(buckets)
+    labels = ["0", "1"] + [
+        "{}-{}".format(1 << (b - 1), (1 << b) - 1) for b in range(2, histogram.size)
+    ]
+    return "min {} max {} mean {:.2f} var {:.2f}, histogram {}".format(
+        int(lengths.min()),
+        int(lengths.max()),
+        lengths.mean(),
+        lengths.var(),
+        " ".join(
+            "{}:{}".format(label, count)
+            for label, count in zip(labels, histogram)
+            if count > 0
+        ),
+    )
+
+
+class StructureProfile:
+    # fed chunk by chunk, so a streamed reader and an in-memory coo share one pass
+    def __init__(self, shape, statistics) -> None:
+        self.shape = tuple(shape)
+        self.nnz = 0
+        self.statistics = [name for name in STATISTICS if name in statistics]
+        self.seconds = dict.fromkeys(self.statistics, 0.0)
+        self.row_lengths = np.zeros(self.shape[0], dtype=np.int64)
+        self.col_lengths = np.zeros(self.shape[1], dtype=np.int64)
+        self.lower_band = 0
+        self.upper_band = 0
+        # first column of every row, the diagonal bounds it for the envelope
+        self.first = np.minimum(np.arange(self.shape[0]), max(self.shape[1] - 1, 0))
+        self.diagonal = 0
+        self.keys = []
+        self.values = []
+
+    def __timed(self, name, begin):
+        self.seconds[name] += time.perf_counter() - begin
+
+    def update(self, row, col, data):
+        self.nnz += row.size
+        if "rows" in self.statistics or "empty" in self.statistics:
+            begin = time.perf_counter()
+            self.row_lengths += np.bincount(row, minlength=self.shape[0])
+            self.__timed("rows" if "rows" in self.statistics else "empty", begin)
+        if "cols" in self.statistics or "empty" in self.statistics:
+            begin = time.perf_counter()
+            self.col_lengths += np.bincount(col, minlength=self.shape[1])
+            self.__timed("cols" if "cols" in self.statistics else "empty", begin)
+        if "band" in self.statistics and row.size > 0:
+            begin = time.perf_counter()
+            offset = row.astype(np.int64) - col
+            self.lower_band = max(self.lower_band, int(offset.max()))
+            self.upper_band = max(self.upper_band, int(-offset.min()))
+            np.minimum.at(self.first, row, col)
+            self.__timed("band", begin)
+        if "diag" in self.statistics:
+            begin = time.perf_counter()
+            self.diagonal += int(np.count_nonzero(row == col))
+            self.__timed("diag", begin)
+        if "symmetry" in self.statistics or "blocks" in self.statistics:
+            # symmetry and block fill need the whole pattern, keep only the keys
+            begin = time.perf_counter()
+            self.keys.append(row.astype(np.int64) * self.shape[1] + col)
+            if "symmetry" in self.statistics:
+                self.values.append(np.asarray(data))
+            self.__timed(
+                "symmetry" if "symmetry" in self.statistics else "blocks", begin
+            )
+
+    def finish(self):
+        finishers = {
+            "rows": self.__rows,
+            "cols": self.__cols,
+            "empty": self.__empty,
+            "band": self.__band,
+            "diag": self.__diag,
+            "symmetry": self.__symmetry,
+            "blocks": self.__blocks,
+        }
+        results = []
+        keys = np.concatenate(self.keys) if len(self.keys) > 0 else None
+        for name in self.statistics:
+            begin = time.perf_counter()
+            value = finishers[name](keys)
+            self.__timed(name, begin)
+            results.append((name, value, self.seconds[name]))
+        return results
+
+    def __rows(self, keys):
+        return describe_lengths(self.row_lengths)
+
+    def __cols(self, keys):
+        return describe_lengths(self.col_lengths)
+
+    def __empty(self, keys):
+        return "rows {} cols {}".format(
+            int(np.count_nonzero(self.row_lengths == 0)),
+            int(np.count_nonzero(self.col_lengths == 0)),
+        )
+
+    def __band(self, keys):
+        size = min(self.shape)
+        profile = int((np.arange(size) - self.first[:size]).sum())
+        return "bandwidth {} (lower {} upper {}), profile {}".format(
+            max(self.lower_band, self.upper_band),
+            self.lower_band,
+            self.upper_band,
+            profile,
+        )
+
+    def __diag(self, keys):
+        size = min(self.shape)
+        return "{} of {} ({:.2%})".format(
+            self.diagonal, size, self.diagonal / size if size > 0 else 0
+        )
+
+    def __symmetry(self, keys):
+        if self.shape[0] != self.shape[1]:
+            return "n/a (not square)"
+        if keys is None or keys.size == 0:
+            return "structural 100.00% numerical 100.00%"
+        n = self.shape[1]
+        order = np.argsort(keys)
+        keys = keys[order]
+        values = np.concatenate(self.values)[order]
+        row, col = np.divmod(keys, n)
+        off = row != col
+        if not off.any():
+            return "structural 100.00% numerical 100.00%"
+        mirror = col[off] * n + row[off]
+        # sorted needles keep searchsorted cache friendly on large matrices
+        mirror_order = np.argsort(mirror)
+        pos = np.searchsorted(keys, mirror[mirror_order])
+        pos = np.minimum(pos, keys.size - 1)
+        found = keys[pos] == mirror[mirror_order]
+        equal = found & (values[pos] == values[off][mirror_order])
+        return "structural {:.2%} numerical {:.2%}".format(found.mean(), equal.mean())
+
+    def __blocks(self, keys):
+        if keys is None or keys.size == 0:
+            return "n/a"
+        row, col = np.divmod(keys, self.shape[1])
+        hints = []
+        for size in BLOCK_SIZES:
+            block_cols = (self.shape[1] + size - 1) // size
+            block_keys = np.sort((row // size) * block_cols + col // size)
+            blocks = 1 + int(np.count_nonzero(block_keys[1:] != block_keys[:-1]))
+            hints.append(
+                "{0}x{0} fill {1:.2%}".format(size, keys.size / (blocks * size * size))
+            )
+        return ", ".join(hints)
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+import argparse
+import os
+import shutil
+import tempfile
+import time
+import warnings
+import numpy as np
+from beautifultable import BeautifulTable
+from binary import (
+    LAYOUT_ARRAYS,
+    is_binary_matrix,
+    load_matrix,
+    load_mapped,
+    open_array,
+    save_meta,
+)
+from reader import MatrixMarketReader, MatlabReader, RbReader, BinaryReader
+from profiler import (
+    PROFILER,
+    add_profile_argument,
+    finish_profile,
+    profiled_chunks,
+    stage,
+    start_profile,
+)
+from util import parse_size, format_size
+from writer import MatrixMarketWriter, MatlabWriter, RbWriter
+
+
+def index_dtype(shape, nnz):
+    if max(shape[0], shape[1], nnz) <= np.iinfo(np.int32).max:
+        return np.int32
+    return np.int64
+
+
+def bucket_bounds(indptr, capacity):
+    # consecutive rows (or cols) grouped so every bucket holds about capacity entries
+    majors = indptr.shape[0] - 1
+    nnz = int(indptr[-1])
+    cuts = np.searchsorted(indptr, np.arange(capacity, nnz, capacity), "right") - 1
+    cuts = np.unique(cuts[(cuts > 0) & (cuts < majors)])
+    return np.concatenate(([0], cuts, [majors])).astype(np.int64)
+
+
+class OutOfCoreTransform:
+    def __init__(self, reader, mtx_path, budget, tmp_dir, workers=1) -> None:
+        self.reader = reader
+        self.mtx_path = mtx_path
+        self.budget = budget
+        self.tmp_dir = tmp_dir
+        self.workers = workers
+        # a parsed chunk costs several times its text size while it is converted
+        self.reader.chunk_size = max(1 << 20, budget // 8)
+        self.shape = tuple(reader.read_shape(mtx_path))
+        self.stages = []
+
+    def chunks(self):
+        return profiled_chunks("parse", self.reader.iter_chunks(self.mtx_path))
+
+    def stage(self, name, begin, nnz):
+        self.stages.append((name, time.perf_counter() - begin, nnz))
+        PROFILER.record(name, begin, nnz=nnz)
+
+    def count(self, axis):
+        begin = time.perf_counter()
+        counts = np.zeros(self.shape[axis], dtype=np.int64)
+        value_dtype = None
+        for row, col, data in self.chunks():
+            counts += np.bincount(row if axis == 0 else col, minlength=counts.size)
+            value_dtype = (
+                data.dtype
+                if value_dtype is None
+                else np.result_type(value_dtype, data.dtype)
+            )
+        self.stage("count", begin, int(counts.sum()))
+        return counts, np.dtype(np.float64 if value_dtype is None else value_dtype)
+
+    def write_compressed(self, out_dir, layout):
+        # external distribution sort: spill runs cut by bucket, then sort bucket by bucket
+        axis = 1 if layout == "csc" else 0
+        counts, value_dtype = self.count(axis)
+        nnz = int(counts.sum())
+        idx = index_dtype(self.shape, nnz)
+        indptr = np.zeros(counts.size + 1, dtype=idx)
+        np.cumsum(counts, out=indptr[1:])
+        del counts
+        record = np.dtype([("major", idx), ("minor", idx), ("data", value_dtype)])
+        capacity = max(1, self.budget // (4 * record.itemsize))
+        bounds = bucket_bounds(indptr, capacity)
+        with tempfile.TemporaryDirectory(prefix="smt-", dir=self.tmp_dir) as tmp:
+            spill_path = os.path.join(tmp, "spill.bin")
+            segments = self.__spill(spill_path, axis, bounds, record)
+            self.__merge(out_dir, layout, indptr, bounds, segments, spill_path, record)
+        return nnz
+
+    def __spill(self, spill_path, axis, bounds, record):
+        begin = time.perf_counter()
+        segments = [[] for _ in range(bounds.size - 1)]
+        offset = 0
+        with open(spill_path, "wb") as spill:
+            for row, col, data in self.chunks():
+                major, minor = (row, col) if axis == 0 else (col, row)
+                bucket = np.searchsorted(bounds, major, "right") - 1
+                order = np.argsort(bucket, kind="stable")
+                records = np.empty(order.size, dtype=record)
+                records["major"] = major[order]
+                records["minor"] = minor[order]
+                records["data"] = data[order]
+                records.tofile(spill)
+                sizes = np.bincount(bucket, minlength=len(segments))
+                starts = offset + np.cumsum(sizes) - sizes
+                for b in np.flatnonzero(sizes):
+                    segments[b].append((int(starts[b]), int(sizes[b])))
+                offset += order.size
+        self.stage("spill", begin, offset)
+        return segments
+
+    def __merge(self, out_dir, layout, indptr, bounds, segments, spill_path, record):
+        begin = time.perf_counter()
+        nnz = int(indptr[-1])
+        os.makedirs(out_dir)
+        idx = record["major"]
+        if layout == "coo":
+            major = open_array(out_dir, "row", idx, nnz)
+            minor = open_array(out_dir, "col", idx, nnz)
+        else:
+            major = None
+            minor = open_array(out_dir, "indices", idx, nnz)
+        data = open_array(out_dir, "data", record["data"], nnz)
+        with open(spill_path, "rb") as spill:
+            for b, parts in enumerate(segments):
+                records = []
+                for start, size in parts:
+                    spill.seek(start * record.itemsize)
+                    records.append(np.fromfile(spill, dtype=record, count=size))
+                if len(records) == 0:
+                    continue
+                records = np.concatenate(records)
+                order = np.lexsort((records["minor"], records["major"]))
+                first = int(indptr[bounds[b]])
+                last = int(indptr[bounds[b + 1]])
+                if last - first != order.size:
+                    raise Exception("input changed while it was transformed")
+                minor[first:last] = records["minor"][order]
+                data[first:last] = records["data"][order]
+                if major is not None:
+                    major[first:last] = records["major"][order]
+        for array in [major, minor, data]:
+            if isinstance(array, np.memmap):
+                array.flush()
+        if layout != "coo":
+            np.save(os.path.join(out_dir, "indptr.npy"), indptr)
+        save_meta(out_dir, layout, self.shape, nnz)
+        self.stage("sort+write", begin, nnz)
+
+    def write_mm(self, out_path):
+        # chunks come expanded, a symmetric input is written back as its triangle
+        meta = self.reader.read_meta(self.mtx_path)
+        begin = time.perf_counter()
+        nnz = MatrixMarketWriter(self.workers).write_chunks(
+            out_path, self.shape, self.chunks(), meta.field, meta.symmetry or "general"
+        )
+        self.stage("write mm", begin, nnz)
+        return nnz
+
+    def write_rb(self, out_path):
+        with tempfile.TemporaryDirectory(prefix="smt-", dir=self.tmp_dir) as tmp:
+            csc_dir = os.path.join(tmp, "csc")
+            nnz = self.write_compressed(csc_dir, "csc")
+            begin = time.perf_counter()
+            title = os.path.splitext(os.path.basename(self.mtx_path))[0]
+            RbWriter().write_csc(out_path, load_mapped(csc_dir), title, title[:8])
+            self.stage("write rb", begin, nnz)
+        return nnz
+
+    def write_mat(self, out_path):
+        with tempfile.TemporaryDirectory(prefix="smt-", dir=self.tmp_dir) as tmp:
+            csc_dir = os.path.join(tmp, "csc")
+            nnz = self.write_compressed(csc_dir, "csc")
+            mtx = load_mapped(csc_dir)
+            size = sum(getattr(mtx, name).nbytes for name in LAYOUT_ARRAYS["csc"])
+            if size > self.budget:
+                warnings.warn(
+                    "mat files are written in memory, the matrix exceeds the budget",
+                    RuntimeWarning,
+                )
+            begin = time.perf_counter()
+            MatlabWriter().write(
+                out_path,
+                load_matrix(csc_dir),
+                os.path.splitext(os.path.basename(self.mtx_path))[0],
+            )
+            self.stage("write mat", begin, nnz)
+        return nnz
+
+
+class TransformProgram:
+    def __init__(self) -> None:
+        self.__reader_factory = {
+            "mm": MatrixMarketReader(),
+            "mat": MatlabReader(),
+            "rb": RbReader(),
+            "bin": BinaryReader(),
+        }
+        self.__targets = ["coo", "csr", "csc", "mm", "mat", "rb"]
+        self.__mtx_format = ""
+        self.__mtx_file = ""
+        self.__to = ""
+        self.__output = ""
+        self.__budget = 0
+        self.__tmp_dir = None
+        self.__workers = 1
+        self.__profile = None
+
+    def run(self, parser):
+        self.__parse_args(parser)
+        self.__check_args()
+        start_profile(self.__profile)
+        with stage("transform", to=self.__to):
+            self.__transform()
+        finish_profile(self.__profile)
+
+    def __parse_args(self, parser):
+        parser.add_argument(
+            "--format",
+            help="input sparse matrix format",
+            type=str,
+            required=True,
+            choices=self.__reader_factory.keys(),
+        )
+        parser.add_argument(
+            "--file", help="sparse matrix file", type=str, required=True
+        )
+        parser.add_argument(
+            "--to",
+            help="output format, coo/csr/csc are native binary directories",
+            type=str,
+            required=True,
+            choices=self.__targets,
+        )
+        parser.add_argument("--output", help="output path", type=str, required=True)
+        parser.add_argument(
+            "--memory", help="memory budget, e.g. 512M or 4G", type=str, default="1G"
+        )
+        parser.add_argument(
+            "--tmp", help="directory for spill files", type=str, default=None
+        )
+        parser.add_argument(
+            "--workers",
+            help="parallel formatting processes for mm",
+            type=int,
+            default=1,
+        )
+        add_profile_argument(parser)
+        args = parser.parse_args()
+        self.__mtx_format = args.format
+        self.__mtx_file = args.file
+        self.__to = args.to
+        self.__output = args.output
+        self.__budget = parse_size(args.memory)
+        self.__tmp_dir = args.tmp or os.path.dirname(os.path.abspath(args.output))
+        self.__workers = args.workers
+        self.__profile = args.profile
+
+    def __check_args(self):
+        if (
+            os.path.isfile(self.__mtx_file) is False
+            and is_binary_matrix(self.__mtx_file) is False
+        ):
+            raise Exception(
+                "sparse matrix file is not exists, matrix file: {}".format(
+                    self.__mtx_file
+                )
+            )
+        if os.path.exists(self.__output):
+            raise Exception("output already exists, output: {}".format(self.__output))
+        if self.__budget < (16 << 20):
+            raise Exception(
+                "memory budget is too small, budget: {}".format(
+                    format_size(self.__budget)
+                )
+            )
+        if self.__workers < 1:
+            raise Exception(
+                "workers must be positive, workers: {}".format(self.__workers)
+            )
+
+    def __transform(self):
+        begin = time.perf_counter()
+        engine = OutOfCoreTransform(
+            self.__reader_factory[self.__mtx_format],
+            self.__mtx_file,
+            self.__budget,
+            self.__tmp_dir,
+            self.__workers,
+        )
+        try:
+            if self.__to in LAYOUT_ARRAYS:
+                nnz = engine.write_compressed(self.__output, self.__to)
+            elif self.__to == "mm":
+                nnz = engine.write_mm(self.__output)
+            elif self.__to == "rb":
+                nnz = engine.write_rb(self.__output)
+            else:
+                nnz = engine.write_mat(self.__output)
+        except Exception:
+            if os.path.isdir(self.__output):
+                shutil.rmtree(self.__output, ignore_errors=True)
+            elif os.path.exists(self.__output):
+                os.remove(self.__output)
+            raise
+        self.__print(engine.stages + [("total", time.perf_counter() - begin, nnz)])
+
+    def __print(self, stages):
+        warnings.filterwarnings("ignore")
+        table = BeautifulTable()
+        table.column_headers = ["stage", "seconds", "nnz", "nnz/s"]
+        for name, seconds, nnz in stages:
+            table.append_row(
+                [
+                    name,
+                    "{:.3f}".format(seconds),
+                    nnz,
+                    "{:.3e}".format(nnz / seconds if seconds > 0 else 0),
+                ]
+            )
+        warnings.resetwarnings()
+        print(table)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    TransformProgram().run(parser)
@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+
+UNITS = {"": 1, "K": 1 << 10, "M": 1 << 20, "G": 1 << 30, "T": 1 << 40}
+
+
+def parse_size(size):
+    size = str(size).strip().upper().rstrip("B")
+    unit = size[-1:] if size[-1:] in UNITS else ""
+    try:
+        return int(float(size[: len(size) - len(unit)]) * UNITS[unit])
+    except ValueError:
+        raise Exception("illegal size: {}".format(size))
+
+
+def format_size(size):
+    for unit in ["", "K", "M", "G"]:
+        if size < 1024:
+            return "{:.1f}{}B".format(size, unit)
+        size /= 1024
+    return "{:.1f}TB".format(size)
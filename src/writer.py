@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import scipy.sparse as sparse
+
+# entries formatted per write call
+WRITE_ENTRIES = 1 << 20
+# entries formatted at once, their temporaries stay in cache
+FORMAT_ENTRIES = 1 << 16
+# smallest block handed to a worker, below it pickling costs more than it saves
+PARALLEL_ENTRIES = 1 << 16
+# the header is padded so nnz can be patched in after streaming
+HEADER_WIDTH = 128
+
+
+def mm_field(dtype):
+    kind = np.dtype(dtype).kind
+    if kind == "c":
+        return "complex"
+    if kind in "iub":
+        return "integer"
+    return "real"
+
+
+def mm_symmetry(mtx, field):
+    # the symmetry a square matrix can be stored with, found by comparing it with
+    # its transpose, patterns compare the structure only
+    if mtx.shape[0] != mtx.shape[1] or mtx.nnz == 0:
+        return "general"
+    csr = sparse.csr_matrix(mtx)
+    csr.sum_duplicates()
+    if field == "pattern":
+        csr = sparse.csr_matrix(
+            (np.ones(csr.nnz, dtype=np.int8), csr.indices, csr.indptr), shape=csr.shape
+        )
+    transposed = csr.T.tocsr()
+    if (csr != transposed).nnz == 0:
+        return "symmetric"
+    if field == "complex" and (csr != transposed.conj()).nnz == 0:
+        return "hermitian"
+    # unsigned and boolean values have no negation
+    if csr.dtype.kind in "ifc" and (csr != -transposed).nnz == 0:
+        return "skew-symmetric"
+    return "general"
+
+
+def lower_triangle(row, col, data, symmetry):
+    # symmetric files store the lower triangle, skew-symmetric ones without the
+    # diagonal, a chunk holding both triangles keeps one of each mirrored pair
+    if symmetry == "general":
+        return row, col, data
+    keep = row > col if symmetry == "skew-symmetric" else row >= col
+    return row[keep], col[keep], data[keep]
+
+
+# four ascii digits per uint32, the first 10000 entries hold numbers with zero
+# bytes in place of their leading zeros, a group per lookup quarters the divisions
+DIGIT_GROUPS = np.frombuffer(
+    b"".join(str(i).encode().rjust(4, b"\0") for i in range(10000))
+    + b"".join(b"%04d" % i for i in range(10000)),
+    dtype=np.uint32,
+)
+
+
+def group_digits(magnitude, groups):
+    # non-negative integers as ascii, right aligned in 4 * groups bytes with zero
+    # bytes in place of leading zeros
+    magnitude = np.array(magnitude, dtype=np.int64)
+    digits = np.empty((magnitude.size, 4 * groups), dtype=np.uint8)
+    view = digits.view(np.uint32)
+    for column in range(groups - 1, -1, -1):
+        if column < 2:
+            # eight digits are left, 32 bit division is faster
+            magnitude = magnitude.astype(np.uint32, copy=False)
+        quotient = magnitude // 10000
+        group = DIGIT_GROUPS[
+            magnitude - quotient * 10000 + 10000 * (magnitude >= 10000)
+        ]
+        view[:, column] = group if column == groups - 1 else group * (magnitude > 0)
+        magnitude = quotient
+    return digits
+
+
+def decimal_digits(values):
+    # integers as ascii in one row of bytes each, a leading column holds the sign,
+    # the zero bytes between them are dropped with the rest
+    values = np.asarray(values, dtype=np.int64)
+    width = len(str(int(np.abs(values).max(initial=0))))
+    digits = np.empty((values.size, 1 + -(-width // 4) * 4), dtype=np.uint8)
+    digits[:, 0] = (values < 0) * ord("-")
+    digits[:, 1:] = group_digits(np.abs(values), -(-width // 4))
+    return digits
+
+
+# %.17g round-trips every double in at most 24 characters
+FLOAT_WIDTH = 24
+
+
+def float_digits(values):
+    # one % over the whole block, np.char.mod and repr are slower, padded to the
+    # same width the text reshapes into one row per value; integral values are
+    # exact below 2**53 and take the integer path
+    values = np.asarray(values, dtype=np.float64)
+    with np.errstate(invalid="ignore"):
+        integral = (np.floor(values) == values) & (np.abs(values) < 2**53)
+    digits = np.zeros((values.size, FLOAT_WIDTH), dtype=np.uint8)
+    if integral.any():
+        exact = decimal_digits(values[integral])
+        exact[:, 0] = np.signbit(values[integral]) * ord("-")
+        digits[integral, FLOAT_WIDTH - exact.shape[1] :] = exact
+    rest = ~integral
+    if rest.any():
+        text = ("%{}.17g".format(FLOAT_WIDTH) * int(rest.sum())) % tuple(
+            values[rest].tolist()
+        )
+        text = np.frombuffer(text.encode("ascii"), dtype=np.uint8)
+        text = text.reshape(-1, FLOAT_WIDTH)
+        digits[rest] = np.where(text == ord(" "), 0, text)
+    return digits
+
+
+def format_block(row, col, data, field):
+    # the fields of a block are byte columns next to each other, without their
+    # zero bytes the rows are the lines, so no python loop runs per entry
+    columns = [decimal_digits(row + 1), decimal_digits(col + 1)]
+    if field == "integer":
+        columns.append(decimal_digits(data))
+    elif field == "complex":
+        columns += [float_digits(data.real), float_digits(data.imag)]
+    elif field != "pattern":
+        columns.append(float_digits(data))
+    block = np.empty(
+        (row.size, sum(column.shape[1] + 1 for column in columns)), dtype=np.uint8
+    )
+    begin = 0
+    for column in columns:
+        block[:, begin : begin + column.shape[1]] = column
+        begin += column.shape[1]
+        block[:, begin] = ord(" ")
+        begin += 1
+    block[:, -1] = ord("\n")
+    return block.tobytes().translate(None, b"\0")
+
+
+def format_entries(row, col, data, field):
+    return b"".join(
+        format_block(
+            row[begin : begin + FORMAT_ENTRIES],
+            col[begin : begin + FORMAT_ENTRIES],
+            None if data is None else data[begin : begin + FORMAT_ENTRIES],
+            field,
+        )
+        for begin in range(0, row.size, FORMAT_ENTRIES)
+    )
+
+
+# basic class
+class SparseMatrixWriter:
+    def write(self, mtx_path, mtx):
+        pass
+
+
+class MatrixMarketWriter(SparseMatrixWriter):
+    def __init__(self, workers=1) -> None:
+        self.workers = workers
+
+    def write(self, mtx_path, mtx, field=None, symmetry="general"):
+        # "detect" compares the matrix with its transpose and writes one triangle
+        # of a symmetric one, it costs about a conversion to csr
+        mtx = sparse.coo_matrix(mtx)
+        field = field or mm_field(mtx.dtype)
+        if symmetry == "detect":
+            symmetry = mm_symmetry(mtx, field)
+        return self.write_chunks(
+            mtx_path, mtx.shape, [(mtx.row, mtx.col, mtx.data)], field, symmetry
+        )
+
+    def write_chunks(self, mtx_path, shape, chunks, field=None, symmetry="general"):
+        nnz = 0
+        pool = ProcessPoolExecutor(self.workers) if self.workers > 1 else None
+        try:
+            with open(mtx_path, "wb") as stream:
+                stream.write(b" " * HEADER_WIDTH + b"\n")
+                for row, col, data in chunks:
+                    if field is None:
+                        field = mm_field(data.dtype)
+                    row, col, data = lower_triangle(row, col, data, symmetry)
+                    for text in self.__format(pool, row, col, data, field):
+                        stream.write(text)
+                    nnz += row.size
+                stream.seek(0)
+                # the banner and the size line share the padded slot
+                head = "%%MatrixMarket matrix coordinate {} {}\n{} {} {}".format(
+                    field or "real", symmetry, shape[0], shape[1], nnz
+                )
+                stream.write((head + " " * (HEADER_WIDTH - len(head))).encode("ascii"))
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        return nnz
+
+    def __format(self, pool, row, col, data, field):
+        # the pool formats blocks in order, a few ahead of the one being written so
+        # the text held in memory stays bounded, a chunk is cut into at least one
+        # block per worker
+        step = WRITE_ENTRIES
+        if pool is not None:
+            step = max(PARALLEL_ENTRIES, min(step, -(-row.size // self.workers)))
+        blocks = (
+            (
+                row[begin : begin + step],
+                col[begin : begin + step],
+                None if field == "pattern" else data[begin : begin + step],
+                field,
+            )
+            for begin in range(0, row.size, step)
+        )
+        if pool is None or row.size <= step:
+            for block in blocks:
+                yield format_entries(*block)
+            return
+        pending = deque()
+        for block in blocks:
+            pending.append(pool.submit(format_entries, *block))
+            if len(pending) > 2 * self.workers:
+                yield pending.popleft().result()
+        while len(pending) > 0:
+            yield pending.popleft().result()
+
+
+def fixed_width(values, width, per_line, fmt):
+    # fixed-width Fortran records, full lines are formatted with one % call
+    values = values.tolist()
+    full = len(values) // per_line * per_line
+    line = fmt * per_line + "\n"
+    text = (line * (full // per_line)) % tuple(values[:full])
+    if full < len(values):
+        text += (fmt * (len(values) - full)) % tuple(values[full:]) + "\n"
+    return text
+
+
+def lines(count, per_line):
+    return (count + per_line - 1) // per_line
+
+
+class RbWriter(SparseMatrixWriter):
+    # Rutherford-Boeing, unsymmetric assembled matrix written column by column
+    def write(self, mtx_path, mtx, title="", key=""):
+        if not isinstance(mtx, sparse.csc_matrix):
+            mtx = sparse.csc_matrix(mtx)
+        self.write_csc(mtx_path, mtx, title, key)
+
+    def write_csc(self, mtx_path, csc, title="", key=""):
+        rows, cols = csc.shape
+        nnz = int(csc.indptr[-1])
+        kind = np.dtype(csc.data.dtype).kind
+        mxtype = {"c": "cua", "i": "iua", "u": "iua", "b": "iua"}.get(kind, "rua")
+        ptr_width = len(str(nnz + 1)) + 1
+        ind_width = len(str(rows)) + 1
+        ptr_per_line = 80 // ptr_width
+        ind_per_line = 80 // ind_width
+        if mxtype == "iua":
+            val_width = (
+                max(len(str(int(csc.data.min()))), len(str(int(csc.data.max())))) + 1
+                if nnz > 0
+                else 2
+            )
+            val_per_line = 80 // val_width
+            val_fmt = "%{}d".format(val_width)
+            val_fortran = "({}I{})".format(val_per_line, val_width)
+            values = nnz
+        else:
+            val_width = 26
+            val_per_line = 3
+            val_fmt = "%26.16E"
+            val_fortran = "(3E26.16)"
+            values = nnz * 2 if mxtype == "cua" else nnz
+        ptr_crd = lines(cols + 1, ptr_per_line)
+        ind_crd = lines(nnz, ind_per_line)
+        val_crd = lines(values, val_per_line)
+        with open(mtx_path, "w") as stream:
+            stream.write("{:72.72}{:8.8}\n".format(title, key))
+            stream.write(
+                "{:14d}{:14d}{:14d}{:14d}\n".format(
+                    ptr_crd + ind_crd + val_crd, ptr_crd, ind_crd, val_crd
+                )
+            )
+            stream.write(
+                "{:3}{:11}{:14d}{:14d}{:14d}{:14d}\n".format(
+                    mxtype, "", rows, cols, nnz, 0
+                )
+            )
+            stream.write(
+                "{:16}{:16}{:20}\n".format(
+                    "({}I{})".format(ptr_per_line, ptr_width),
+                    "({}I{})".format(ind_per_line, ind_width),
+                    val_fortran,
+                )
+            )
+            self.__section(
+                stream, csc.indptr, 1, ptr_width, ptr_per_line, "%{}d".format(ptr_width)
+            )
+            self.__section(
+                stream,
+                csc.indices,
+                1,
+                ind_width,
+                ind_per_line,
+                "%{}d".format(ind_width),
+            )
+            if mxtype == "cua":
+                self.__complex(stream, csc.data, val_per_line, val_fmt)
+            else:
+                self.__section(stream, csc.data, 0, val_width, val_per_line, val_fmt)
+
+    def __section(self, stream, array, base, width, per_line, fmt):
+        step = WRITE_ENTRIES // per_line * per_line
+        for begin in range(0, array.shape[0], step):
+            block = np.asarray(array[begin : begin + step])
+            stream.write(
+                fixed_width(block + base if base else block, width, per_line, fmt)
+            )
+
+    def __complex(self, stream, data, per_line, fmt):
+        step = WRITE_ENTRIES // per_line * per_line
+        for begin in range(0, data.shape[0], step):
+            block = np.asarray(data[begin : begin + step])
+            pairs = np.empty(block.size * 2)
+            pairs[0::2] = block.real
+            pairs[1::2] = block.imag
+            stream.write(fixed_width(pairs, 26, per_line, fmt))
+
+
+class MatlabWriter(SparseMatrixWriter):
+    # the same Problem.A layout sparse.tamu.edu uses, so MatlabReader reads it back
+    def write(self, mtx_path, mtx, name=""):
+        import scipy.io as sio
+
+        sio.savemat(
+            mtx_path,
+            {"Problem": {"A": sparse.csc_matrix(mtx), "name": name}},
+            do_compression=True,
+        )